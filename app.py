@@ -1,16 +1,123 @@
+import time
+# Startup is timed from the very first import
+STARTUP_START = time.perf_counter()
+import os
 import dash
-from dash import dcc, html, Output, Input
-import plotly.express as px
-from src.processing import create_master_table, sort_years, sort_word_counts, sort_completion, autocorrect
-from src.data_prep import data_prep_process
+import pandas as pd
+from flask import request, Response
+from dash import dcc, html, Output, Input, State, no_update
+from src.processing import (analyze_tag, autocorrect, find_related_tags, TagNotFoundError, 
+                            analysis_cache, filter_options, filters_key, compare_tags, 
+                            time_series, list_snapshots, word_distribution, result_key,
+                            estimate_works)
+from src.jobs import needs_background, submit_parts, cancel_job, part_state, BACKGROUND_TIMEOUT
+from src.search import search_tags
+from src.cache import ResultCache
+from src.manifest import dataset_ready, tag_stats_stale, dump_stage, EXTRA_DUMPS
+from src.api import api
+from src.metrics import (start_trace, annotate_trace, finish_trace, record_stage, 
+                         record_remainder, timed_stage, time_query, render_metrics, set_gauge)
 
-# Ensure data is ready
-data_prep_process()
+# Optional data preparation stages (see data_prep_process), turned on by setting their
+# environment variables to 1, e.g. AO3_PREP_STREAMING=1 AO3_PREP_COMPACT=1 AO3_PREP_STATS=1
+# AO3_PREP_RELATED=1 AO3_PREP_WORKERS=0 for the fastest dashboard. Without them, the database
+# is built as it always was. AO3_PREP_WORKERS=0 uses one worker process per CPU core
+PREP_OPTIONS = {
+    'streaming': os.environ.get('AO3_PREP_STREAMING', '0') == '1',
+    'compact': os.environ.get('AO3_PREP_COMPACT', '0') == '1',
+    'build_stats': os.environ.get('AO3_PREP_STATS', '0') == '1',
+    'build_columns': os.environ.get('AO3_PREP_COLUMNS', '0') == '1',
+    'build_related': os.environ.get('AO3_PREP_RELATED', '0') == '1',
+    'workers': int(os.environ.get('AO3_PREP_WORKERS', '1')) or os.cpu_count()
+}
+
+# Stages the app needs: the database and its indexes, the optional stages turned on above
+# (the related tags need the columnar store), and any newer dumps added to the database 
+# (AO3_EXTRA_DUMPS)
+REQUIRED_STAGES = (['database', 'indexes', 'tag_search'] 
+                   + ['compact'] * PREP_OPTIONS['compact'] 
+                   + ['tag_stats'] * PREP_OPTIONS['build_stats']
+                   + ['columns'] * (PREP_OPTIONS['build_columns'] or PREP_OPTIONS['build_related'])
+                   + ['related_tags'] * PREP_OPTIONS['build_related']
+                   + [dump_stage(dump_date) for dump_date, _ in EXTRA_DUMPS])
+
+# Ensure data is ready. When the manifest records a finished build of the current database,
+# this is one file read and one stat, and the data preparation code isn't even imported.
+# Changing the word brackets (AO3_WORD_BRACKETS) counts the tag statistics again
+if not dataset_ready(REQUIRED_STAGES) or tag_stats_stale():
+    from src.data_prep import data_prep_process
+    data_prep_process(extra_dumps=EXTRA_DUMPS, **PREP_OPTIONS)
+
+# Cache of finished dashboard outputs (figures and stats) by the searched text and filters
+dashboard_cache = ResultCache(max_entries=64)
+
+# Languages (with their number of works) and creation years the filters can choose from
+FILTER_OPTIONS = filter_options()
+FIRST_YEAR, LAST_YEAR = FILTER_OPTIONS['years']
+
+# Data dumps loaded into the database, as (version, dump_date, number of works), oldest first.
+# The latest one is shown unless another is picked
+SNAPSHOTS = list_snapshots()
+LATEST_SNAPSHOT = SNAPSHOTS[-1][0] if SNAPSHOTS else None
+SNAPSHOT_DATES = {version: f"{dump_date[:4]}-{dump_date[4:6]}-{dump_date[6:]}"
+                  for version, dump_date, _ in SNAPSHOTS}
 
 # Initialize the Dash app
 app = dash.Dash(__name__)
 # Name app
 app.title = "AO3 Tag Data Dive"
+# Flask server running the app, for WSGI servers running several worker processes
+# (e.g. gunicorn --preload --workers 4 app:server, see README)
+server = app.server
+# JSON API (/api/tags/<name>/stats and /api/tags/search?q=)
+server.register_blueprint(api)
+
+# Stages timing each callback and API endpoint, 
+# the rest of a callback request is Dash serializing the response
+HANDLER_STAGES = ['update_tag_search', 'select_tag', 'update_dashboard', 'update_time_graph',
+                  'poll_analysis', 'update_related_tags', 'update_comparison', 'api_stats', 
+                  'api_search']
+
+# How often the page checks on searches computed in the background (see src/jobs.py)
+POLL_MILLISECONDS = 500
+
+# Rolling averages the time series graph can show, in periods (years, months, or weeks)
+ROLLING_WINDOWS = [3, 4, 6, 12]
+
+# Axis titles of the time series graph, by granularity
+TIME_TITLES = {'year': "Year", 'month': "Month", 'week': "Week"}
+
+# Most tags that can be compared at once
+MAX_COMPARE_TAGS = 20
+
+@server.before_request
+def start_request_trace() -> None:
+    """
+    Starts timing each callback and API request's stages and queries.
+    """
+    if request.path.endswith('/_dash-update-component') or request.path.startswith('/api/'):
+        # API requests are labelled by their route, so each tag doesn't get its own label
+        start_trace(path=request.url_rule.rule if request.url_rule else request.path)
+    return None
+
+@server.after_request
+def finish_request_trace(response: Response) -> Response:
+    """
+    Records the serialization time and total time of each callback and API request,
+    logging it if it was slow.
+    """
+    record_remainder('serialize', HANDLER_STAGES)
+    finish_trace()
+    return response
+
+@server.route('/metrics')
+def metrics() -> Response:
+    """
+    Serves the stage, query, and request latency histograms and the cache counters 
+    of this process in the Prometheus text format.
+    """
+    text = render_metrics({'analysis': analysis_cache, 'dashboard': dashboard_cache})
+    return Response(text, mimetype='text/plain; version=0.0.4')
 
 # Layout
 app.layout = html.Div([
@@ -28,107 +135,413 @@ app.layout = html.Div([
     html.Div([
         dcc.Input(id="tag-input", 
                   type="text", 
-                  placeholder="Enter Tag (Any Character, Fandom, Trope, etc.)", 
+                  placeholder="Enter Tag (Any Character, Fandom, Trope, etc.), combine tags with AND / OR / NOT", 
                   debounce=True,
                   style={
                       'width': '30%'
                   }),
         # Create "Analyze" button
-        html.Button("Analyze", id="analyze-button", n_clicks=0)
+        html.Button("Analyze", id="analyze-button", n_clicks=0),
+        # Tag search suggests tags as the user types, picking one fills in the tag input
+        dcc.Dropdown(id="tag-search",
+                     placeholder="Search tags...",
+                     searchable=True,
+                     clearable=True,
+                     style={
+                         'width': '30%',
+                         'fontFamily': 'Arial, sans-serif'
+                     })
     ]),
+    # Filters narrowing the works counted in the graphs, which update as soon as they change
+    html.Div([
+        dcc.Dropdown(id="language-filter",
+                     options=[{"label": f"{code} ({count:,} works)", "value": code}
+                              for code, count in FILTER_OPTIONS['languages']],
+                     placeholder="All languages",
+                     multi=True,
+                     style={'width': '300px'}),
+        dcc.RadioItems(id="restricted-filter",
+                       options=[{"label": "All works", "value": "all"},
+                                {"label": "Public only", "value": "public"},
+                                {"label": "Restricted only", "value": "restricted"}],
+                       value="all",
+                       inline=True),
+        dcc.RadioItems(id="completion-filter",
+                       options=[{"label": "All works", "value": "all"},
+                                {"label": "Complete only", "value": "complete"},
+                                {"label": "Incomplete only", "value": "incomplete"}],
+                       value="all",
+                       inline=True),
+        html.Div(dcc.RangeSlider(id="year-filter",
+                                 min=FIRST_YEAR,
+                                 max=LAST_YEAR,
+                                 step=1,
+                                 value=[FIRST_YEAR, LAST_YEAR],
+                                 marks={year: str(year) for year in range(FIRST_YEAR, LAST_YEAR + 1, 2)}),
+                 style={'width': '500px'}),
+        # Which data dump to count the works of (only shown once newer dumps have been added)
+        dcc.Dropdown(id="snapshot-filter",
+                     options=[{"label": f"{SNAPSHOT_DATES[version]} dump ({works:,} works)",
+                               "value": version}
+                              for version, _, works in SNAPSHOTS],
+                     value=LATEST_SNAPSHOT,
+                     clearable=False,
+                     style={'width': '260px', 
+                            'display': 'block' if len(SNAPSHOTS) > 1 else 'none'})
+    ], style={'display': 'flex', 'flexWrap': 'wrap', 'gap': '20px', 'alignItems': 'center',
+              'padding': '10px', 'fontFamily': 'Arial, sans-serif'}),
     # Output message gives user feedback
     html.Div(id="output-message", style={"fontFamily": "Arial, sans-serif"}),
-    # Work by Year graph and stats
+    # Works over time graph, by year, month, or week, and stats
     html.Div([
+        html.Div([
+            dcc.RadioItems(id="time-granularity",
+                           options=[{"label": "By year", "value": "year"},
+                                    {"label": "By month", "value": "month"},
+                                    {"label": "By week", "value": "week"}],
+                           value="year",
+                           inline=True),
+            dcc.Dropdown(id="rolling-window",
+                         options=[{"label": "No rolling average", "value": 1}] +
+                                 [{"label": f"{window}-period rolling average", "value": window}
+                                  for window in ROLLING_WINDOWS],
+                         value=1,
+                         clearable=False,
+                         style={'width': '250px'})
+        ], style={'display': 'flex', 'gap': '20px', 'alignItems': 'center', 'padding': '10px',
+                  'fontFamily': 'Arial, sans-serif'}),
         dcc.Graph(id="year-graph"),
         html.Div(id="year-stats", style={"padding": "10px"})
     ]),
     # Work by Wordcount graph and stats
     html.Div([
         dcc.Graph(id="wordcount-graph"),
+        dcc.Graph(id="wordcount-histogram"),
         html.Div(id="wordcount-stats", style={"padding": "10px"})
     ]),
     # Work by Completion graph and stats
     html.Div([
         dcc.Graph(id="completion-graph"),
         html.Div(id="completion-stats", style={"padding": "10px"})
-    ])
+    ]),
+    # Tags most often used together with the searched tag
+    html.Div(id="related-tags", style={"fontFamily": "Arial, sans-serif", "padding": "10px"}),
+    # Comparison of several tags, using the same filters
+    html.Div([
+        html.H2("Compare Tags"),
+        dcc.Input(id="compare-input",
+                  type="text",
+                  placeholder=f"Enter up to {MAX_COMPARE_TAGS} tags separated by commas",
+                  debounce=True,
+                  style={
+                      'width': '60%'
+                  }),
+        # Create "Compare" button
+        html.Button("Compare", id="compare-button", n_clicks=0),
+        html.Div(id="compare-message")
+    ], style={"fontFamily": "Arial, sans-serif", "padding": "10px"}),
+    dcc.Graph(id="compare-year-graph"),
+    dcc.Graph(id="compare-wordcount-graph"),
+    dcc.Graph(id="compare-completion-graph"),
+    html.Div(id="compare-stats", style={"fontFamily": "Arial, sans-serif", "padding": "10px"}),
+    # Parts of the search (and of the works over time graph) still computed in the background,
+    # and the timer checking on them while there are any
+    dcc.Store(id="analysis-job"),
+    dcc.Store(id="time-job"),
+    dcc.Interval(id="analysis-poll", interval=POLL_MILLISECONDS, disabled=True)
 ])
 
-# Callback
+# Headings of the related tags panel's columns, by tag type
+RELATED_HEADINGS = {'Fandom': "Fandoms", 'Relationship': "Relationships", 
+                    'Character': "Characters", 'Freeform': "Tropes & Other Tags"}
+
+# Tag search callbacks
 @app.callback(
-    Output("output-message", "children"),
-    Output("year-graph", "figure"),
-    Output("year-stats", "children"),
-    Output("wordcount-graph", "figure"),
-    Output("wordcount-stats", "children"),
-    Output("completion-graph", "figure"),
-    Output("completion-stats", "children"),
+    Output("tag-search", "options"),
+    Input("tag-search", "search_value")
+)
+@timed_stage('update_tag_search')
+def update_tag_search(search_value) -> list:
+    """
+    Suggests the most used tags matching what the user has typed into the tag search so far.
+    
+    Parameters:
+        search_value (str): Text typed into the tag search.
+    
+    Returns:
+        options (list): Dropdown options for the matching tags, labelled with their work counts.
+    """
+    # Keep the current options (and selected tag) while the search box is empty
+    if not search_value:
+        return no_update
+    annotate_trace(search=search_value)
+    with time_query('search_tags'):
+        matches = search_tags(search_value)
+    # "search" is set to the typed text so matches found despite typos aren't filtered out
+    return [{"label": f"{name} ({count:,} works)", "value": name, "search": search_value}
+            for name, count in matches]
+
+@app.callback(
+    Output("tag-input", "value"),
+    Input("tag-search", "value"),
+    prevent_initial_call=True
+)
+@timed_stage('select_tag')
+def select_tag(tagname) -> str:
+    """
+    Fills in the tag input with the tag picked from the tag search, which starts the analysis.
+    
+    Parameters:
+        tagname (str): Tag picked from the tag search.
+    
+    Returns:
+        tagname (str): Tag to put into the tag input.
+    """
+    return tagname if tagname else no_update
+
+# Related tags callback
+@app.callback(
+    Output("related-tags", "children"),
     Input("analyze-button", "n_clicks"),
     Input("tag-input", "value")
 )
-
-def update_dashboard(n_clicks, tagname) -> tuple:
+@timed_stage('update_related_tags')
+def update_related_tags(n_clicks, tagname):
     """
-    Updates the dashboard with results based on the given tagname.
-    Retrieves the works associated with the specified tagname.
-    If the tagname is invalid, offers suggestions for potential matching tags.
-    If tag works, generate the year, word count, and completion graphs and statistics.
+    Shows the fandoms, relationships, characters, and other tags used most often together
+    with the searched tag, with how many works they share and their lift (how many times 
+    more often they are used together than if the tags were unrelated).
     
     Parameters:
         n_clicks (int): The number of times the analyze button has been clicked.
-                        Even though it isn't used, it causes the function to run 
-                        only after the user clicks the button. 
-        tagname (str): The tag to search for in the database.
+        tagname (str): The searched tag.
+    
+    Returns:
+        A Div containing a list of related tags for each tag type, or nothing if
+        there are no related tags to show (e.g. for a tag query or an unknown tag).
+    """
+    if not tagname:
+        return ""
+    annotate_trace(tag=tagname)
+    try:
+        related = find_related_tags(tagname)
+    # update_dashboard already tells the user when a tag is not found
+    except (TagNotFoundError, ValueError):
+        return ""
+    if related is None or related.empty:
+        return ""
+    columns = []
+    for tag_type, heading in RELATED_HEADINGS.items():
+        rows = related[related['related_type'] == tag_type]
+        if rows.empty:
+            continue
+        columns.append(html.Div([
+            html.H3(heading),
+            html.Ul([html.Li(f"{row.name} ({row.num_works:,} works, {row.lift:,.1f}x)")
+                     for row in rows.itertuples()])
+        ], style={"flex": "1", "minWidth": "200px"}))
+    return html.Div([
+        html.H2(f"Tags Often Used With '{tagname}'"),
+        html.Div(columns, style={"display": "flex", "flexWrap": "wrap", "gap": "20px"})
+    ])
+
+def make_filters(languages, restricted, completion, years, snapshot=None) -> dict:
+    """
+    Turns the filter controls' values into the filters taken by analyze_tag.
+    
+    Parameters:
+        languages (list): Language codes picked (none means all languages).
+        restricted (str): "all", "public", or "restricted".
+        completion (str): "all", "complete", or "incomplete".
+        years (list): First and last year picked on the slider.
+        snapshot (int): Version of the data dump picked (see list_snapshots).
+    
+    Returns:
+        filters (dict): Filters that narrow the works (empty if every work is counted).
+    """
+    filters = {}
+    if languages:
+        filters['languages'] = languages
+    if restricted in ("public", "restricted"):
+        filters['restricted'] = restricted == "restricted"
+    if completion in ("complete", "incomplete"):
+        filters['complete'] = completion == "complete"
+    # The full range of years doesn't leave out any work
+    if years and list(years) != [FIRST_YEAR, LAST_YEAR]:
+        filters['years'] = list(years)
+    # The latest dump is what's counted without a snapshot
+    if snapshot is not None and snapshot != LATEST_SNAPSHOT:
+        filters['snapshot'] = snapshot
+    return filters
+
+def describe_filters(filters: dict) -> str:
+    """
+    Describes the filters for the output message, 
+    e.g. " (en, complete works, 2015-2020, 2021-02-26 dump)".
+    """
+    parts = []
+    if 'languages' in filters:
+        parts.append(', '.join(filters['languages']))
+    if 'restricted' in filters:
+        parts.append("restricted works" if filters['restricted'] else "public works")
+    if 'complete' in filters:
+        parts.append("complete works" if filters['complete'] else "incomplete works")
+    if 'years' in filters:
+        first, last = filters['years']
+        parts.append(str(first) if first == last else f"{first}-{last}")
+    if 'snapshot' in filters:
+        parts.append(f"{SNAPSHOT_DATES.get(filters['snapshot'], filters['snapshot'])} dump")
+    return f" ({', '.join(parts)})" if parts else ""
 
+def time_figure(tagname: str, series: pd.DataFrame, granularity: str = "year", window: int = 1):
+    """
+    Draws the works over time graph from a tag's time series (see time_series).
+    
+    Parameters:
+        tagname (str): The searched tag, or tag query.
+        series (DataFrame): Number of works per period.
+        granularity (str): "year", "month", or "week".
+        window (int): Number of periods averaged by the rolling average (1 for none).
+    
+    Returns:
+        A Plotly figure of works over time, or an empty figure if there are no works.
+    """
+    if series.empty:
+        return {}
+    figures_start = time.perf_counter()
+    # Imported on first use, so starting a worker doesn't wait for Plotly Express
+    import plotly.express as px
+
+    title = TIME_TITLES.get(granularity, "Year")
+    # Create bar chart showing works per period
+    year_fig = px.bar(series, 
+                      x="period", 
+                      y="num_works",
+                      title=f"Works Containing '{tagname}' Tag by {title}", 
+                      color_discrete_sequence=['maroon'])
+    # Rolling average of the last few periods, drawn over the bars
+    if window and window > 1:
+        average = series['num_works'].rolling(window, min_periods=1).mean()
+        year_fig.add_scatter(x=series['period'], y=average, mode="lines", 
+                             name=f"{window}-{granularity} average", line_color="black")
+    # Fix x and y axis titles, ensure font remains the consistent for the graph
+    year_fig.update_layout(  
+        title_font = dict(family="Arial, sans-serif", size = 24, color = "black"),
+        font = dict(family = "Arial, sans-serif", size = 14),
+        xaxis_title = title,
+        yaxis_title = "Number of Works",
+        xaxis_title_font = dict(family = "Arial, sans-serif", size = 16),
+        yaxis_title_font = dict(family = "Arial, sans-serif", size = 16),
+        bargap = 0.1 if granularity == "year" else 0
+    )
+    record_stage('figures', time.perf_counter() - figures_start)
+    return year_fig
+
+# Works over time callback
+@app.callback(
+    Output("year-graph", "figure"),
+    Output("time-job", "data"),
+    Input("analyze-button", "n_clicks"),
+    Input("tag-input", "value"),
+    Input("language-filter", "value"),
+    Input("restricted-filter", "value"),
+    Input("completion-filter", "value"),
+    Input("year-filter", "value"),
+    Input("snapshot-filter", "value"),
+    Input("time-granularity", "value"),
+    Input("rolling-window", "value"),
+    State("time-job", "data")
+)
+@timed_stage('update_time_graph')
+def update_time_graph(n_clicks, tagname, languages=None, restricted="all", completion="all",
+                      years=None, snapshot=None, granularity="year", window=1, 
+                      previous_job=None) -> tuple:
+    """
+    Draws the number of works containing the searched tag per year, month, or week,
+    with an optional rolling average over the last few periods to smooth out spikes.
+    Changing the granularity or the rolling average only redraws this graph.
+    For tags with many works, the time series is computed in the background and
+    poll_analysis draws the graph once it is ready.
+    
+    Parameters:
+        n_clicks (int): The number of times the analyze button has been clicked.
+        tagname (str): The searched tag, or tag query.
+        languages, restricted, completion, years, snapshot: Values of the filter controls 
+                                                            (see make_filters).
+        granularity (str): "year", "month", or "week".
+        window (int): Number of periods averaged by the rolling average (1 for none).
+        previous_job (dict): Time series still computed in the background for the
+                             previous search, cancelled unless it is still needed.
+    
     Returns:
         Tuple:
-            - A string message indicating the result of the analysis or an error message.
-            - A Plotly figure for the year graph.
-            - A Div containing the year statistics.
-            - A Plotly figure for the word count graph.
-            - A Div containing the word count statistics.
-            - A Plotly figure for the completion graph.
-            - A Div containing the completion statistics.
+            - A Plotly figure of works over time, or an empty figure if there is nothing 
+              to show (update_dashboard tells the user why) or it isn't ready yet.
+            - The time series computed in the background, or None.
     """
-    # If tagname has not been inputed, prompt user for tagname and return empty figures
     if not tagname:
-        return "Please enter a tag name.", {}, "", {}, "", {}, ""
-
+        cancel_superseded(previous_job)
+        return {}, None
+    filters = make_filters(languages, restricted, completion, years, snapshot)
+    annotate_trace(tag=tagname, filters=filters_key(filters), granularity=granularity)
+    part = f"time:{granularity}"
     try:
-        try:
-            # Get selected works containing tag
-            master_table = create_master_table(tagname)
-        # If tag is not found:
-        except ValueError as no_tag_found:
-            # Find list of potential similar tags
-            options = list(autocorrect(tagname))
-            if not options:
-                # If there are no similar tags, return this error message
-                return f"{str(no_tag_found)} No potential matching tags found, sorry!", {}, "", {}, "", {}, ""
-            # If there are similar tags, return error message containing possible options
-            return f"{str(no_tag_found)} Could you mean one of these options instead? {options}", {}, "", {}, "", {}, ""
+        if needs_background(tagname, filters, [part]):
+            job = start_job(tagname, filters, [part], previous_job)
+            if job['pending']:
+                return {}, job
+            # The part finished before start_job checked on it, so nothing is left to poll for
+            series = analysis_cache.peek(result_key(tagname, filters, part))
+            return time_figure(tagname, series, granularity, window), None
+        cancel_superseded(previous_job)
+        series = time_series(tagname, granularity, filters)
+        return time_figure(tagname, series, granularity, window), None
+    # update_dashboard tells the user what went wrong, so the graph is just left empty
+    except Exception:
+        return {}, None
+
+def dashboard_outputs(tagname: str, filters: dict, analysis: dict = None, 
+                      distribution: dict = None, estimate: int = None) -> tuple:
+    """
+    Builds the dashboard's message, figures, and statistics from a tag's analysis 
+    (see analyze_tag) and word count distribution (see word_distribution).
+    While a search is computed in the background, either may not be ready yet: 
+    its figures are left empty and the statistics show the estimated number of works.
+    
+    Parameters:
+        tagname (str): The searched tag, or tag query.
+        filters (dict): Filters the works were counted with (see make_filters).
+        analysis (dict): Year, word count, and completion counts, or None if not ready.
+        distribution (dict): Word count histogram and percentiles, or None if not ready.
+        estimate (int): Estimated number of works shown until the analysis is ready.
+    
+    Returns:
+        Tuple of the seven outputs of update_dashboard.
+    """
+    # If the tag exists but no works use it, there is nothing to graph
+    if analysis is not None and analysis["total_works"] == 0:
+        return f"No works found for '{tagname}'{describe_filters(filters)}.", "", {}, {}, "", {}, ""
+    figures_start = time.perf_counter()
+    # Imported on first use, so starting a worker doesn't wait for Plotly Express
+    import plotly.express as px
 
-        # Year graph
+    if analysis is None or distribution is None:
+        message = (f"Counting works for '{tagname}'{describe_filters(filters)} "
+                   f"(about {estimate or 0:,} works), the graphs appear as they are ready...")
+    else:
+        message = f"Showing results for '{tagname}'{describe_filters(filters)}"
+    year_stats, wordcount_fig, completion_fig, completion_stats = "", {}, {}, ""
+    wordcount_lines = []
+    if analysis is None:
+        year_stats = html.Div([
+            html.P(f"Total Works: about {estimate or 0:,} (counting...)")
+        ], style = {"fontFamily": "Arial, sans-serif", "fontSize": "16px", "padding": "10px"})
+    else:
+        # Year statistics
         # Get table of years and num_works
-        years_table = sort_years()
-        # Create bar chart showing works per year
-        year_fig = px.bar(years_table, 
-                          x="creation_year", 
-                          y="num_works",
-                          title=f"Works Containing '{tagname}' Tag by Year", 
-                          color_discrete_sequence=['maroon'])
-        # Fix x and y axis titles, ensure font remains the consistent for the graph
-        year_fig.update_layout(  
-            title_font = dict(family="Arial, sans-serif", size = 24, color = "black"),
-            font = dict(family = "Arial, sans-serif", size = 14),
-            xaxis_title = "Year",
-            yaxis_title = "Number of Works",
-            xaxis_title_font = dict(family = "Arial, sans-serif", size = 16),
-            yaxis_title_font = dict(family = "Arial, sans-serif", size = 16)
-        )
+        years_table = analysis["years"]
         # Get total number of works
-        count = sum(years_table['num_works'])
+        count = analysis["total_works"]
         # Find year with most works
         maximum = years_table[years_table['num_works'] == years_table['num_works'].max()]
         # Find year with least works
@@ -142,7 +555,7 @@ def update_dashboard(n_clicks, tagname) -> tuple:
 
         # Word count graph
         # Get table of word count ranges and num_works
-        word_count = sort_word_counts()
+        word_count = analysis["word_counts"]
         # Create bar chart showing works per word count range
         wordcount_fig = px.bar(word_count, 
                         x = "word_bracket", 
@@ -160,21 +573,21 @@ def update_dashboard(n_clicks, tagname) -> tuple:
             yaxis_title_font = dict(family = "Arial, sans-serif", size = 16)
         )
         # Get total word count
-        total = int(master_table['word_count'].sum())
+        total = analysis["total_words"]
         # Get word count of the work with the highest word count
-        maximum = master_table[master_table['word_count'] == master_table['word_count'].max()]
+        maximum = analysis["max_words"]
         # Get average word count
-        average = f"{total/len(master_table):,.1f}"
+        average = f"{analysis['average_words']:,.1f}"
         # Create word count statistics
-        wordcount_stats = html.Div([
+        wordcount_lines = [
             html.P(f"Total Word Count: {total:,} Words"),
-            html.P(f"Highest Word Count: {int(maximum['word_count'].iloc[0]):,} Words"),
+            html.P(f"Highest Word Count: {maximum:,} Words"),
             html.P(f"Average Word Count per Work: {average} Words")
-        ], style = {"fontFamily": "Arial, sans-serif", "fontSize": "16px", "padding": "10px"})
+        ]
 
         # Completion graph
         # Get table of completion status and num_works
-        completion = sort_completion()
+        completion = analysis["completion"]
         # Create pie chart of works per completion status
         completion_fig = px.pie(completion,
                         names="complete",  
@@ -190,21 +603,447 @@ def update_dashboard(n_clicks, tagname) -> tuple:
             font = dict(family = "Arial, sans-serif", size = 14)
         )
         # Get number of completed works
-        complete = int(master_table['complete'].sum())
+        complete = analysis["complete_works"]
         # Get number of incomplete works
-        incomplete = len(master_table) - complete
+        incomplete = analysis["incomplete_works"]
         # Create statistics for completion status
         completion_stats = html.Div([
             html.P(f"Number of Complete Works: {complete:,} Works"),
             html.P(f"Number of Incomplete Works: {incomplete:,} Works")
         ], style = {"fontFamily": "Arial, sans-serif", "fontSize": "16px", "padding": "10px"})
-        # Return the results to display on the dashboard
-        return f"Showing results for '{tagname}'", year_fig, year_stats, wordcount_fig, wordcount_stats, completion_fig, completion_stats
+
+    histogram_fig = {}
+    if distribution is not None:
+        # Word count histogram
+        # Get table of fine word count bins and num_works
+        histogram = distribution["histogram"]
+        # Bins are evenly spaced on a log scale, so equal-width bars show a log-scale histogram
+        histogram_fig = px.bar(histogram,
+                        x = "label",
+                        y = "num_works",
+                        title = f"Word Count Distribution of '{tagname}'",
+                        color_discrete_sequence = ['maroon']
+        )
+        # Ensure font remains consistent, fix x and y axis titles
+        histogram_fig.update_layout(
+            title_font = dict(family="Arial, sans-serif", size = 24, color = "black"),
+            font = dict(family = "Arial, sans-serif", size = 14),
+            xaxis_title = "Word Count (log scale, from)",
+            # Labels such as "18" would otherwise be read as numbers
+            xaxis_type = "category",
+            yaxis_title = "Number of Works",
+            xaxis_title_font = dict(family = "Arial, sans-serif", size = 16),
+            yaxis_title_font = dict(family = "Arial, sans-serif", size = 16),
+            bargap = 0
+        )
+        wordcount_lines += [
+            html.P(f"Median Word Count: about {distribution['median_words']:,.0f} Words"),
+            html.P(f"90th / 99th Percentile Word Count: about {distribution['p90_words']:,.0f} / "
+                   f"{distribution['p99_words']:,.0f} Words")
+        ]
+    wordcount_stats = ""
+    if wordcount_lines:
+        wordcount_stats = html.Div(wordcount_lines, style = {"fontFamily": "Arial, sans-serif", 
+                                                             "fontSize": "16px", "padding": "10px"})
+    record_stage('figures', time.perf_counter() - figures_start)
+    return message, year_stats, wordcount_fig, histogram_fig, wordcount_stats, completion_fig, completion_stats
+
+def start_job(tagname: str, filters: dict, parts: list, previous_job: dict = None) -> dict:
+    """
+    Starts computing parts of a search in the background (see submit_parts) as a new job,
+    then cancels the previous search's job. Parts both searches need are kept, as the new
+    job is already waiting for them.
+    
+    Parameters:
+        tagname (str): The searched tag, or tag query.
+        filters (dict): Filters on the works (see make_filters).
+        parts (list): Parts of the results (see result_key).
+        previous_job (dict): Job of the previous search, if it was computed in the background.
+    
+    Returns:
+        job (dict): The searched tag, its filters, the job ID (unique to this search), 
+                    the estimated number of works, and the parts poll_analysis is still
+                    waiting for.
+    """
+    job_id = submit_parts(tagname, filters, parts)
+    job = {'id': job_id, 'tagname': tagname, 'filters': filters, 
+           'estimate': estimate_works(tagname),
+           'pending': [part for part in parts 
+                       if analysis_cache.peek(result_key(tagname, filters, part)) is None]}
+    cancel_superseded(previous_job)
+    return job
+
+def cancel_superseded(previous_job: dict) -> None:
+    """
+    Stops waiting for the parts of the previous search still computed in the background.
+    Parts no other search (of this user or another) is waiting for are cancelled.
+    
+    Parameters:
+        previous_job (dict): Job of the previous search (see start_job), or None.
+    
+    Returns:
+        None
+    """
+    if not previous_job or not previous_job.get('pending'):
+        return None
+    cancel_job(previous_job['id'], previous_job['tagname'], previous_job['filters'], 
+               previous_job['pending'])
+    return None
+
+# Callback
+@app.callback(
+    Output("output-message", "children"),
+    Output("year-stats", "children"),
+    Output("wordcount-graph", "figure"),
+    Output("wordcount-histogram", "figure"),
+    Output("wordcount-stats", "children"),
+    Output("completion-graph", "figure"),
+    Output("completion-stats", "children"),
+    Output("analysis-job", "data"),
+    Input("analyze-button", "n_clicks"),
+    Input("tag-input", "value"),
+    Input("language-filter", "value"),
+    Input("restricted-filter", "value"),
+    Input("completion-filter", "value"),
+    Input("year-filter", "value"),
+    Input("snapshot-filter", "value"),
+    State("analysis-job", "data")
+)
+@timed_stage('update_dashboard')
+def update_dashboard(n_clicks, tagname, languages=None, restricted="all", completion="all", 
+                     years=None, snapshot=None, previous_job=None) -> tuple:
+    """
+    Updates the dashboard with results based on the given tagname.
+    Retrieves the works associated with the specified tagname (or tag query).
+    If the tagname is invalid, offers suggestions for potential matching tags.
+    If tag works, generate the word count and completion graphs, the word count histogram,
+    and the statistics (the works over time graph is drawn by update_time_graph).
+    Tags with at least BACKGROUND_MIN_WORKS works are counted in the background: 
+    the estimated number of works is shown right away, and poll_analysis fills in 
+    the graphs as they are ready.
+    
+    Parameters:
+        n_clicks (int): The number of times the analyze button has been clicked.
+                        Even though it isn't used, it causes the function to run 
+                        only after the user clicks the button. 
+        tagname (str): The tag to search for in the database, 
+                       or several tags combined with AND / OR / NOT.
+        languages, restricted, completion, years, snapshot: Values of the filter controls 
+                                                            (see make_filters).
+        previous_job (dict): Parts of the previous search still computed in the background,
+                             cancelled unless they are still needed.
+
+    Returns:
+        Tuple:
+            - A string message indicating the result of the analysis or an error message.
+            - A Div containing the year statistics.
+            - A Plotly figure for the word count graph.
+            - A Plotly figure for the word count histogram.
+            - A Div containing the word count statistics.
+            - A Plotly figure for the completion graph.
+            - A Div containing the completion statistics.
+            - The parts of the search computed in the background, or None.
+    """
+    # If tagname has not been inputed, prompt user for tagname and return empty figures
+    if not tagname:
+        cancel_superseded(previous_job)
+        return "Please enter a tag name.", "", {}, {}, "", {}, "", None
+    filters = make_filters(languages, restricted, completion, years, snapshot)
+    annotate_trace(tag=tagname, filters=filters_key(filters))
+    # Reuse the figures and stats from an earlier search of the same text and filters
+    cache_key = tagname.strip() + ' | ' + filters_key(filters)
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        cancel_superseded(previous_job)
+        return cached + (None,)
+
+    try:
+        try:
+            # Tags with many works are counted in the background, showing what's ready
+            if needs_background(tagname, filters, ['analysis', 'words']):
+                job = start_job(tagname, filters, ['analysis', 'words'], previous_job)
+                annotate_trace(works=job['estimate'], background=True)
+                analysis = analysis_cache.peek(result_key(tagname, filters))
+                distribution = analysis_cache.peek(result_key(tagname, filters, 'words'))
+                return dashboard_outputs(tagname, filters, analysis, distribution, 
+                                         job['estimate']) + (job,)
+            cancel_superseded(previous_job)
+            # Get year, word count, and completion counts of works containing tag
+            analysis = analyze_tag(tagname, filters)
+            # Get the word count histogram and percentiles
+            distribution = word_distribution(tagname, filters)
+        # If tag (or one of the tags in a query) is not found:
+        except TagNotFoundError as no_tag_found:
+            cancel_superseded(previous_job)
+            # Find list of potential similar tags
+            options = list(autocorrect(no_tag_found.tagname))
+            if not options:
+                # If there are no similar tags, return this error message
+                return f"{str(no_tag_found)} No potential matching tags found, sorry!", "", {}, {}, "", {}, "", None
+            # If there are similar tags, return error message containing possible options
+            return f"{str(no_tag_found)} Could you mean one of these options instead? {options}", "", {}, {}, "", {}, "", None
+
+        annotate_trace(works=analysis["total_works"])
+        # Return the results to display on the dashboard, and keep them for repeat searches
+        result = dashboard_outputs(tagname, filters, analysis, distribution)
+        dashboard_cache.put(cache_key, result)
+        return result + (None,)
 
     except Exception as error:
         # Handle any errors that may occur during processing
-        return f"Error processing tag '{tagname}': {str(error)}", {}, "", {}, "", {}, ""
+        return f"Error processing tag '{tagname}': {str(error)}", "", {}, {}, "", {}, "", None
+
+def check_job(job: dict) -> tuple:
+    """
+    Checks which parts of a search computed in the background are ready, submitting again
+    the parts that were lost or cancelled (e.g. a part was cancelled by the last search 
+    waiting for it just before this search started waiting for it too).
+    
+    Parameters:
+        job (dict): Job of the search (see start_job).
+    
+    Returns:
+        Tuple:
+            - ready (dict): The results of the parts now ready, by part.
+            - errors (list): Error messages of the parts that failed.
+            - job (dict): The job, without the parts that are ready or failed.
+    """
+    ready, errors, pending = {}, [], []
+    for part in job['pending']:
+        value = analysis_cache.peek(result_key(job['tagname'], job['filters'], part))
+        if value is not None:
+            ready[part] = value
+            continue
+        state = part_state(job['tagname'], job['filters'], part)
+        if state is not None and state['status'] == 'failed':
+            errors.append(state['error'])
+            continue
+        # Submitting again only waits for a part already queued or running elsewhere
+        if (state is None or job['id'] not in state['jobs'] or state['status'] == 'cancelled' 
+                or time.time() - state['time'] >= BACKGROUND_TIMEOUT):
+            submit_parts(job['tagname'], job['filters'], [part], job['id'])
+        pending.append(part)
+    return ready, errors, dict(job, pending=pending)
+
+@app.callback(
+    Output("analysis-poll", "disabled"),
+    Input("analysis-job", "data"),
+    Input("time-job", "data")
+)
+def toggle_poll(dashboard_job, time_job) -> bool:
+    """
+    Runs the timer checking on background searches only while parts are pending.
+    
+    Parameters:
+        dashboard_job (dict): Job of update_dashboard (see start_job), or None.
+        time_job (dict): Job of update_time_graph, or None.
+    
+    Returns:
+        disabled (bool): True if no part is pending.
+    """
+    return not any(job and job.get('pending') for job in (dashboard_job, time_job))
+
+@app.callback(
+    Output("output-message", "children", allow_duplicate=True),
+    Output("year-stats", "children", allow_duplicate=True),
+    Output("wordcount-graph", "figure", allow_duplicate=True),
+    Output("wordcount-histogram", "figure", allow_duplicate=True),
+    Output("wordcount-stats", "children", allow_duplicate=True),
+    Output("completion-graph", "figure", allow_duplicate=True),
+    Output("completion-stats", "children", allow_duplicate=True),
+    Output("analysis-job", "data", allow_duplicate=True),
+    Output("year-graph", "figure", allow_duplicate=True),
+    Output("time-job", "data", allow_duplicate=True),
+    Input("analysis-poll", "n_intervals"),
+    State("analysis-job", "data"),
+    State("time-job", "data"),
+    State("time-granularity", "value"),
+    State("rolling-window", "value"),
+    prevent_initial_call=True
+)
+@timed_stage('poll_analysis')
+def poll_analysis(n_intervals, dashboard_job, time_job, granularity="year", window=1) -> tuple:
+    """
+    Fills in the dashboard as the parts of a search computed in the background are ready,
+    each graph as soon as its own part is, leaving the others as they are.
+    
+    Parameters:
+        n_intervals (int): The number of times the timer has fired.
+        dashboard_job (dict): Job of update_dashboard (see start_job), or None.
+        time_job (dict): Job of update_time_graph, or None.
+        granularity (str): "year", "month", or "week".
+        window (int): Number of periods averaged by the rolling average (1 for none).
+    
+    Returns:
+        Tuple of the outputs of update_dashboard and update_time_graph, 
+        left unchanged (no_update) unless a part is ready or failed.
+    """
+    dashboard = (no_update,) * 8
+    if dashboard_job and dashboard_job.get('pending'):
+        ready, errors, job = check_job(dashboard_job)
+        tagname, filters = job['tagname'], job['filters']
+        annotate_trace(tag=tagname, filters=filters_key(filters))
+        if errors:
+            dashboard = (f"Error processing tag '{tagname}': {errors[0]}", "", {}, {}, "", {}, "", None)
+        elif ready:
+            # Parts shown earlier are read back from the cache to draw the whole dashboard
+            analysis = ready.get('analysis', analysis_cache.peek(result_key(tagname, filters)))
+            distribution = ready.get('words', analysis_cache.peek(result_key(tagname, filters, 'words')))
+            outputs = dashboard_outputs(tagname, filters, analysis, distribution, job['estimate'])
+            if not job['pending']:
+                dashboard_cache.put(tagname.strip() + ' | ' + filters_key(filters), outputs)
+            dashboard = outputs + (job,)
+    timed = (no_update, no_update)
+    if time_job and time_job.get('pending'):
+        ready, errors, job = check_job(time_job)
+        part = f"time:{granularity}"
+        if errors:
+            timed = ({}, None)
+        elif part in ready:
+            timed = (time_figure(job['tagname'], ready[part], granularity, window), job)
+    return dashboard + timed
+
+def parse_compare_input(text: str) -> list:
+    """
+    Splits the comparison input into tag names (AO3 tag names can't contain commas).
+    
+    Parameters:
+        text (str): Tags separated by commas.
+    
+    Returns:
+        tagnames (list): Tag names, in the order given, without blanks or repeats.
+    """
+    tagnames = []
+    for tagname in text.split(','):
+        tagname = tagname.strip()
+        if tagname and tagname not in tagnames:
+            tagnames.append(tagname)
+    return tagnames
+
+# Comparison callback
+@app.callback(
+    Output("compare-message", "children"),
+    Output("compare-year-graph", "figure"),
+    Output("compare-wordcount-graph", "figure"),
+    Output("compare-completion-graph", "figure"),
+    Output("compare-stats", "children"),
+    Input("compare-button", "n_clicks"),
+    Input("compare-input", "value"),
+    Input("language-filter", "value"),
+    Input("restricted-filter", "value"),
+    Input("completion-filter", "value"),
+    Input("year-filter", "value"),
+    Input("snapshot-filter", "value")
+)
+@timed_stage('update_comparison')
+def update_comparison(n_clicks, text, languages=None, restricted="all", completion="all", 
+                      years=None, snapshot=None) -> tuple:
+    """
+    Compares several tags side by side: works per year as one line per tag, and the share 
+    of works per word count bracket and per completion status as grouped bars, with a table 
+    of each tag's summary statistics. The tags are counted together in one batched pass
+    (see compare_tags), so comparing 20 tags costs about as much as a couple of searches.
+    
+    Parameters:
+        n_clicks (int): The number of times the compare button has been clicked.
+        text (str): Tags (or tag queries) separated by commas.
+        languages, restricted, completion, years, snapshot: Values of the filter controls 
+                                                            (see make_filters).
+    
+    Returns:
+        Tuple:
+            - A string message indicating the result of the comparison or an error message.
+            - A Plotly figure for the year graph.
+            - A Plotly figure for the word count graph.
+            - A Plotly figure for the completion graph.
+            - A table of the tags' statistics.
+    """
+    tagnames = parse_compare_input(text or "")
+    if not tagnames:
+        return "", {}, {}, {}, ""
+    message = ""
+    if len(tagnames) > MAX_COMPARE_TAGS:
+        message = f" Only the first {MAX_COMPARE_TAGS} tags are compared."
+        tagnames = tagnames[:MAX_COMPARE_TAGS]
+    filters = make_filters(languages, restricted, completion, years, snapshot)
+    annotate_trace(tag=', '.join(tagnames), filters=filters_key(filters))
+
+    try:
+        try:
+            analyses = compare_tags(tagnames, filters)
+        except TagNotFoundError as no_tag_found:
+            # Find list of potential similar tags
+            options = list(autocorrect(no_tag_found.tagname))
+            if not options:
+                return f"{str(no_tag_found)} No potential matching tags found, sorry!", {}, {}, {}, ""
+            return f"{str(no_tag_found)} Could you mean one of these options instead? {options}", {}, {}, {}, ""
+
+        annotate_trace(works=sum(analysis["total_works"] for analysis in analyses.values()))
+        figures_start = time.perf_counter()
+        # Imported on first use, so starting a worker doesn't wait for Plotly Express
+        import plotly.express as px
+
+        # Combine the tags' tables, labelling each row with its tag, and turn the word count
+        # and completion counts into shares of each tag's works so tags of any size compare
+        years_table, word_table, completion_rows = [], [], []
+        for tagname, analysis in analyses.items():
+            total = analysis["total_works"]
+            years_table.append(analysis["years"].assign(tag=tagname))
+            word_table.append(analysis["word_counts"].assign(
+                tag=tagname, share=analysis["word_counts"]["num_works"] * 100 / max(total, 1)))
+            completion_rows.append({"tag": tagname, 
+                                    "share": analysis["complete_works"] * 100 / max(total, 1)})
+        years_table = pd.concat(years_table, ignore_index=True)
+        word_table = pd.concat(word_table, ignore_index=True)
+        completion_table = pd.DataFrame(completion_rows)
+        layout = dict(
+            title_font = dict(family="Arial, sans-serif", size = 24, color = "black"),
+            font = dict(family = "Arial, sans-serif", size = 14),
+            xaxis_title_font = dict(family = "Arial, sans-serif", size = 16),
+            yaxis_title_font = dict(family = "Arial, sans-serif", size = 16),
+            legend_title_text = "Tag"
+        )
+
+        # Year graph, one line per tag
+        year_fig = px.line(years_table, x="creation_year", y="num_works", color="tag",
+                           markers=True, title="Works by Year")
+        # Tags starting in different years still share one ordered axis
+        year_fig.update_layout(xaxis_title="Year", yaxis_title="Number of Works", 
+                               xaxis_categoryorder="category ascending", **layout)
+        # Word count graph, one bar per tag in each bracket
+        wordcount_fig = px.bar(word_table, x="word_bracket", y="share", color="tag",
+                               barmode="group", title="Share of Works by Word Count")
+        wordcount_fig.update_layout(xaxis_title="Word Count", yaxis_title="% of Works", **layout)
+        # Completion graph, one bar per tag
+        completion_fig = px.bar(completion_table, x="tag", y="share", color="tag",
+                                title="Share of Complete Works")
+        completion_fig.update_layout(xaxis_title="Tag", yaxis_title="% Complete", 
+                                     showlegend=False, **layout)
+
+        # Summary statistics of each tag
+        headings = ["Tag", "Works", "Average Word Count", "Highest Word Count", "Complete"]
+        compare_stats = html.Table(
+            [html.Tr([html.Th(heading) for heading in headings])] +
+            [html.Tr([html.Td(tagname),
+                      html.Td(f"{analysis['total_works']:,}"),
+                      html.Td(f"{analysis['average_words']:,.1f}"),
+                      html.Td(f"{analysis['max_words']:,}"),
+                      html.Td(f"{analysis['complete_works']:,}")])
+             for tagname, analysis in analyses.items()],
+            style={"fontSize": "16px"})
+        record_stage('figures', time.perf_counter() - figures_start)
+        return (f"Comparing {len(analyses)} tags{describe_filters(filters)}.{message}", 
+                year_fig, wordcount_fig, completion_fig, compare_stats)
+
+    except Exception as error:
+        # Handle any errors that may occur during processing
+        return f"Error comparing tags: {str(error)}", {}, {}, {}, ""
+
+# How long this process took to get ready to serve (imports, data checks, and app setup)
+STARTUP_SECONDS = time.perf_counter() - STARTUP_START
+set_gauge('ao3_startup_seconds', STARTUP_SECONDS, 'Time this process took to be ready to serve.')
 
 # Run app
 if __name__ == "__main__":
+    print(f"Ready to serve in {STARTUP_SECONDS:.2f}s")
     app.run(debug = False)
\ No newline at end of file
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+from src.db import DB_PATH
+
+# Tag cardinality groups the query latencies are reported in, as (label, fewest works, most works)
+CARDINALITIES = [('5-99', 5, 99), ('100-999', 100, 999), ('1k-9.9k', 1000, 9999),
+                 ('10k+', 10000, None)]
+
+def time_call(function, *args) -> float:
+    """
+    Run a function once and measure how long it took.
+
+    Parameters:
+        function: Function to run.
+        *args: Arguments to pass to the function.
+
+    Returns:
+        seconds (float): Wall-clock time the call took.
+    """
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def latency_summary(seconds: list) -> dict:
+    """
+    Summarize a list of latencies.
+
+    Parameters:
+        seconds (list): Latencies in seconds.
+
+    Returns:
+        summary (dict): Number of calls and the mean, p50, p90, p99, and max latency
+                        in milliseconds.
+    """
+    ms = np.array(seconds) * 1000
+    return {
+        'calls': len(ms),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3)
+    }
+
+def table_rows(table: str) -> int:
+    """
+    Count the rows of a table in fanfic.db.
+    """
+    with sqlite3.connect(DB_PATH) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def benchmark_ingest(workers: int) -> dict:
+    """
+    Build fanfic.db from the CSV files in the data folder with the step-by-step pipeline,
+    timing each stage.
+
+    Parameters:
+        workers (int): Number of worker processes splitting tags.
+
+    Returns:
+        stages (dict): For each stage, its time in seconds, the rows it produced,
+                       and its throughput in rows per second.
+    """
+    from src.data_prep import csv_to_db, preprocess, split_tags, create_indexes
+    from src.search import build_tag_search
+    stages = {}
+    for stage, function, args, table in [('csv_to_db', csv_to_db, (), 'works'),
+                                         ('preprocess', preprocess, (), 'works'),
+                                         ('split_tags', split_tags, (workers,), 'work_tag_pairs'),
+                                         ('create_indexes', create_indexes, (), 'work_tag_pairs'),
+                                         ('build_tag_search', build_tag_search, (), 'tag_names')]:
+        seconds = time_call(function, *args)
+        rows = table_rows(table)
+        # csv_to_db loads the tags table too
+        if stage == 'csv_to_db':
+            rows += table_rows('tags')
+        stages[stage] = {
+            'seconds': round(seconds, 3),
+            'rows': rows,
+            'rows_per_second': round(rows / seconds) if seconds else None
+        }
+        print(f"{stage}: {seconds:.2f}s ({rows:,} rows)", file=sys.stderr)
+    return stages
+
+def sample_tags(per_group: int, seed: int) -> dict:
+    """
+    Pick random canonical tags from each cardinality group.
+
+    Parameters:
+        per_group (int): Number of tags to pick from each group.
+        seed (int): Seed of the random number generator.
+
+    Returns:
+        samples (dict): Dictionary of group label to list of tag names
+                        (groups without any tags are left out).
+    """
+    rng = np.random.default_rng(seed)
+    samples = {}
+    with sqlite3.connect(DB_PATH) as conn:
+        for label, fewest, most in CARDINALITIES:
+            names = [row[0] for row in conn.execute("""
+                SELECT name FROM tags
+                WHERE canonical = 1 AND cached_count >= ? AND cached_count <= ?
+                ORDER BY id
+                """, (fewest, most if most is not None else 2 ** 62))]
+            if names:
+                picked = rng.choice(len(names), size=min(per_group, len(names)), replace=False)
+                samples[label] = [names[i] for i in sorted(picked)]
+    return samples
+
+def benchmark_queries(samples: dict, repeat: int) -> dict:
+    """
+    Measure the latency of the functions behind a dashboard search,
+    for tags of each cardinality group.
+
+    Parameters:
+        samples (dict): Dictionary of group label to list of tag names, from sample_tags.
+        repeat (int): Number of times to run each query per tag.
+
+    Returns:
+        queries (dict): For each function, a dictionary of group label to latency summary.
+    """
+    from src.processing import (create_master_table, sort_years, sort_word_counts,
+                                sort_completion, autocorrect)
+    functions = ['create_master_table', 'sort_years', 'sort_word_counts', 'sort_completion',
+                 'autocorrect']
+    queries = {function: {} for function in functions}
+    for label, names in samples.items():
+        latencies = {function: [] for function in functions}
+        for name in names:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                works = create_master_table(name)
+                latencies['create_master_table'].append(time.perf_counter() - start)
+                # The sort functions count the works found by create_master_table
+                latencies['sort_years'].append(time_call(sort_years, works))
+                latencies['sort_word_counts'].append(time_call(sort_word_counts, works))
+                latencies['sort_completion'].append(time_call(sort_completion, works))
+                # Look up the tag's first word, as a user typing a partial tag name would
+                latencies['autocorrect'].append(time_call(autocorrect, name.split()[0]))
+        for function in functions:
+            queries[function][label] = latency_summary(latencies[function])
+        print(f"{label}: {len(names)} tags", file=sys.stderr)
+    return queries
+
+def git_commit() -> str:
+    """
+    Get the commit of the code being benchmarked, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(old: dict, new: dict) -> None:
+    """
+    Print how much faster or slower each measurement of a run is than an earlier run
+    (to standard error, so standard output stays JSON).
+
+    Parameters:
+        old (dict): Results of the earlier run.
+        new (dict): Results of this run.
+
+    Returns:
+        None
+    """
+    print(f"{'measurement':<45} {'old':>10} {'new':>10} {'change':>8}", file=sys.stderr)
+    rows = [(f"ingest {stage} (s)", old['ingest'].get(stage, {}).get('seconds'), result['seconds'])
+            for stage, result in new['ingest'].items()]
+    for function, groups in new['queries'].items():
+        for label, result in groups.items():
+            old_result = old['queries'].get(function, {}).get(label, {})
+            rows.append((f"{function} {label} p50 (ms)", old_result.get('p50_ms'), result['p50_ms']))
+            rows.append((f"{function} {label} p99 (ms)", old_result.get('p99_ms'), result['p99_ms']))
+    for name, before, after in rows:
+        if before:
+            change = (after - before) / before
+            print(f"{name:<45} {before:>10} {after:>10} {change:>+8.0%}", file=sys.stderr)
+        else:
+            print(f"{name:<45} {'-':>10} {after:>10} {'':>8}", file=sys.stderr)
+    return None
+
+def main() -> None:
+    """
+    Generate a synthetic data dump, build fanfic.db from it, and benchmark the ingest stages
+    and the queries, writing the results as JSON.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark data preparation and tag queries on a synthetic AO3-shaped dump.")
+    parser.add_argument('--works', type=int, default=100000, help="number of works to generate")
+    parser.add_argument('--tags', type=int, default=None,
+                        help="number of long-tail tags to generate (default: twice the works)")
+    parser.add_argument('--zipf', type=float, default=0.9, help="Zipf exponent of tag popularity")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes used by split_tags")
+    parser.add_argument('--tags-per-group', type=int, default=5,
+                        help="tags queried per cardinality group")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of each query per tag")
+    parser.add_argument('--directory', default=None,
+                        help="folder to build the data folder in (default: a temporary folder)")
+    parser.add_argument('--output', default=None, help="file to write the JSON results to")
+    parser.add_argument('--compare', default=None,
+                        help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    compare = os.path.abspath(args.compare) if args.compare else None
+    # Everything reads and writes the data folder of the working directory
+    directory = args.directory or tempfile.mkdtemp(prefix='ao3-benchmark-')
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    if os.path.exists(DB_PATH):
+        sys.exit(f"{directory} already contains {DB_PATH}; use an empty folder.")
+
+    from src.synthetic import generate_dump
+    print(f"Generating {args.works:,} works in {directory}...", file=sys.stderr)
+    start = time.perf_counter()
+    dump = generate_dump(args.works, args.tags, args.zipf, seed=args.seed)
+    generate_seconds = time.perf_counter() - start
+    results = {
+        'run': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'dataset': {**dump, 'zipf': args.zipf, 'seed': args.seed,
+                    'generate_seconds': round(generate_seconds, 3)},
+        'ingest': benchmark_ingest(args.workers)
+    }
+    samples = sample_tags(args.tags_per_group, args.seed)
+    results['queries'] = benchmark_queries(samples, args.repeat)
+
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    if compare:
+        with open(compare) as file:
+            compare_results(json.load(file), results)
+    return None
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,570 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import requests
+from benchmark import latency_summary, git_commit, table_rows
+from src.db import DB_PATH
+
+# Output of the dashboard callback the simulated users trigger (see app.update_dashboard)
+DASHBOARD_OUTPUT = 'output-message.children'
+
+# Input of the callback filling in searches computed in the background (see app.poll_analysis)
+POLL_INPUT = ('analysis-poll', 'n_intervals')
+
+# Seconds between checks on a search computed in the background, as the page does
+POLL_SECONDS = 0.5
+
+# Number of most used tags that count as huge tags
+HUGE_TAGS = 10
+
+# Kinds of requests in the mix: popular tags picked by their number of works, huge tags,
+# misspelled tags (not found, so the dashboard runs autocorrect), and popular tags
+# with a completion filter (which can't use the precomputed statistics)
+REQUEST_KINDS = ['tag', 'huge', 'miss', 'filtered']
+
+def dashboard_callback(url: str) -> dict:
+    """
+    Find the dashboard callback among the app's callbacks, so requests match its outputs
+    and inputs (in their current order) without hard-coding them.
+
+    Parameters:
+        url (str): Address of the running dashboard.
+
+    Returns:
+        callback (dict): The callback's dependencies, as served at /_dash-dependencies.
+    """
+    response = requests.get(url + '/_dash-dependencies', timeout=30)
+    response.raise_for_status()
+    for callback in response.json():
+        if DASHBOARD_OUTPUT in callback['output'].strip('.').split('...'):
+            return callback
+    raise RuntimeError(f"No callback updating {DASHBOARD_OUTPUT} at {url}.")
+
+def poll_callback(url: str) -> dict:
+    """
+    Find the callback filling in searches computed in the background, if the app has one.
+
+    Parameters:
+        url (str): Address of the running dashboard.
+
+    Returns:
+        callback (dict): The callback's dependencies, as served at /_dash-dependencies,
+                         or None if there is no such callback.
+    """
+    response = requests.get(url + '/_dash-dependencies', timeout=30)
+    response.raise_for_status()
+    for callback in response.json():
+        if any((item['id'], item['property']) == POLL_INPUT for item in callback['inputs']):
+            return callback
+    return None
+
+def layout_values(node, values: dict = None) -> dict:
+    """
+    Collect the starting value of every component with an ID in the app's layout
+    (as served at /_dash-layout), which is what a fresh browser tab sends.
+
+    Parameters:
+        node: Layout, or part of it.
+        values (dict): Values found so far, by component ID and property.
+
+    Returns:
+        values (dict): Dictionary of (component ID, property) to value.
+    """
+    values = {} if values is None else values
+    if isinstance(node, list):
+        for child in node:
+            layout_values(child, values)
+    elif isinstance(node, dict):
+        props = node.get('props', {})
+        if 'id' in props:
+            for prop, value in props.items():
+                values[(props['id'], prop)] = value
+        layout_values(props.get('children'), values)
+    return values
+
+def callback_request(callback: dict, values: dict, overrides: dict, changed: str) -> dict:
+    """
+    Build the body of the POST to /_dash-update-component that the browser sends to run
+    a callback, with the current value of each of its inputs and states.
+
+    Parameters:
+        callback (dict): The callback's dependencies, as served at /_dash-dependencies.
+        values (dict): Starting values of the components, as returned by layout_values.
+        overrides (dict): Values that differ from the starting ones, 
+                          by (component ID, property).
+        changed (str): The input that changed, as "component ID.property".
+
+    Returns:
+        body (dict): JSON body of the request.
+    """
+    def current(items: list) -> list:
+        return [{'id': item['id'], 'property': item['property'],
+                 'value': overrides.get((item['id'], item['property']),
+                                        values.get((item['id'], item['property'])))}
+                for item in items]
+
+    outputs = [dict(zip(['id', 'property'], output.split('.', 1)))
+               for output in callback['output'].strip('.').split('...')]
+    return {
+        'output': callback['output'],
+        'outputs': outputs if len(outputs) > 1 else outputs[0],
+        'inputs': current(callback['inputs']),
+        'state': current(callback.get('state', [])),
+        'changedPropIds': [changed]
+    }
+
+def dashboard_request(callback: dict, values: dict, tagname: str, completion: str) -> dict:
+    """
+    Build the body of the POST to /_dash-update-component that the browser sends when
+    the analyze button is clicked.
+
+    Parameters:
+        callback (dict): Dashboard callback, as returned by dashboard_callback.
+        values (dict): Starting values of the components, as returned by layout_values.
+        tagname (str): Tag (or tag query) typed in.
+        completion (str): Value of the completion filter ("all", "complete", or "incomplete").
+
+    Returns:
+        body (dict): JSON body of the request.
+    """
+    overrides = {('analyze-button', 'n_clicks'): 1, ('tag-input', 'value'): tagname,
+                 ('completion-filter', 'value'): completion}
+    return callback_request(callback, values, overrides, 'analyze-button.n_clicks')
+
+def follow_job(session: requests.Session, url: str, callback: dict, values: dict, 
+               data: dict, deadline: float) -> dict:
+    """
+    Keep checking on a search computed in the background, as the page does, 
+    until every part of it is shown.
+
+    Parameters:
+        session (Session): The simulated user's session.
+        url (str): Address of the running dashboard.
+        callback (dict): Polling callback, as returned by poll_callback.
+        values (dict): Starting values of the components, as returned by layout_values.
+        data (dict): JSON response of the dashboard callback.
+        deadline (float): perf_counter time after which to give up.
+
+    Returns:
+        data (dict): The response, with the outputs filled in by the polling callback.
+    """
+    outputs = data['response']
+    job = outputs.get('analysis-job', {}).get('data')
+    checks = 0
+    while job and job.get('pending') and time.perf_counter() < deadline:
+        time.sleep(POLL_SECONDS)
+        checks += 1
+        overrides = {POLL_INPUT: checks, ('analysis-job', 'data'): job}
+        body = callback_request(callback, values, overrides, '.'.join(POLL_INPUT))
+        response = session.post(url + '/_dash-update-component', json=body, timeout=300)
+        response.raise_for_status()
+        # Outputs left unchanged aren't in the response
+        for component, props in response.json()['response'].items():
+            outputs.setdefault(component, {}).update(props)
+        job = outputs.get('analysis-job', {}).get('data')
+    return data
+
+def misspell(rng: np.random.Generator, tagname: str) -> str:
+    """
+    Make a typo in a tag name: a character dropped, doubled, or swapped with the next one,
+    plus a few stray letters so the result is very unlikely to be another tag.
+
+    Parameters:
+        rng (np.random.Generator): Random number generator.
+        tagname (str): Tag name.
+
+    Returns:
+        typo (str): Misspelled tag name.
+    """
+    position = int(rng.integers(0, max(len(tagname) - 1, 1)))
+    typo = rng.integers(0, 3)
+    if typo == 0:
+        tagname = tagname[:position] + tagname[position + 1:]
+    elif typo == 1:
+        tagname = tagname[:position] + tagname[position] + tagname[position:]
+    else:
+        tagname = tagname[:position] + tagname[position + 1:position + 2] + tagname[position] + tagname[position + 2:]
+    return tagname + ''.join(rng.choice(list('qxzj'), size=2))
+
+def plan_requests(size: int, miss_share: float, huge_share: float, filter_share: float,
+                  seed: int) -> list:
+    """
+    Draw the skewed mix of requests the simulated users send, in order.
+    Tags are picked in proportion to their number of works, like users searching the
+    popular tags most often, so the same tags come up again and again.
+
+    Parameters:
+        size (int): Number of requests to draw (users go through them in a loop).
+        miss_share, huge_share, filter_share (float): Share of misspelled tags,
+                                                      huge tags, and filtered popular tags.
+        seed (int): Seed of the random number generator.
+
+    Returns:
+        plan (list): List of (kind, tagname, completion) tuples.
+    """
+    rng = np.random.default_rng(seed)
+    with sqlite3.connect(DB_PATH) as conn:
+        rows = conn.execute("""
+            SELECT name, cached_count FROM tags
+            WHERE canonical = 1 AND cached_count >= 5
+            ORDER BY cached_count DESC, id
+            """).fetchall()
+    if not rows:
+        raise RuntimeError(f"No canonical tags with works in {DB_PATH}.")
+    names = [name for name, _ in rows]
+    counts = np.array([count for _, count in rows], dtype=np.float64)
+    huge = names[:HUGE_TAGS]
+    shares = [1 - miss_share - huge_share - filter_share, huge_share, miss_share, filter_share]
+    if min(shares) < 0:
+        raise ValueError("The shares of misses, huge tags, and filtered tags add up to more than 1.")
+    kinds = rng.choice(len(REQUEST_KINDS), size=size, p=shares)
+    popular = rng.choice(len(names), size=size, p=counts / counts.sum())
+    plan = []
+    for kind, tag in zip(kinds, popular):
+        kind = REQUEST_KINDS[kind]
+        if kind == 'huge':
+            plan.append((kind, huge[int(rng.integers(0, len(huge)))], 'all'))
+        elif kind == 'miss':
+            plan.append((kind, misspell(rng, names[tag]), 'all'))
+        elif kind == 'filtered':
+            plan.append((kind, names[tag], str(rng.choice(['complete', 'incomplete']))))
+        else:
+            plan.append((kind, names[tag], 'all'))
+    return plan
+
+def expected_results(plan: list) -> dict:
+    """
+    Work out the expected total works and words of every distinct request in the plan,
+    straight from fanfic.db in this process (one at a time, without any cache), to check
+    the answers served under load against.
+
+    Parameters:
+        plan (list): Requests, as returned by plan_requests.
+
+    Returns:
+        expected (dict): Dictionary of (tagname, completion) to (total works, total words),
+                         or None for tags that aren't found.
+    """
+    from src.processing import find_tag, aggregate_tag, TagNotFoundError
+    expected = {}
+    for _, tagname, completion in plan:
+        if (tagname, completion) in expected:
+            continue
+        try:
+            tag_id = find_tag(tagname)
+        except TagNotFoundError:
+            expected[(tagname, completion)] = None
+            continue
+        filters = {'complete': completion == 'complete'} if completion != 'all' else {}
+        cube = aggregate_tag(tag_id, filters)
+        expected[(tagname, completion)] = (int(cube['num_works'].sum()),
+                                           int(cube['total_words'].sum()))
+    return expected
+
+def response_text(node) -> list:
+    """
+    Collect the text shown by a callback's output (the strings in its components).
+
+    Parameters:
+        node: Output value, as found in the callback's response.
+
+    Returns:
+        texts (list): Strings, in order.
+    """
+    if isinstance(node, str):
+        return [node]
+    if isinstance(node, list):
+        return [text for child in node for text in response_text(child)]
+    if isinstance(node, dict):
+        return response_text(node.get('props', {}).get('children'))
+    return []
+
+def check_response(data: dict, expected: tuple) -> str:
+    """
+    Classify a dashboard response by comparing it with the expected result.
+
+    Parameters:
+        data (dict): JSON response of /_dash-update-component.
+        expected (tuple): Expected (total works, total words), or None if the tag isn't found.
+
+    Returns:
+        outcome (str): "ok", "error" (the dashboard reported an error), or "incorrect".
+    """
+    outputs = data['response']
+    message = ' '.join(response_text(outputs['output-message']['children']))
+    if message.startswith('Error'):
+        return 'error'
+    if expected is None:
+        return 'ok' if 'not found' in message else 'incorrect'
+    if expected[0] == 0:
+        return 'ok' if message.startswith('No works found') else 'incorrect'
+    stats = ' '.join(response_text(outputs['year-stats']['children']) +
+                     response_text(outputs['wordcount-stats']['children']))
+    works = re.search(r'Total Works: ([\d,]+)', stats)
+    words = re.search(r'Total Word Count: ([\d,]+)', stats)
+    if not works or not words:
+        return 'incorrect'
+    found = (int(works.group(1).replace(',', '')), int(words.group(1).replace(',', '')))
+    return 'ok' if found == expected else 'incorrect'
+
+def run_level(url: str, bodies: list, plan: list, expected: dict, concurrency: int,
+              duration: float, think: float, poll: dict = None, values: dict = None) -> dict:
+    """
+    Run the given number of simulated users against the dashboard for a while. Each user
+    sends a request, waits for the answer (and the think time), and sends the next one
+    from the plan, which the users go through together. A search computed in the 
+    background is only answered once the polling callback has shown all of it.
+
+    Parameters:
+        url (str): Address of the running dashboard.
+        bodies (list): Request body of each planned request.
+        plan (list): Requests, as returned by plan_requests.
+        expected (dict): Expected results, as returned by expected_results (empty to skip checks).
+        concurrency (int): Number of simulated users.
+        duration (float): Seconds to run for.
+        think (float): Seconds each user waits between getting an answer and sending the next request.
+        poll (dict): Polling callback, as returned by poll_callback (None if the app has none).
+        values (dict): Starting values of the components, as returned by layout_values.
+
+    Returns:
+        level (dict): Throughput, error and incorrect rates, latency summaries (overall and
+                      per kind of request), and a few of the incorrect answers.
+    """
+    lock = threading.Lock()
+    position = [0]
+    results = []
+    deadline = time.perf_counter() + duration
+
+    def user() -> None:
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            with lock:
+                index = position[0] % len(plan)
+                position[0] += 1
+            kind, tagname, completion = plan[index]
+            start = time.perf_counter()
+            try:
+                response = session.post(url + '/_dash-update-component', json=bodies[index],
+                                        timeout=300)
+                if response.status_code != 200:
+                    outcome = 'error'
+                else:
+                    data = response.json()
+                    if poll is not None:
+                        data = follow_job(session, url, poll, values, data, start + 300)
+                    outcome = (check_response(data, expected[(tagname, completion)]) 
+                               if expected else 'ok')
+                seconds = time.perf_counter() - start
+            except (requests.RequestException, ValueError, KeyError):
+                seconds = time.perf_counter() - start
+                outcome = 'error'
+            with lock:
+                results.append((kind, tagname, completion, seconds, outcome))
+            if think:
+                time.sleep(think)
+
+    start = time.perf_counter()
+    users = [threading.Thread(target=user) for _ in range(concurrency)]
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if not results:
+        return {'concurrency': concurrency, 'requests': 0}
+    outcomes = [outcome for *_, outcome in results]
+    level = {
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'requests': len(results),
+        'throughput_rps': round(len(results) / elapsed, 2),
+        'error_rate': round(outcomes.count('error') / len(results), 4),
+        'incorrect': outcomes.count('incorrect'),
+        'latency': latency_summary([seconds for _, _, _, seconds, _ in results]),
+        'latency_by_kind': {kind: latency_summary([seconds for k, _, _, seconds, _ in results
+                                                   if k == kind])
+                            for kind in REQUEST_KINDS if any(k == kind for k, *_ in results)},
+        'incorrect_examples': [{'kind': kind, 'tag': tagname, 'completion': completion,
+                                'expected': expected[(tagname, completion)]}
+                               for kind, tagname, completion, _, outcome in results
+                               if outcome == 'incorrect'][:5]
+    }
+    print(f"{concurrency} users: {level['throughput_rps']} requests/s, "
+          f"p50 {level['latency']['p50_ms']:.0f}ms, p99 {level['latency']['p99_ms']:.0f}ms, "
+          f"{level['error_rate']:.1%} errors, {level['incorrect']} incorrect", file=sys.stderr)
+    return level
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    """
+    Start the dashboard in the working directory, with Dash's own server or under gunicorn.
+
+    Parameters:
+        workers (int): Number of gunicorn worker processes (0 for Dash's own server).
+        port (int): Port to serve on.
+
+    Returns:
+        server (subprocess.Popen): The server process.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    if workers:
+        command = [sys.executable, '-m', 'gunicorn', '--preload', '--workers', str(workers), '--bind',
+                   f'127.0.0.1:{port}', '--timeout', '600', '--pythonpath', root, 'app:server']
+    else:
+        command = [sys.executable, os.path.join(root, 'app.py')]
+    # Every optional data preparation stage is built (see app.PREP_OPTIONS), unless set already
+    env = {name: '1' for name in ('AO3_PREP_STREAMING', 'AO3_PREP_COMPACT', 'AO3_PREP_STATS',
+                                  'AO3_PREP_RELATED')}
+    env['AO3_PREP_WORKERS'] = '0'
+    env.update(os.environ)
+    # Dash's own server takes its port from the PORT environment variable
+    env['PORT'] = str(port)
+    return subprocess.Popen(command, env=env)
+
+def wait_until_ready(url: str, server: subprocess.Popen, timeout: float) -> None:
+    """
+    Wait for the dashboard to answer, which includes any data preparation on its first start.
+
+    Parameters:
+        url (str): Address of the dashboard.
+        server (subprocess.Popen): The server process, or None for a server started elsewhere.
+        timeout (float): Seconds to wait at most.
+
+    Returns:
+        None
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server is not None and server.poll() is not None:
+            sys.exit(f"The dashboard exited with code {server.returncode}.")
+        try:
+            if requests.get(url + '/_dash-dependencies', timeout=5).status_code == 200:
+                return None
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    sys.exit(f"The dashboard at {url} wasn't ready after {timeout:.0f}s.")
+
+def main() -> None:
+    """
+    Load test the dashboard: start it on a real or synthetic fanfic.db (or use one already
+    running), then run simulated users at each concurrency level, writing the results as JSON.
+    """
+    parser = argparse.ArgumentParser(
+        description="Load test the dashboard callback with concurrent simulated users.")
+    parser.add_argument('--directory', default=None,
+                        help="folder containing the data folder (default: the working directory,"
+                             " or a temporary folder with --synthetic-works)")
+    parser.add_argument('--synthetic-works', type=int, default=None,
+                        help="generate a synthetic dump with this many works first "
+                             "(the dashboard builds fanfic.db from it)")
+    parser.add_argument('--zipf', type=float, default=0.9, help="Zipf exponent of synthetic tag popularity")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+    parser.add_argument('--url', default=None,
+                        help="address of a dashboard that is already running on the same "
+                             "fanfic.db (default: start one)")
+    parser.add_argument('--port', type=int, default=8050, help="port of the started dashboard")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="gunicorn worker processes for the started dashboard "
+                             "(default: Dash's own server)")
+    parser.add_argument('--startup-timeout', type=float, default=3600,
+                        help="seconds to wait for the dashboard to be ready")
+    parser.add_argument('--concurrency', default='1,4,16',
+                        help="comma-separated numbers of simulated users, run one after another")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to run each level for")
+    parser.add_argument('--think', type=float, default=0,
+                        help="seconds each user waits between requests")
+    parser.add_argument('--plan-size', type=int, default=2000, help="number of requests to draw")
+    parser.add_argument('--miss-share', type=float, default=0.1, help="share of misspelled tags")
+    parser.add_argument('--huge-share', type=float, default=0.05, help="share of huge tags")
+    parser.add_argument('--filter-share', type=float, default=0.2,
+                        help="share of popular tags searched with a completion filter")
+    parser.add_argument('--no-verify', action='store_true',
+                        help="don't check the answers against fanfic.db")
+    parser.add_argument('--output', default=None, help="file to write the JSON results to")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    # The data folder of the working directory is what the dashboard and the checks read
+    directory = args.directory or (tempfile.mkdtemp(prefix='ao3-loadtest-')
+                                   if args.synthetic_works else os.getcwd())
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    dataset = {'directory': directory}
+    if args.synthetic_works:
+        if os.path.exists(DB_PATH):
+            sys.exit(f"{directory} already contains {DB_PATH}; use an empty folder.")
+        from src.synthetic import generate_dump
+        print(f"Generating {args.synthetic_works:,} works in {directory}...", file=sys.stderr)
+        dataset.update(generate_dump(args.synthetic_works, None, args.zipf, seed=args.seed),
+                       zipf=args.zipf, seed=args.seed)
+
+    server = None
+    url = args.url.rstrip('/') if args.url else f"http://127.0.0.1:{args.port}"
+    try:
+        if not args.url:
+            # A dashboard left running on the port would answer instead of the started one
+            try:
+                requests.get(url, timeout=5)
+                sys.exit(f"Port {args.port} is already in use; stop that server, "
+                         f"pick another --port, or pass its --url.")
+            except requests.ConnectionError:
+                pass
+            print("Starting the dashboard...", file=sys.stderr)
+            server = start_server(args.workers, args.port)
+        wait_until_ready(url, server, args.startup_timeout)
+        plan = plan_requests(args.plan_size, args.miss_share, args.huge_share,
+                             args.filter_share, args.seed)
+        expected = {}
+        if not args.no_verify:
+            print("Finding the expected results...", file=sys.stderr)
+            expected = expected_results(plan)
+        callback = dashboard_callback(url)
+        layout = requests.get(url + '/_dash-layout', timeout=30).json()
+        values = layout_values(layout)
+        bodies = [dashboard_request(callback, values, tagname, completion)
+                  for _, tagname, completion in plan]
+        poll = poll_callback(url)
+        results = {
+            'run': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'server': url if args.url else ('gunicorn' if args.workers else 'dash'),
+                'workers': args.workers if not args.url else None
+            },
+            'dataset': dict(dataset, works=table_rows('works')),
+            'mix': {'plan_size': len(plan), 'distinct': len(set(plan)),
+                    'shares': {kind: round(sum(k == kind for k, *_ in plan) / len(plan), 3)
+                               for kind in REQUEST_KINDS},
+                    'think_seconds': args.think},
+            'levels': [run_level(url, bodies, plan, expected, level, args.duration, args.think,
+                                 poll, values)
+                       for level in levels]
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    return None
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import json
+import hashlib
+from datetime import datetime, timezone
+from flask import Blueprint, request, Response
+from src.db import DB_PATH, database_fingerprint
+from src.processing import (analyze_tag, word_distribution, autocorrect, normalize_query, 
+                            TagNotFoundError, WORD_PERCENTILES)
+from src.search import search_tags
+from src.metrics import timed_stage, annotate_trace
+
+# JSON API serving the numbers behind the dashboard, registered on the Dash app's Flask server
+api = Blueprint('api', __name__, url_prefix='/api')
+
+# How long clients and caches may reuse a response without revalidating it
+CACHE_CONTROL = 'public, max-age=3600'
+
+def json_response(data, status: int = 200) -> Response:
+    """
+    Build a compact JSON response, keeping the order of dictionary keys
+    (so years and word count brackets stay in order).
+
+    Parameters:
+        data: JSON-serializable value.
+        status (int): HTTP status code.
+
+    Returns:
+        response (Response): JSON response.
+    """
+    return Response(json.dumps(data, separators=(',', ':'), ensure_ascii=False),
+                    status=status, mimetype='application/json')
+
+def dataset_version() -> tuple:
+    """
+    Get the version of the dataset the responses are computed from, and when it was last changed.
+
+    Returns:
+        Tuple:
+            - version (str): Fingerprint of fanfic.db (size and modification time).
+            - modified (datetime): Last modification time of fanfic.db.
+    """
+    fingerprint = database_fingerprint(DB_PATH)
+    if fingerprint is None:
+        return 'none', None
+    size, mtime_ns = fingerprint
+    # HTTP dates have whole seconds
+    modified = datetime.fromtimestamp(mtime_ns // 1_000_000_000, tz=timezone.utc)
+    return f"{size}-{mtime_ns}", modified
+
+def conditional_response(key: str, build) -> Response:
+    """
+    Answer a GET request with ETag and Last-Modified headers derived from the dataset version,
+    replying 304 Not Modified without computing anything if the client's copy is current.
+
+    Parameters:
+        key (str): Description of what is requested, e.g. the tag query.
+        build: Function returning the response for the request.
+
+    Returns:
+        response (Response): The response, or a 304 response.
+    """
+    version, modified = dataset_version()
+    etag = hashlib.sha1(f"{version}:{key}".encode('utf-8')).hexdigest()[:20]
+    not_modified = (etag in request.if_none_match if request.if_none_match
+                    else modified is not None and request.if_modified_since is not None
+                    and modified <= request.if_modified_since)
+    response = Response(status=304) if not_modified else build()
+    # Errors aren't cached, so the client retries them
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+        response.last_modified = modified
+        response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+def analysis_json(query: str, analysis: dict, distribution: dict) -> dict:
+    """
+    Convert an analysis into plain JSON values.
+
+    Parameters:
+        query (str): Tag or tag query that was analyzed.
+        analysis (dict): Analysis, as returned by analyze_tag.
+        distribution (dict): Word count distribution, as returned by word_distribution.
+
+    Returns:
+        stats (dict): Summary statistics, word count percentiles, and the number of works 
+                      per year, word count bracket, and completion status.
+    """
+    def counts(table, column: str) -> dict:
+        return {str(label): int(count) for label, count in zip(table[column], table['num_works'])}
+    return {
+        'tag': query,
+        'total_works': analysis['total_works'],
+        'total_words': analysis['total_words'],
+        'max_words': analysis['max_words'],
+        'average_words': round(analysis['average_words'], 1),
+        **{name: round(distribution[name]) for name in WORD_PERCENTILES},
+        'complete_works': analysis['complete_works'],
+        'incomplete_works': analysis['incomplete_works'],
+        'years': counts(analysis['years'], 'creation_year'),
+        'word_counts': counts(analysis['word_counts'], 'word_bracket'),
+        'completion': counts(analysis['completion'], 'complete')
+    }
+
+@api.route('/tags/<path:name>/stats')
+@timed_stage('api_stats')
+def tag_stats(name: str) -> Response:
+    """
+    Serve the statistics of a tag, or of a tag query combining tags with AND / OR / NOT
+    (the same analysis the dashboard graphs). Unknown tags get a 404 with suggestions.
+    """
+    annotate_trace(tag=name)
+    try:
+        normalize_query(name)
+    except ValueError as error:
+        return json_response({'error': str(error)}, 400)
+
+    def build() -> Response:
+        try:
+            analysis = analyze_tag(name)
+            distribution = word_distribution(name)
+        except TagNotFoundError as no_tag_found:
+            return json_response({'error': str(no_tag_found),
+                                  'suggestions': autocorrect(no_tag_found.tagname)}, 404)
+        annotate_trace(works=analysis['total_works'])
+        return json_response(analysis_json(name, analysis, distribution))
+
+    return conditional_response('stats:' + name, build)
+
+@api.route('/tags/search')
+@timed_stage('api_search')
+def tag_search() -> Response:
+    """
+    Serve the most used tags matching the q parameter, ignoring case and accents
+    and allowing for typos (the dashboard's tag search), as a list of names and work counts.
+    """
+    text = request.args.get('q', '')
+    limit = request.args.get('limit', 10, type=int)
+    if not text.strip():
+        return json_response({'error': "Missing search text (q)."}, 400)
+    limit = max(1, min(limit, 100))
+    annotate_trace(search=text)
+    return conditional_response(f"search:{limit}:{text}", lambda: json_response(
+        [{'name': name, 'works': count} for name, count in search_tags(text, limit)]))
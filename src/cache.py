@@ -0,0 +1,293 @@
+import os
+import copy
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from src.db import DB_PATH, database_fingerprint
+
+class ResultCache:
+    """
+    Thread-safe least-recently-used cache for analysis results.
+    Entries are kept in memory, bounded by the number of entries and optionally by their
+    pickled size in bytes. With a disk_path, entries are also saved in an SQLite file that
+    other processes can read, so workers share each other's results. Reading the disk
+    cache only takes SQLite's read lock: the last use of the entries read is saved with
+    the next write.
+    The whole cache is cleared whenever the fanfic.db fingerprint changes.
+    With copies set, each lookup returns its own copy of the result, so a caller changing 
+    it (e.g. adding a column to a cached DataFrame) can't change what later callers get.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = None,
+                 disk_path: str = None, db_path: str = DB_PATH, copies: bool = False):
+        """
+        Parameters:
+            max_entries (int): Maximum number of entries kept (in memory and on disk).
+            max_bytes (int): Maximum total pickled size of the entries kept in memory,
+                             or None for no limit.
+            disk_path (str): Path of the SQLite file shared between processes,
+                             or None to only cache in memory.
+            db_path (str): Path of the database whose fingerprint the entries depend on.
+            copies (bool): True to keep and return copies of the results, for results 
+                           that callers may change.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.db_path = db_path
+        self.copies = copies
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.fingerprint = database_fingerprint(db_path)
+        self.lock = threading.Lock()
+        # Each thread's connection to the disk cache, and when entries were last read from it
+        self.local = threading.local()
+        self.disk_used = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def check_fingerprint(self) -> None:
+        """
+        Clear the in-memory entries if the database has changed since they were cached.
+        Must be called with the lock held.
+        """
+        fingerprint = database_fingerprint(self.db_path)
+        if fingerprint != self.fingerprint:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_bytes = 0
+            self.fingerprint = fingerprint
+
+    def copied(self, value):
+        """
+        Copy a result going into or out of the cache, if the cache keeps copies.
+        """
+        return copy.deepcopy(value) if self.copies else value
+
+    def get(self, key: str):
+        """
+        Look up a cached result, marking it as most recently used.
+
+        Parameters:
+            key (str): Normalized query.
+
+        Returns:
+            value: The cached result, or None if it isn't cached.
+        """
+        with self.lock:
+            self.check_fingerprint()
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                value = self.entries[key]
+            else:
+                value = None
+        if value is not None:
+            return self.copied(value)
+        # Not in memory, so check the shared disk cache (unpickling gives a fresh copy)
+        value = self.disk_get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.store(key, self.copied(value))
+        return value
+
+    def peek(self, key: str):
+        """
+        Look up a cached result without counting a hit or miss, for checking whether 
+        a result computed elsewhere (e.g. in the background) is ready yet.
+
+        Parameters:
+            key (str): Normalized query.
+
+        Returns:
+            value: The cached result, or None if it isn't cached.
+        """
+        with self.lock:
+            self.check_fingerprint()
+            value = self.entries.get(key)
+        if value is not None:
+            return self.copied(value)
+        value = self.disk_get(key)
+        if value is not None:
+            with self.lock:
+                self.store(key, self.copied(value))
+        return value
+
+    def put(self, key: str, value) -> None:
+        """
+        Cache a result, evicting the least recently used entries if the cache is full.
+
+        Parameters:
+            key (str): Normalized query.
+            value: Result to cache (must be picklable if disk_path or max_bytes is set).
+
+        Returns:
+            None
+        """
+        self.put_many({key: value})
+        return None
+
+    def put_many(self, items: dict) -> None:
+        """
+        Cache several results at once, saving them to the disk cache in one transaction.
+
+        Parameters:
+            items (dict): Dictionary of normalized query to result.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.check_fingerprint()
+            for key, value in items.items():
+                self.store(key, self.copied(value))
+        self.disk_put(items)
+        return None
+
+    def update(self, key: str, change):
+        """
+        Change a cached result in one step, so changes made at the same time (by other threads,
+        or through the disk file by other processes) never overwrite each other.
+
+        Parameters:
+            key (str): Normalized query.
+            change (callable): Function given the current result (or None if it isn't cached)
+                               and returning the new result.
+
+        Returns:
+            value: The new result.
+        """
+        with self.lock:
+            self.check_fingerprint()
+            if not self.disk_path:
+                value = change(self.entries.get(key))
+                self.store(key, value)
+                return value
+        value = self.disk_update(key, change)
+        with self.lock:
+            self.store(key, value)
+        return value
+
+    def store(self, key: str, value) -> None:
+        """
+        Add an entry to the in-memory cache and evict entries past the limits.
+        Must be called with the lock held.
+        """
+        if key in self.entries:
+            self.total_bytes -= self.sizes.pop(key, 0)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if self.max_bytes is not None:
+            self.sizes[key] = len(pickle.dumps(value))
+            self.total_bytes += self.sizes[key]
+        while len(self.entries) > self.max_entries or (
+                self.max_bytes is not None and self.total_bytes > self.max_bytes
+                and len(self.entries) > 1):
+            evicted, _ = self.entries.popitem(last=False)
+            self.total_bytes -= self.sizes.pop(evicted, 0)
+            self.evictions += 1
+
+    def disk_connect(self) -> sqlite3.Connection:
+        """
+        Get this thread's connection to the shared disk cache, connecting (and creating 
+        its table) on first use. A process forked from this one connects again.
+        """
+        if getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.disk_path, timeout=5)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT,
+            value BLOB,
+            last_used REAL
+            )
+            """)
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return self.local.conn
+
+    def disk_get(self, key: str):
+        """
+        Look up a result in the shared disk cache, if there is one.
+        """
+        if not self.disk_path or not os.path.isfile(self.disk_path):
+            return None
+        row = self.disk_connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND fingerprint = ?",
+            (key, repr(self.fingerprint))).fetchone()
+        if row is None:
+            return None
+        # Saved by the next disk_put, so reads never wait for (or take) the write lock
+        with self.lock:
+            self.disk_used[key] = time.time()
+        return pickle.loads(row[0])
+
+    def disk_put(self, items: dict) -> None:
+        """
+        Save results in the shared disk cache, if there is one, dropping entries from
+        older databases and the least recently used entries past max_entries.
+        """
+        if not self.disk_path or not items:
+            return None
+        with self.disk_connect() as conn:
+            self.disk_write(conn, items)
+        return None
+
+    def disk_update(self, key: str, change):
+        """
+        Change a result in the shared disk cache (see update), holding the write lock 
+        from reading it to saving it.
+        """
+        with self.disk_connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value FROM cache WHERE key = ? AND fingerprint = ?",
+                               (key, repr(self.fingerprint))).fetchone()
+            value = change(pickle.loads(row[0]) if row is not None else None)
+            self.disk_write(conn, {key: value})
+        return value
+
+    def disk_write(self, conn: sqlite3.Connection, items: dict) -> None:
+        """
+        Save results in the disk cache as part of the connection's transaction, dropping
+        entries from older databases and the least recently used entries past max_entries.
+        """
+        fingerprint = repr(self.fingerprint)
+        now = time.time()
+        with self.lock:
+            used, self.disk_used = self.disk_used, {}
+        conn.execute("DELETE FROM cache WHERE fingerprint != ?", (fingerprint,))
+        conn.executemany("UPDATE cache SET last_used = ? WHERE key = ?",
+                         [(last_used, key) for key, last_used in used.items()])
+        conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                         [(key, fingerprint, pickle.dumps(value), now)
+                          for key, value in items.items()])
+        evicted = conn.execute("""
+        DELETE FROM cache WHERE key IN (
+            SELECT key FROM cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)
+        """, (self.max_entries,)).rowcount
+        with self.lock:
+            self.evictions += evicted
+        return None
+
+    def stats(self) -> dict:
+        """
+        Report the cache counters.
+
+        Returns:
+            stats (dict): Number of hits, misses, evictions, in-memory entries and their bytes
+                          (only counted when max_bytes is set).
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes
+            }
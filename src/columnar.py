@@ -0,0 +1,1543 @@
+import os
+import time
+import shutil
+import sqlite3
+import functools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from src.processing import (WORD_BRACKETS, NUM_WORD_BINS, COMPLETE_WORKS, COMPACT_COMPLETE_WORKS, 
+                            day_periods, work_word_bins, check_cancelled)
+from src.db import DB_PATH, is_compact, is_versioned
+
+# Folder holding the memory-mapped column files, next to the database 
+# (fanfic.db remains the source of truth)
+COLUMNS_DIR = os.path.join(os.path.dirname(DB_PATH), 'columns')
+
+# Spare rows at the end of the works columns, as a share of the works, so works added by 
+# newer dumps (see update_columnar_store) are written in place
+COLUMNS_HEADROOM = 0.1
+
+# Share of the postings that the postings of works added since the store was built may reach
+# before the store is rebuilt, merging them in
+DELTA_MERGE_RATIO = 0.1
+
+# Works columns of the store and their types, and the dump version columns kept
+# when newer dumps have been added (see incremental.add_dump)
+WORK_COLUMNS = {
+    'creation_year': np.int16,
+    'creation_day': np.int32,
+    'creation_month': np.int16,
+    'word_count': np.int32,
+    'word_bin': np.uint8,
+    'complete': np.int8,
+    'restricted': np.int8,
+    'language': np.int16,
+    'valid': np.bool_
+}
+VERSION_COLUMNS = {'first_version': np.int16, 'removed_version': np.int16}
+
+def work_columns_query(compact: bool, versioned: bool) -> str:
+    """
+    Build the query reading the works table's columns for the columnar store,
+    for the works after a given work_id (its only parameter).
+
+    Parameters:
+        compact (bool): True if the database uses the compact layout (see db.is_compact).
+        versioned (bool): True if the works have dump versions (see db.is_versioned).
+
+    Returns:
+        query (str): SQL query.
+    """
+    versions = ", first_version, COALESCE(removed_version, 0) AS removed_version" if versioned else ""
+    if compact:
+        return f"""
+        SELECT work_id, creation_year, creation_day, language, restricted, complete, 
+               word_count, ({COMPACT_COMPLETE_WORKS}) AS valid{versions}
+        FROM works
+        WHERE work_id > ?
+        """
+    return f"""
+    SELECT work_id, creation_date, language, restricted, complete, word_count,
+           ({COMPLETE_WORKS}) AS valid{versions}
+    FROM works
+    WHERE work_id > ?
+    """
+
+def fill_work_columns(arrays: dict, chunk: pd.DataFrame, compact: bool, language_codes: dict) -> None:
+    """
+    Write a chunk of works, as read by work_columns_query, into the works columns.
+
+    Parameters:
+        arrays (dict): Dictionary of column name to (memory-mapped) array.
+        chunk (pd.DataFrame): Works read by work_columns_query.
+        compact (bool): True if the database uses the compact layout.
+        language_codes (dict): Index into languages.npy of each language 
+                               (by language ID in a compact database, by code otherwise).
+
+    Returns:
+        None
+    """
+    ids = chunk['work_id'].to_numpy()
+    if compact:
+        arrays['creation_year'][ids] = chunk['creation_year'].fillna(0).to_numpy(np.int16)
+        arrays['creation_day'][ids] = chunk['creation_day'].fillna(0).to_numpy(np.int32)
+    else:
+        dates = pd.to_datetime(chunk['creation_date'], format='ISO8601', errors='coerce')
+        arrays['creation_year'][ids] = dates.dt.year.fillna(0).to_numpy(np.int16)
+        # Days since 1970-01-01
+        arrays['creation_day'][ids] = ((dates - pd.Timestamp('1970-01-01')).dt.days
+                                       .fillna(0).to_numpy(np.int32))
+    # Months since 1970-01, bucketed once here instead of on every request
+    arrays['creation_month'][ids] = day_periods(arrays['creation_day'][ids], 'month')
+    arrays['word_count'][ids] = chunk['word_count'].fillna(0).to_numpy(np.int32)
+    # Word count histogram bins, also found once here (see processing.WORD_BIN_EDGES)
+    arrays['word_bin'][ids] = work_word_bins(arrays['word_count'][ids])
+    arrays['complete'][ids] = chunk['complete'].fillna(0).to_numpy(np.int8)
+    arrays['restricted'][ids] = chunk['restricted'].fillna(0).to_numpy(np.int8)
+    arrays['language'][ids] = chunk['language'].map(language_codes).fillna(-1).to_numpy(np.int16)
+    arrays['valid'][ids] = chunk['valid'].to_numpy(np.bool_)
+    for column in ['first_version', 'removed_version']:
+        if column in arrays and column in chunk:
+            arrays[column][ids] = chunk[column].to_numpy(np.int16)
+    return None
+
+def build_columnar_store(directory: str = COLUMNS_DIR) -> None:
+    """
+    Creates the columnar store: the works table saved as typed NumPy arrays indexed by work_id,
+    and work_tag_pairs saved as CSR postings (an offsets array plus the sorted work IDs
+    of each tag, so tag_id's works are tag_works[tag_offsets[tag_id]:tag_offsets[tag_id + 1]]).
+    Arrays are written straight to .npy files in chunks, so memory use stays flat.
+    The works columns keep COLUMNS_HEADROOM spare rows for works added by newer dumps, and
+    in a database with several dumps, each work's first and removed dump versions are kept.
+
+    Parameters:
+        directory (str): Folder to save the .npy files in.
+
+    Returns:
+        None
+    """
+    # Build into a temporary folder so a crash never leaves a half-written store behind
+    building = directory + '.tmp'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    with sqlite3.connect(DB_PATH) as conn:
+        cur = conn.cursor()
+        # Works columns
+        num_works = cur.execute("SELECT MAX(work_id) FROM works").fetchone()[0] + 1
+        capacity = num_works + max(int(num_works * COLUMNS_HEADROOM), 1024)
+        compact = is_compact(conn)
+        versioned = is_versioned(conn)
+        if compact:
+            # A compacted database already has integer dates and languages
+            rows = cur.execute("SELECT id, code FROM languages ORDER BY id").fetchall()
+            languages = [language for _, language in rows]
+            language_codes = {language_id: code for code, (language_id, _) in enumerate(rows)}
+        else:
+            languages = [row[0] for row in cur.execute(
+                "SELECT DISTINCT language FROM works WHERE language IS NOT NULL ORDER BY language")]
+            language_codes = {language: code for code, language in enumerate(languages)}
+        columns = dict(WORK_COLUMNS, **(VERSION_COLUMNS if versioned else {}))
+        # The spare rows are zeros, so they are never valid
+        arrays = {name: np.lib.format.open_memmap(os.path.join(building, f'{name}.npy'),
+                                                  mode='w+', dtype=dtype, shape=(capacity,))
+                  for name, dtype in columns.items()}
+        query = work_columns_query(compact, versioned)
+        for chunk in pd.read_sql_query(query, conn, params=(0,), chunksize=500000):
+            fill_work_columns(arrays, chunk, compact, language_codes)
+        for array in arrays.values():
+            array.flush()
+        np.save(os.path.join(building, 'languages.npy'), np.array(languages, dtype=str))
+
+        # Tag postings, read in (tag_id, work_id) order from the work_tag_pairs index
+        num_pairs = cur.execute("SELECT COUNT(*) FROM work_tag_pairs").fetchone()[0]
+        num_tags = (cur.execute("SELECT MAX(tag_id) FROM work_tag_pairs").fetchone()[0] or 0) + 1
+        tag_works = np.lib.format.open_memmap(os.path.join(building, 'tag_works.npy'),
+                                              mode='w+', dtype=np.int32, shape=(num_pairs,))
+        tag_sizes = np.zeros(num_tags, dtype=np.int64)
+        position = 0
+        chunks = pd.read_sql_query("""
+            SELECT tag_id, work_id
+            FROM work_tag_pairs
+            ORDER BY tag_id, work_id
+            """, conn, chunksize=1000000)
+        for chunk in chunks:
+            tag_ids = chunk['tag_id'].to_numpy(np.int64)
+            tag_works[position:position + len(chunk)] = chunk['work_id'].to_numpy(np.int32)
+            tag_sizes += np.bincount(tag_ids, minlength=num_tags)
+            position += len(chunk)
+        tag_works.flush()
+        tag_offsets = np.zeros(num_tags + 1, dtype=np.int64)
+        np.cumsum(tag_sizes, out=tag_offsets[1:])
+        np.save(os.path.join(building, 'tag_offsets.npy'), tag_offsets)
+    swap_store(building, directory)
+    return None
+
+def swap_store(building: str, directory: str) -> None:
+    """
+    Swap a finished store folder into place. The store's files are never changed once the
+    folder is swapped in, so processes still reading the old store (see load_columnar_store)
+    keep a consistent snapshot until they open the new one.
+
+    Parameters:
+        building (str): Folder of the new store.
+        directory (str): Folder of the columnar store.
+
+    Returns:
+        None
+    """
+    old = directory + '.old'
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.isdir(directory):
+        os.replace(directory, old)
+    os.replace(building, directory)
+    # Memory-mapped files stay readable after they are deleted
+    shutil.rmtree(old, ignore_errors=True)
+    return None
+
+def store_version(directory: str = COLUMNS_DIR) -> tuple:
+    """
+    Identify the columnar store folder currently in place: every build or update swaps in
+    a new folder (see swap_store), so its inode and modification time change.
+
+    Parameters:
+        directory (str): Folder of the columnar store.
+
+    Returns:
+        version (tuple): Inode and modification time of the folder, or None if there is none.
+    """
+    try:
+        info = os.stat(directory)
+    except FileNotFoundError:
+        return None
+    return info.st_ino, info.st_mtime_ns
+
+def load_columnar_store(directory: str = COLUMNS_DIR) -> dict:
+    """
+    Open the columnar store with memory mapping, so every worker process shares
+    the same pages from the operating system's page cache. A store rebuilt or updated
+    since (by this or any other process) is opened again.
+
+    Parameters:
+        directory (str): Folder containing the .npy files.
+
+    Returns:
+        store (dict): Dictionary of array name to memory-mapped array,
+                      or None if the store has not been built.
+    """
+    return open_columnar_store(directory, store_version(directory))
+
+@functools.lru_cache(maxsize=1)
+def open_columnar_store(directory: str, version: tuple) -> dict:
+    """
+    Open a version of the columnar store (see load_columnar_store), keeping the last one open.
+
+    Parameters:
+        directory (str): Folder containing the .npy files.
+        version (tuple): Version of the store, as returned by store_version.
+
+    Returns:
+        store (dict): Dictionary of array name to memory-mapped array,
+                      or None if the store has not been built.
+    """
+    if version is None or not os.path.isfile(os.path.join(directory, 'tag_offsets.npy')):
+        return None
+    store = {}
+    for file in os.listdir(directory):
+        name, extension = os.path.splitext(file)
+        if extension == '.npy':
+            store[name] = np.load(os.path.join(directory, file), mmap_mode='r')
+    return store
+
+def tag_work_ids(store: dict, tag_id: int) -> np.ndarray:
+    """
+    Get the sorted work IDs paired with the given tag from the CSR postings,
+    followed by those from the delta postings of works added since the store was built.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        tag_id (int): Tag ID, as found in the tags table.
+
+    Returns:
+        work_ids (np.ndarray): Sorted array of work IDs (empty if the tag has no works).
+    """
+    work_ids = np.empty(0, dtype=np.int32)
+    for offsets, works in [(store['tag_offsets'], store['tag_works']),
+                           (store.get('delta_offsets'), store.get('delta_works'))]:
+        if offsets is None or tag_id < 0 or tag_id + 1 >= len(offsets):
+            continue
+        postings = works[offsets[tag_id]:offsets[tag_id + 1]]
+        # Added works come after every work the store was built with (or the tag only has
+        # delta postings), so the concatenation stays sorted
+        work_ids = np.concatenate([work_ids, postings]) if len(work_ids) else postings
+    return work_ids
+
+def aggregate_work_ids(store: dict, work_ids: np.ndarray, groups: np.ndarray = None) -> pd.DataFrame:
+    """
+    Count the given works by creation year, word bracket, and completion with bincount,
+    giving the same grouped counts as processing.aggregate_tag.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        work_ids (np.ndarray): Work IDs to count.
+        groups (np.ndarray): Optional group number of each work (e.g. which of several tags
+                             it was found for), counted separately in the same pass.
+
+    Returns:
+        cube (pd.DataFrame): DataFrame with one row per (creation_year, word_bracket, complete)
+                             combination, holding num_works, total_words and max_words,
+                             (and per group, in a group column, if groups are given).
+    """
+    # Leave out works with missing values, like the SQL queries do
+    valid = store['valid'][work_ids]
+    work_ids = work_ids[valid]
+    grouped = groups is not None
+    groups = groups[valid] if grouped else np.zeros(len(work_ids), dtype=np.int64)
+    years = store['creation_year'][work_ids].astype(np.int64)
+    words = store['word_count'][work_ids].astype(np.int64)
+    complete = store['complete'][work_ids].astype(np.int64)
+    # Bracket index of each work, from the bracket upper bounds
+    labels = [label for label, _ in WORD_BRACKETS]
+    edges = [upper for _, upper in WORD_BRACKETS if upper is not None]
+    brackets = np.searchsorted(edges, words, side='right')
+    # A search cancelled while the columns were gathered stops before counting them
+    check_cancelled()
+    # Combine the three dimensions into a single cell number per work
+    first_year = int(years.min()) if len(years) else 0
+    num_years = int(years.max()) - first_year + 1 if len(years) else 0
+    num_groups = int(groups.max()) + 1 if len(groups) else 0
+    cells = (((groups * num_years + years - first_year) * len(labels) + brackets) * 2 
+             + complete)
+    num_cells = num_groups * num_years * len(labels) * 2
+    num_works = np.bincount(cells, minlength=num_cells)
+    total_words = np.bincount(cells, weights=words, minlength=num_cells)
+    max_words = np.zeros(num_cells, dtype=np.int64)
+    np.maximum.at(max_words, cells, words)
+    # Keep only the cells that contain works
+    used = np.flatnonzero(num_works)
+    group_index, rest = np.divmod(used, num_years * len(labels) * 2) if num_cells else (used, used)
+    year_index, rest = np.divmod(rest, len(labels) * 2)
+    bracket_index, complete_index = np.divmod(rest, 2)
+    cube = pd.DataFrame({
+        'creation_year': (year_index + first_year).astype(str),
+        'word_bracket': np.array(labels)[bracket_index],
+        'complete': complete_index,
+        'num_works': num_works[used],
+        'total_words': total_words[used].astype(np.int64),
+        'max_words': max_words[used]
+    })
+    if grouped:
+        cube['group'] = group_index
+    return cube
+
+def filter_works(store: dict, work_ids: np.ndarray, filters: dict = None) -> np.ndarray:
+    """
+    Keep the works matching the filters, with vectorized masks over the typed columns.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        work_ids (np.ndarray): Work IDs to filter.
+        filters (dict): Filters, as returned by processing.normalize_filters
+                        (None or empty keeps every work).
+
+    Returns:
+        work_ids (np.ndarray): Work IDs matching every filter.
+    """
+    if not filters and 'removed_version' not in store:
+        return work_ids
+    check_cancelled()
+    filters = filters or {}
+    work_ids = np.asarray(work_ids)
+    mask = np.ones(len(work_ids), dtype=bool)
+    if 'languages' in filters:
+        codes = np.flatnonzero(np.isin(store['languages'], filters['languages']))
+        mask &= np.isin(store['language'][work_ids], codes)
+    for column in ['restricted', 'complete']:
+        if column in filters:
+            mask &= store[column][work_ids] == int(filters[column])
+    if 'years' in filters:
+        first, last = filters['years']
+        years = store['creation_year'][work_ids]
+        mask &= (years >= first) & (years <= last)
+    if 'snapshot' in filters:
+        # Works added by that dump or an earlier one, and not removed by then
+        snapshot = filters['snapshot']
+        if 'first_version' in store:
+            mask &= store['first_version'][work_ids] <= snapshot
+        if 'removed_version' in store:
+            removed = store['removed_version'][work_ids]
+            mask &= (removed == 0) | (removed > snapshot)
+    elif 'removed_version' in store:
+        # Works in the latest dump
+        mask &= store['removed_version'][work_ids] == 0
+    return work_ids[mask]
+
+def columnar_aggregate_tag(tag_id: int, filters: dict = None) -> pd.DataFrame:
+    """
+    Count the works paired with the given tag using the columnar store.
+    A tag's works are a slice of the memory-mapped postings, so nothing is fetched 
+    again when only the filters change.
+
+    Parameters:
+        tag_id (int): Tag ID, as found in the tags table.
+        filters (dict): Filters, as returned by processing.normalize_filters.
+
+    Returns:
+        cube (pd.DataFrame): Grouped counts in the same form as processing.aggregate_tag,
+                             or None if the columnar store has not been built.
+    """
+    store = load_columnar_store()
+    if store is None:
+        return None
+    return aggregate_work_ids(store, filter_works(store, tag_work_ids(store, int(tag_id)), filters))
+
+def columnar_aggregate_tags(tag_ids: list, filters: dict = None) -> pd.DataFrame:
+    """
+    Count the works of several tags at once using the columnar store: the tags' (filtered)
+    postings are concatenated and counted in one bincount pass, labelled with their tag.
+
+    Parameters:
+        tag_ids (list): Tag IDs, as found in the tags table.
+        filters (dict): Filters, as returned by processing.normalize_filters.
+
+    Returns:
+        cube (pd.DataFrame): Grouped counts in the same form as processing.aggregate_tags,
+                             or None if the columnar store has not been built.
+    """
+    store = load_columnar_store()
+    if store is None:
+        return None
+    postings = [filter_works(store, tag_work_ids(store, int(tag_id)), filters) for tag_id in tag_ids]
+    work_ids = np.concatenate(postings) if postings else np.empty(0, dtype=np.int32)
+    groups = np.repeat(np.arange(len(postings)), [len(posting) for posting in postings])
+    cube = aggregate_work_ids(store, work_ids, groups)
+    cube['tag_id'] = np.asarray(tag_ids, dtype=np.int64)[cube.pop('group').to_numpy()]
+    return cube
+
+def contains_sorted(haystack: np.ndarray, needles: np.ndarray) -> np.ndarray:
+    """
+    Check which of the needles appear in the sorted haystack, using binary search,
+    so the cost depends on the number of needles rather than the size of the haystack.
+
+    Parameters:
+        haystack (np.ndarray): Sorted array of work IDs.
+        needles (np.ndarray): Work IDs to look for.
+
+    Returns:
+        found (np.ndarray): Boolean array, True where the needle is in the haystack.
+    """
+    if len(haystack) == 0:
+        return np.zeros(len(needles), dtype=bool)
+    positions = np.searchsorted(haystack, needles).clip(max=len(haystack) - 1)
+    return haystack[positions] == needles
+
+def union_postings(store: dict, tag_ids: list) -> np.ndarray:
+    """
+    Merge the sorted work IDs of several tags into one sorted array without duplicates.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        tag_ids (list): Tag IDs, as found in the tags table.
+
+    Returns:
+        work_ids (np.ndarray): Sorted array of unique work IDs using any of the tags.
+    """
+    postings = [tag_work_ids(store, int(tag_id)) for tag_id in tag_ids]
+    # A single tag's postings are sorted and unique already, so they are used without a copy
+    if len(postings) == 1:
+        return postings[0]
+    return np.unique(np.concatenate(postings))
+
+def combine_postings(store: dict, include: list, exclude: list) -> np.ndarray:
+    """
+    Find the works matching a multi-tag query by intersecting the postings of the include groups
+    and removing the postings of the exclude groups.
+    The smallest group is taken first, and every other group is only probed
+    for the works still remaining, so huge tags are never copied.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        include (list): List of OR groups (lists of tag IDs) that works must match.
+        exclude (list): List of OR groups (lists of tag IDs) that works must not match.
+
+    Returns:
+        work_ids (np.ndarray): Sorted array of matching work IDs.
+    """
+    def group_size(group: list) -> int:
+        # Postings are slices, so their lengths cost nothing
+        return sum(len(tag_work_ids(store, int(tag_id))) for tag_id in group)
+
+    include = sorted(include, key=group_size)
+    work_ids = union_postings(store, include[0])
+    # Keep works found in at least one tag of every other include group,
+    # and in no tag of any exclude group
+    for group, keep in [(group, True) for group in include[1:]] + [(group, False) for group in exclude]:
+        check_cancelled()
+        found = np.zeros(len(work_ids), dtype=bool)
+        for tag_id in group:
+            found |= contains_sorted(tag_work_ids(store, int(tag_id)), work_ids)
+        work_ids = work_ids[found if keep else ~found]
+    return work_ids
+
+@functools.lru_cache(maxsize=16)
+def query_work_ids(include: tuple, exclude: tuple, version: tuple) -> np.ndarray:
+    """
+    Find the works matching a multi-tag query with combine_postings, keeping the most recent
+    queries' work sets so changing the filters doesn't combine the postings again.
+
+    Parameters:
+        include (tuple): Tuple of OR groups (tuples of tag IDs) that works must match.
+        exclude (tuple): Tuple of OR groups (tuples of tag IDs) that works must not match.
+        version (tuple): Version of the columnar store (see store_version), so the works are
+                         found again in a newer store.
+
+    Returns:
+        work_ids (np.ndarray): Sorted, read-only array of matching work IDs.
+    """
+    work_ids = combine_postings(open_columnar_store(COLUMNS_DIR, version),
+                                [list(group) for group in include],
+                                [list(group) for group in exclude])
+    # Shared between requests, so it must not be changed
+    work_ids.flags.writeable = False
+    return work_ids
+
+def columnar_aggregate_query(include: list, exclude: list, filters: dict = None) -> pd.DataFrame:
+    """
+    Count the works matching a multi-tag query using the columnar store.
+
+    Parameters:
+        include (list): List of OR groups (lists of tag IDs) that works must match.
+        exclude (list): List of OR groups (lists of tag IDs) that works must not match.
+        filters (dict): Filters, as returned by processing.normalize_filters.
+
+    Returns:
+        cube (pd.DataFrame): Grouped counts in the same form as processing.aggregate_tag,
+                             or None if the columnar store has not been built.
+    """
+    store = load_columnar_store()
+    if store is None:
+        return None
+    work_ids = query_work_ids(tuple(tuple(int(tag_id) for tag_id in group) for group in include),
+                              tuple(tuple(int(tag_id) for tag_id in group) for group in exclude),
+                              store_version())
+    return aggregate_work_ids(store, filter_works(store, work_ids, filters))
+
+def work_periods(store: dict, work_ids: np.ndarray, granularity: str) -> np.ndarray:
+    """
+    Get the time series period of each work from the integer date columns.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        work_ids (np.ndarray): Work IDs.
+        granularity (str): "year", "month", or "week" (see processing.TIME_GRANULARITIES).
+
+    Returns:
+        periods (np.ndarray): Period numbers, as returned by processing.day_periods.
+    """
+    if granularity == 'year':
+        return store['creation_year'][work_ids].astype(np.int64) - 1970
+    if granularity == 'month' and 'creation_month' in store:
+        return store['creation_month'][work_ids].astype(np.int64)
+    # Weeks (and months in stores built before the month column) come from the day
+    return day_periods(store['creation_day'][work_ids], granularity)
+
+def select_work_ids(store: dict, include: list, exclude: list) -> np.ndarray:
+    """
+    Find the works of a tag from its postings, or of a multi-tag query with query_work_ids.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        include (list): List of OR groups (lists of tag IDs) that works must match.
+        exclude (list): List of OR groups (lists of tag IDs) that works must not match.
+
+    Returns:
+        work_ids (np.ndarray): Sorted array of matching work IDs.
+    """
+    if len(include) == 1 and len(include[0]) == 1 and not exclude:
+        return tag_work_ids(store, int(include[0][0]))
+    return query_work_ids(tuple(tuple(int(tag_id) for tag_id in group) for group in include),
+                          tuple(tuple(int(tag_id) for tag_id in group) for group in exclude),
+                          store_version())
+
+def columnar_count_periods(include: list, exclude: list, granularity: str, 
+                           filters: dict = None) -> tuple:
+    """
+    Count the works of a tag or multi-tag query per year, month, or week using the columnar
+    store, with one bincount over the works' integer periods.
+
+    Parameters:
+        include (list): List of OR groups (lists of tag IDs) that works must match.
+        exclude (list): List of OR groups (lists of tag IDs) that works must not match.
+        granularity (str): "year", "month", or "week" (see processing.TIME_GRANULARITIES).
+        filters (dict): Filters, as returned by processing.normalize_filters.
+
+    Returns:
+        Tuple, or None if the columnar store has not been built:
+            - first (int): Number of the first period with works.
+            - counts (np.ndarray): Number of works in each period from the first one on.
+    """
+    store = load_columnar_store()
+    if store is None:
+        return None
+    work_ids = filter_works(store, select_work_ids(store, include, exclude), filters)
+    check_cancelled()
+    # Leave out works with missing values, and works whose creation date couldn't be read
+    # (saved as year 0), like the SQL queries do
+    work_ids = work_ids[store['valid'][work_ids] & (store['creation_year'][work_ids] > 0)]
+    periods = work_periods(store, work_ids, granularity)
+    check_cancelled()
+    first = int(periods.min()) if len(periods) else 0
+    return first, np.bincount(periods - first)
+
+def columnar_count_word_bins(include: list, exclude: list, filters: dict = None) -> np.ndarray:
+    """
+    Count the works of a tag or multi-tag query per word count bin (see 
+    processing.WORD_BIN_EDGES) using the columnar store, with one bincount over 
+    the works' precomputed bins.
+
+    Parameters:
+        include (list): List of OR groups (lists of tag IDs) that works must match.
+        exclude (list): List of OR groups (lists of tag IDs) that works must not match.
+        filters (dict): Filters, as returned by processing.normalize_filters.
+
+    Returns:
+        counts (np.ndarray): Number of works in each of the processing.NUM_WORD_BINS bins,
+                             or None if the columnar store has not been built.
+    """
+    store = load_columnar_store()
+    if store is None:
+        return None
+    work_ids = filter_works(store, select_work_ids(store, include, exclude), filters)
+    check_cancelled()
+    # Leave out works with missing values, like the SQL queries do
+    work_ids = work_ids[store['valid'][work_ids]]
+    if 'word_bin' in store:
+        bins = store['word_bin'][work_ids]
+    else:
+        # Stores built before the bin column find the bins from the word counts
+        bins = work_word_bins(store['word_count'][work_ids])
+    check_cancelled()
+    return np.bincount(bins, minlength=NUM_WORD_BINS)
+
+def columnar_filter_options() -> dict:
+    """
+    Get the values the filters can take from the columnar store: every language 
+    with its number of works, most used first, and the first and last creation years.
+
+    Returns:
+        options (dict): Dictionary with "languages" (list of (code, number of works)) and
+                        "years" ((first, last)), or None if the store has not been built.
+    """
+    store = load_columnar_store()
+    if store is None:
+        return None
+    valid = np.asarray(store['valid'])
+    if 'removed_version' in store:
+        # Works in the latest dump
+        valid = valid & (np.asarray(store['removed_version']) == 0)
+    # Valid works always have a language
+    counts = np.bincount(store['language'][valid], minlength=len(store['languages']))
+    years = store['creation_year'][valid]
+    order = np.argsort(-counts, kind='stable')
+    return {'languages': [(str(store['languages'][code]), int(counts[code])) 
+                          for code in order if counts[code]],
+            'years': (int(years.min()), int(years.max())) if len(years) else (0, 0)}
+
+def update_columnar_store(first_work_id: int, pair_works: np.ndarray, pair_tags: np.ndarray,
+                          removed: np.ndarray, version: int, directory: str = COLUMNS_DIR) -> bool:
+    """
+    Apply a newer dump's changes to the columnar store without rebuilding it: the added works
+    are written into the spare rows of the works columns, the removed works are marked with
+    the dump version, and the added work-tag pairs are merged into the delta postings, which
+    tag_work_ids reads after the postings the store was built with. The changes are made in
+    a new folder, which is then swapped in, so processes reading the store never see a 
+    half-applied dump: only valid and removed_version, whose rows those processes read, are
+    copied into it. The other files are linked, and the works columns are written in place,
+    since the dump only writes their spare rows, which are never valid in the old copy.
+
+    Parameters:
+        first_work_id (int): First work ID added by the dump (the works from there on are written).
+        pair_works (np.ndarray): Work ID of each work-tag pair added by the dump.
+        pair_tags (np.ndarray): Tag ID of each work-tag pair added by the dump.
+        removed (np.ndarray): Work IDs of the works removed by the dump.
+        version (int): Version of the dump.
+        directory (str): Folder of the columnar store.
+
+    Returns:
+        boolean: True if the store was updated, False if it has to be rebuilt instead 
+                 (it is missing or predates a column, it has no spare rows left, or the 
+                 delta postings would grow past DELTA_MERGE_RATIO of the postings).
+    """
+    store = load_columnar_store(directory)
+    if store is None or not set(WORK_COLUMNS) <= set(store):
+        return False
+    # Earlier delta postings plus the dump's pairs
+    pair_works = np.asarray(pair_works, dtype=np.int64)
+    pair_tags = np.asarray(pair_tags, dtype=np.int64)
+    if 'delta_offsets' in store:
+        delta_offsets = np.asarray(store['delta_offsets'])
+        pair_tags = np.concatenate([np.repeat(np.arange(len(delta_offsets) - 1), np.diff(delta_offsets)),
+                                    pair_tags])
+        pair_works = np.concatenate([np.asarray(store['delta_works'], dtype=np.int64), pair_works])
+    if len(pair_works) > DELTA_MERGE_RATIO * len(store['tag_works']):
+        return False
+    capacity = len(store['valid'])
+    with sqlite3.connect(DB_PATH) as conn:
+        cur = conn.cursor()
+        if (cur.execute("SELECT MAX(work_id) FROM works").fetchone()[0] or 0) >= capacity:
+            return False
+        compact = is_compact(conn)
+        # Languages first seen in this dump go at the end of the list
+        languages = [str(language) for language in store['languages']]
+        if compact:
+            rows = cur.execute("SELECT id, code FROM languages ORDER BY id").fetchall()
+            languages += [code for _, code in rows if code not in languages]
+            language_codes = {language_id: languages.index(code) for language_id, code in rows}
+        else:
+            codes = [row[0] for row in cur.execute("""
+                SELECT DISTINCT language FROM works WHERE work_id >= ? AND language IS NOT NULL 
+                ORDER BY language
+                """, (first_work_id,))]
+            languages += [code for code in codes if code not in languages]
+            language_codes = {language: code for code, language in enumerate(languages)}
+        # The columns whose visible rows change are copied, the files rewritten below are
+        # left out, and the rest are linked (so the spare rows are written in place)
+        building = directory + '.tmp'
+        shutil.rmtree(building, ignore_errors=True)
+        os.makedirs(building)
+        for file in os.listdir(directory):
+            name, extension = os.path.splitext(file)
+            if extension != '.npy' or name in ('languages', 'delta_works', 'delta_offsets'):
+                continue
+            if name in ('valid', 'removed_version'):
+                shutil.copyfile(os.path.join(directory, file), os.path.join(building, file))
+            else:
+                os.link(os.path.join(directory, file), os.path.join(building, file))
+        arrays = {name: np.load(os.path.join(building, f'{name}.npy'), mmap_mode='r+')
+                  for name in WORK_COLUMNS}
+        for name, dtype in VERSION_COLUMNS.items():
+            path = os.path.join(building, f'{name}.npy')
+            if name in store:
+                arrays[name] = np.load(path, mmap_mode='r+')
+            else:
+                # First update since the store was built: every earlier work is in the first dump
+                arrays[name] = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, 
+                                                         shape=(capacity,))
+                if name == 'first_version':
+                    arrays[name][:first_work_id] = 1
+        query = work_columns_query(compact, True)
+        for chunk in pd.read_sql_query(query, conn, params=(first_work_id - 1,), chunksize=500000):
+            fill_work_columns(arrays, chunk, compact, language_codes)
+    arrays['removed_version'][np.asarray(removed, dtype=np.int64)] = version
+    for array in arrays.values():
+        array.flush()
+    np.save(os.path.join(building, 'languages.npy'), np.array(languages, dtype=str))
+    # Delta postings in (tag, work) order, as CSR postings like the ones the store was built with
+    order = np.lexsort((pair_works, pair_tags))
+    pair_tags, pair_works = pair_tags[order], pair_works[order]
+    num_tags = int(pair_tags[-1]) + 1 if len(pair_tags) else 0
+    delta_offsets = np.zeros(num_tags + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_tags, minlength=num_tags), out=delta_offsets[1:])
+    np.save(os.path.join(building, 'delta_works.npy'), pair_works.astype(np.int32))
+    np.save(os.path.join(building, 'delta_offsets.npy'), delta_offsets)
+    swap_store(building, directory)
+    return True
+
+# Tag types shown in the related tags panel, and how many tags of each type are kept per tag
+RELATED_TYPES = ['Fandom', 'Relationship', 'Character', 'Freeform']
+RELATED_TOP_K = 10
+
+# Most co-occurring tags gathered at once (per worker) when counting, which bounds memory use
+RELATED_CHUNK_PAIRS = 4_000_000
+
+# Share of the work of counting every tag's related tags (the co-occurring tags it gathers) 
+# that completing the lists a newer dump has opened may take (see settle_related_lists), 
+# before every tag is counted again instead
+RELATED_SETTLE_RATIO = 0.5
+
+# Arrays used by count_related_chunk, set in each worker process by init_related_worker
+related_arrays = {}
+
+def expand_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Get every index of the given ranges, concatenated, without a Python loop
+    (e.g. starts [10, 40] and lengths [2, 3] give [10, 11, 40, 41, 42]).
+
+    Parameters:
+        starts (np.ndarray): First index of each range.
+        lengths (np.ndarray): Length of each range.
+
+    Returns:
+        indexes (np.ndarray): Indexes of all ranges, in order.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    if not len(ends) or not ends[-1]:
+        return np.empty(0, dtype=np.int64)
+    return np.arange(ends[-1]) - np.repeat(ends - lengths - starts, lengths)
+
+def merge_delta_postings(store: dict, directory: str) -> dict:
+    """
+    Merge the delta postings of the works added since the store was built (see
+    update_columnar_store) into one copy of the tag postings, written in chunks straight to
+    .npy files so memory use stays flat. Each tag's added works come after its other works,
+    so every tag's postings stay sorted.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        directory (str): Folder to save tag_offsets.npy and tag_works.npy in.
+
+    Returns:
+        postings (dict): The merged tag_offsets and memory-mapped tag_works arrays.
+    """
+    sizes = {}
+    for name in ('tag', 'delta'):
+        offsets = np.asarray(store[f'{name}_offsets'])
+        sizes[name] = np.diff(offsets)
+    num_tags = max(len(sizes['tag']), len(sizes['delta']))
+    for name in sizes:
+        sizes[name] = np.pad(sizes[name], (0, num_tags - len(sizes[name])))
+    tag_offsets = np.zeros(num_tags + 1, dtype=np.int64)
+    np.cumsum(sizes['tag'] + sizes['delta'], out=tag_offsets[1:])
+    np.save(os.path.join(directory, 'tag_offsets.npy'), tag_offsets)
+    tag_works = np.lib.format.open_memmap(os.path.join(directory, 'tag_works.npy'), mode='w+',
+                                          dtype=np.int32, shape=(int(tag_offsets[-1]),))
+    # Each tag's works move by the same amount: the earlier tags' added works go before them,
+    # and the tag's own works before its added ones
+    shifts = {'tag': tag_offsets[:-1] - np.r_[0, np.cumsum(sizes['tag'])[:-1]],
+              'delta': tag_offsets[:-1] + sizes['tag'] - np.r_[0, np.cumsum(sizes['delta'])[:-1]]}
+    for name in ('tag', 'delta'):
+        offsets, works = np.asarray(store[f'{name}_offsets']), store[f'{name}_works']
+        for start in range(0, len(works), RELATED_CHUNK_PAIRS):
+            positions = np.arange(start, min(start + RELATED_CHUNK_PAIRS, len(works)))
+            tags = np.searchsorted(offsets, positions, side='right') - 1
+            tag_works[positions + shifts[name][tags]] = works[start:start + RELATED_CHUNK_PAIRS]
+    tag_works.flush()
+    return {'tag_offsets': tag_offsets,
+            'tag_works': np.load(os.path.join(directory, 'tag_works.npy'), mmap_mode='r')}
+
+def transpose_postings(store: dict, directory: str) -> dict:
+    """
+    Turn the tag postings around into CSR work postings (each work's sorted tag IDs,
+    work_tags[work_offsets[work_id]:work_offsets[work_id + 1]]) with a chunked counting sort,
+    written straight to .npy files so memory use stays flat. Works removed by a newer dump
+    are left out, so they don't count towards any tag.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        directory (str): Folder to save work_offsets.npy and work_tags.npy in.
+
+    Returns:
+        postings (dict): Memory-mapped work_offsets and work_tags arrays, and tag_sizes,
+                         the number of works kept for each tag ID.
+    """
+    tag_offsets = np.asarray(store['tag_offsets'])
+    tag_works = store['tag_works']
+    removed = store.get('removed_version')
+    num_works = len(store['valid'])
+    chunk_size = RELATED_CHUNK_PAIRS
+    # Number of tags of each work, then where each work's tags start
+    work_sizes = np.zeros(num_works, dtype=np.int64)
+    for start in range(0, len(tag_works), chunk_size):
+        works = tag_works[start:start + chunk_size]
+        if removed is not None:
+            works = works[removed[works] == 0]
+        work_sizes += np.bincount(works, minlength=num_works)
+    work_offsets = np.zeros(num_works + 1, dtype=np.int64)
+    np.cumsum(work_sizes, out=work_offsets[1:])
+    np.save(os.path.join(directory, 'work_offsets.npy'), work_offsets)
+    work_tags = np.lib.format.open_memmap(os.path.join(directory, 'work_tags.npy'),
+                                          mode='w+', dtype=np.int32, shape=(int(work_offsets[-1]),))
+    tag_sizes = np.zeros(len(tag_offsets) - 1, dtype=np.int64)
+    # Next free slot of each work
+    cursor = work_offsets[:-1].copy()
+    for start in range(0, len(tag_works), chunk_size):
+        works = np.asarray(tag_works[start:start + chunk_size], dtype=np.int64)
+        # The pairs are in tag order, so the tag of each pair comes from the tag offsets
+        tags = np.searchsorted(tag_offsets, np.arange(start, start + len(works)), side='right') - 1
+        if removed is not None:
+            kept = removed[works] == 0
+            works, tags = works[kept], tags[kept]
+        tag_sizes += np.bincount(tags, minlength=len(tag_sizes))
+        # A stable sort by work keeps each work's tags in increasing order
+        order = np.argsort(works, kind='stable')
+        works, tags = works[order], tags[order]
+        first = np.r_[True, works[1:] != works[:-1]]
+        run_starts = np.flatnonzero(first)
+        within = np.arange(len(works)) - np.repeat(run_starts, np.diff(np.r_[run_starts, len(works)]))
+        work_tags[cursor[works] + within] = tags
+        cursor[works[run_starts]] += np.diff(np.r_[run_starts, len(works)])
+    work_tags.flush()
+    return {'work_offsets': work_offsets,
+            'work_tags': np.load(os.path.join(directory, 'work_tags.npy'), mmap_mode='r'),
+            'tag_sizes': tag_sizes}
+
+def init_related_worker(directory: str, postings_directory: str, tag_types: np.ndarray,
+                        tag_sizes: np.ndarray, num_works: int, top_k: int) -> None:
+    """
+    Gives a co-occurrence worker process the memory-mapped postings and the tags' types, once,
+    instead of with every chunk.
+
+    Parameters:
+        directory (str): Folder of the tag postings (the columnar store, or the merged copy
+                         written by merge_delta_postings).
+        postings_directory (str): Folder of the work postings written by transpose_postings.
+        tag_types (np.ndarray): Index into RELATED_TYPES of each tag ID (-1 for other types).
+        tag_sizes (np.ndarray): Number of works of each tag ID, as counted by transpose_postings.
+        num_works (int): Number of works with at least one tag.
+        top_k (int): Number of related tags to keep per tag and type.
+
+    Returns:
+        None
+    """
+    global related_arrays
+    related_arrays = {
+        'tag_offsets': np.load(os.path.join(directory, 'tag_offsets.npy')),
+        'tag_works': np.load(os.path.join(directory, 'tag_works.npy'), mmap_mode='r'),
+        'work_offsets': np.load(os.path.join(postings_directory, 'work_offsets.npy'), mmap_mode='r'),
+        'work_tags': np.load(os.path.join(postings_directory, 'work_tags.npy'), mmap_mode='r'),
+        'tag_types': tag_types,
+        'tag_sizes': tag_sizes,
+        'num_works': num_works,
+        'top_k': top_k
+    }
+    return None
+
+def count_related_chunk(tag_ids: np.ndarray) -> tuple:
+    """
+    Count how many works each of the given tags shares with every other tag, and keep the
+    top tags of each related type with their lift (how much more often the two tags appear
+    together than they would by chance). The co-occurring tags are gathered from the work
+    postings of the tags' works and counted sparsely with np.unique, except for a single
+    huge tag, whose works are counted in slices into one dense bincount.
+
+    Parameters:
+        tag_ids (np.ndarray): Tag IDs to count, as planned by related_chunks.
+
+    Returns:
+        Tuple of arrays with one item per kept related tag, sorted by tag, type, and rank:
+            - tag_ids (np.ndarray): Tag ID.
+            - types (np.ndarray): Index into RELATED_TYPES of the related tag's type.
+            - ranks (np.ndarray): Rank of the related tag among the tag's related tags of that type.
+            - related_ids (np.ndarray): Related tag ID.
+            - counts (np.ndarray): Number of works using both tags.
+            - lifts (np.ndarray): Lift of the pair.
+    """
+    arrays = related_arrays
+    tag_offsets, tag_works = arrays['tag_offsets'], arrays['tag_works']
+    work_offsets, work_tags = arrays['work_offsets'], arrays['work_tags']
+    tag_types = arrays['tag_types']
+    num_tags = len(tag_offsets) - 1
+    tag_ids = np.asarray(tag_ids, dtype=np.int64)
+    starts = tag_offsets[tag_ids]
+    sizes = tag_offsets[tag_ids + 1] - starts
+    if len(tag_ids) == 1:
+        # One tag at a time (planned alone when it is too big to gather at once):
+        # add up its works' tags in slices
+        counts = np.zeros(num_tags, dtype=np.int64)
+        average_tags = max(len(work_tags) / max(len(work_offsets) - 1, 1), 1.0)
+        step = max(int(RELATED_CHUNK_PAIRS / average_tags), 1)
+        for start in range(int(starts[0]), int(starts[0] + sizes[0]), step):
+            works = np.asarray(tag_works[start:min(start + step, starts[0] + sizes[0])], dtype=np.int64)
+            work_starts = work_offsets[works]
+            related = work_tags[expand_ranges(work_starts, work_offsets[works + 1] - work_starts)]
+            counts += np.bincount(related, minlength=num_tags)
+        related = np.flatnonzero(counts)
+        sources = np.full(len(related), tag_ids[0])
+        counts = counts[related]
+    else:
+        # Several smaller tags: gather all their works' tags, labelled with the source tag,
+        # and count each (source, related) pair
+        works = np.asarray(tag_works[expand_ranges(starts, sizes)], dtype=np.int64)
+        work_starts = work_offsets[works]
+        work_sizes = work_offsets[works + 1] - work_starts
+        related = work_tags[expand_ranges(work_starts, work_sizes)].astype(np.int64)
+        source_index = np.repeat(np.repeat(np.arange(len(tag_ids)), sizes), work_sizes)
+        keys, counts = np.unique(source_index * num_tags + related, return_counts=True)
+        sources = tag_ids[keys // num_tags]
+        related = keys % num_tags
+    types = tag_types[related]
+    # A tag always co-occurs with itself, and only some types are shown
+    keep = (related != sources) & (types >= 0)
+    sources, related, counts, types = sources[keep], related[keep], counts[keep], types[keep]
+    # Most shared works first within each (tag, type) group, ties broken by tag ID
+    order = np.lexsort((related, -counts, types, sources))
+    sources, related, counts, types = sources[order], related[order], counts[order], types[order]
+    first = np.r_[True, (sources[1:] != sources[:-1]) | (types[1:] != types[:-1])]
+    group_starts = np.flatnonzero(first)
+    ranks = np.arange(len(sources)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(sources)]))
+    keep = ranks < arrays['top_k']
+    sources, related, counts, types, ranks = (sources[keep], related[keep], counts[keep],
+                                              types[keep], ranks[keep])
+    tag_sizes = arrays['tag_sizes']
+    lifts = counts * arrays['num_works'] / (tag_sizes[sources] * tag_sizes[related])
+    return sources, types, ranks, related, counts, lifts
+
+def related_chunks(tag_sizes: np.ndarray, average_tags: float) -> list:
+    """
+    Split the tags into chunks that each gather about RELATED_CHUNK_PAIRS co-occurring tags,
+    so many small tags are counted together and a huge tag is counted on its own.
+
+    Parameters:
+        tag_sizes (np.ndarray): Number of works of each tag ID.
+        average_tags (float): Average number of tags per work.
+
+    Returns:
+        chunks (list): List of arrays of tag IDs.
+    """
+    tag_ids = np.flatnonzero(tag_sizes)
+    cumulative = np.cumsum(tag_sizes[tag_ids] * average_tags)
+    chunks = []
+    start = 0
+    while start < len(tag_ids):
+        base = cumulative[start - 1] if start else 0.0
+        end = max(int(np.searchsorted(cumulative, base + RELATED_CHUNK_PAIRS, side='right')),
+                  start + 1)
+        chunks.append(tag_ids[start:end])
+        start = end
+    return chunks
+
+def count_related(chunks: list, init_args: tuple, workers: int = 1):
+    """
+    Runs count_related_chunk over the chunks, in worker processes if workers > 1,
+    yielding the results in order. At most two chunks per worker are in flight.
+
+    Parameters:
+        chunks (list): Chunks of tag IDs, as returned by related_chunks.
+        init_args (tuple): Arguments of init_related_worker.
+        workers (int): Number of worker processes (1 counts in this process).
+
+    Yields:
+        Result of count_related_chunk for each chunk, in order.
+    """
+    # Worker processes are forked, so they never re-import app.py and share the memory maps
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=init_related_worker,
+                                 initargs=init_args) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(count_related_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    else:
+        init_related_worker(*init_args)
+        for chunk in chunks:
+            yield count_related_chunk(chunk)
+
+def build_related_tags(top_k: int = RELATED_TOP_K, workers: int = 1,
+                       directory: str = COLUMNS_DIR) -> None:
+    """
+    Creates the related_tags table: for every tag, the top_k tags of each RELATED_TYPES type
+    that share the most works with it, with the number of shared works and the lift.
+    Co-occurrences are counted from the columnar store's postings in chunks (see
+    count_related_chunk), so this never runs a self-join of work_tag_pairs in SQL.
+    The works added by newer dumps are counted too, from a merged copy of the postings
+    (see merge_delta_postings) when the store hasn't been rebuilt since.
+
+    Parameters:
+        top_k (int): Number of related tags to keep per tag and type.
+        workers (int): Number of worker processes counting co-occurrences.
+        directory (str): Folder of the columnar store (it must have been built).
+
+    Returns:
+        None
+    """
+    start_time = time.perf_counter()
+    store = load_columnar_store(directory)
+    # The work postings are only needed while counting
+    postings_directory = directory + '.related'
+    shutil.rmtree(postings_directory, ignore_errors=True)
+    os.makedirs(postings_directory)
+    try:
+        # The workers read the tag postings from wherever the merged copy is
+        tags_directory = directory
+        if 'delta_offsets' in store:
+            store = dict(store, **merge_delta_postings(store, postings_directory))
+            tags_directory = postings_directory
+        postings = transpose_postings(store, postings_directory)
+        tag_sizes = postings['tag_sizes']
+        num_works = int(np.count_nonzero(np.diff(postings['work_offsets'])))
+        average_tags = len(postings['work_tags']) / max(num_works, 1)
+        with sqlite3.connect(DB_PATH) as conn:
+            cur = conn.cursor()
+            # Type of each tag, as an index into RELATED_TYPES
+            tag_types = np.full(len(tag_sizes), -1, dtype=np.int8)
+            for tag_id, tag_type in cur.execute("SELECT id, type FROM tags"):
+                if tag_id < len(tag_types) and tag_type in RELATED_TYPES:
+                    tag_types[tag_id] = RELATED_TYPES.index(tag_type)
+            # Replace any partially built table from an earlier run
+            cur.execute("DROP TABLE IF EXISTS related_tags")
+            cur.execute("""
+            CREATE TABLE related_tags (
+            tag_id INTEGER,
+            related_type TEXT,
+            rank INTEGER,
+            related_id INTEGER,
+            num_works INTEGER,
+            lift REAL,
+            PRIMARY KEY (tag_id, related_type, rank)
+            ) WITHOUT ROWID;
+            """)
+            init_args = (tags_directory, postings_directory, tag_types, tag_sizes, num_works, top_k)
+            num_rows = 0
+            for sources, types, ranks, related, counts, lifts in count_related(
+                    related_chunks(tag_sizes, average_tags), init_args, workers):
+                cur.executemany("INSERT INTO related_tags VALUES (?, ?, ?, ?, ?, ?)",
+                                zip(sources.tolist(), np.array(RELATED_TYPES)[types].tolist(),
+                                    ranks.tolist(), related.tolist(), counts.tolist(),
+                                    np.round(lifts, 3).tolist()))
+                num_rows += len(sources)
+            # The tags' sizes and the number of works, which the lifts are computed from, 
+            # so update_related_table can bring the lifts up to date after a newer dump
+            save_related_sizes(cur, tag_sizes, num_works)
+            conn.commit()
+    finally:
+        shutil.rmtree(postings_directory, ignore_errors=True)
+    elapsed = time.perf_counter() - start_time
+    print(f"Found {num_rows:,} related tags for {np.count_nonzero(tag_sizes):,} tags "
+          f"in {elapsed:.1f}s")
+    return None
+
+def save_related_sizes(cur: sqlite3.Cursor, tag_sizes: np.ndarray, num_works: int) -> None:
+    """
+    Creates the related_tag_sizes table: the number of works of each tag with any, as counted
+    for the related tags, with the number of works with any tag under tag ID 0 
+    (which no tag has).
+
+    Parameters:
+        cur (sqlite3.Cursor): Cursor of the connection building related_tags.
+        tag_sizes (np.ndarray): Number of works of each tag ID.
+        num_works (int): Number of works with at least one tag.
+
+    Returns:
+        None
+    """
+    cur.execute("DROP TABLE IF EXISTS related_tag_sizes")
+    cur.execute("""
+    CREATE TABLE related_tag_sizes (
+    tag_id INTEGER PRIMARY KEY,
+    num_works INTEGER
+    ) WITHOUT ROWID;
+    """)
+    tag_ids = np.flatnonzero(tag_sizes)
+    cur.executemany("INSERT INTO related_tag_sizes VALUES (?, ?)",
+                    zip([0] + tag_ids.tolist(), [int(num_works)] + tag_sizes[tag_ids].tolist()))
+    return None
+
+def pair_cooccurrences(pair_works: np.ndarray, pair_tags: np.ndarray, num_tags: int) -> tuple:
+    """
+    Count how many of the given works each two different tags share, from the works' 
+    work-tag pairs alone, gathering about RELATED_CHUNK_PAIRS tag pairs at a time.
+
+    Parameters:
+        pair_works (np.ndarray): Work ID of each work-tag pair.
+        pair_tags (np.ndarray): Tag ID of each work-tag pair.
+        num_tags (int): Number larger than every tag ID.
+
+    Returns:
+        Tuple of arrays with one item per pair of tags sharing works, sorted by tag:
+            - keys (np.ndarray): Tag ID times num_tags plus the other tag's ID.
+            - counts (np.ndarray): Number of works using both tags.
+    """
+    if not len(pair_works):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    order = np.lexsort((pair_tags, pair_works))
+    works = np.asarray(pair_works, dtype=np.int64)[order]
+    tags = np.asarray(pair_tags, dtype=np.int64)[order]
+    run_starts = np.flatnonzero(np.r_[True, works[1:] != works[:-1]])
+    run_lengths = np.diff(np.r_[run_starts, len(works)])
+    # Each pair is matched with every pair of its work, so a work of n tags gives n * n
+    starts = np.repeat(run_starts, run_lengths)
+    lengths = np.repeat(run_lengths, run_lengths)
+    ends = np.cumsum(lengths)
+    keys, counts = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    first = 0
+    while first < len(tags):
+        base = ends[first - 1] if first else 0
+        last = max(int(np.searchsorted(ends, base + RELATED_CHUNK_PAIRS, side='right')), first + 1)
+        sources = np.repeat(tags[first:last], lengths[first:last])
+        related = tags[expand_ranges(starts[first:last], lengths[first:last])]
+        other = sources != related
+        chunk_keys, chunk_counts = np.unique(sources[other] * num_tags + related[other],
+                                             return_counts=True)
+        keys.append(chunk_keys)
+        counts.append(chunk_counts)
+        first = last
+    keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    return keys, np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+
+def shared_works(store: dict, tag_ids: np.ndarray, related_ids: np.ndarray) -> np.ndarray:
+    """
+    Count the works of the latest dump each pair of tags shares, from the columnar store's
+    postings: the smaller tag's works are looked up in the larger tag's, and the pairs with
+    the same larger tag are counted together.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        tag_ids (np.ndarray): Tag ID of each pair.
+        related_ids (np.ndarray): The other tag's ID of each pair.
+
+    Returns:
+        num_works (np.ndarray): Number of works using both tags, for each pair.
+    """
+    tag_ids = np.asarray(tag_ids, dtype=np.int64)
+    related_ids = np.asarray(related_ids, dtype=np.int64)
+    postings = [(np.asarray(store['tag_offsets']), store['tag_works'])]
+    if 'delta_offsets' in store:
+        postings.append((np.asarray(store['delta_offsets']), store['delta_works']))
+    sizes = {}
+    for tag_side, ids in [('tag', tag_ids), ('related', related_ids)]:
+        sizes[tag_side] = sum(np.diff(offsets)[ids.clip(max=len(offsets) - 2)] * (ids < len(offsets) - 1)
+                              for offsets, _ in postings)
+    swap = sizes['tag'] < sizes['related']
+    larger, smaller = np.where(swap, related_ids, tag_ids), np.where(swap, tag_ids, related_ids)
+    counts = np.zeros(len(tag_ids), dtype=np.int64)
+    # Pairs grouped by their larger tag, whose works are read once per group
+    order = np.argsort(larger, kind='stable')
+    group_starts = np.flatnonzero(np.diff(larger[order], prepend=-1))
+    for start, end in zip(group_starts, np.append(group_starts[1:], len(order))):
+        pairs = order[start:end]
+        # Works of the smaller tags, labelled with their pair
+        works, labels = [], []
+        for offsets, tag_works in postings:
+            ids = smaller[pairs]
+            inside = ids < len(offsets) - 1
+            starts = np.where(inside, offsets[ids.clip(max=len(offsets) - 2)], 0)
+            lengths = np.where(inside, offsets[(ids + 1).clip(max=len(offsets) - 1)] - starts, 0)
+            works.append(np.asarray(tag_works[expand_ranges(starts, lengths)], dtype=np.int64))
+            labels.append(np.repeat(np.arange(len(pairs)), lengths))
+        works, labels = np.concatenate(works), np.concatenate(labels)
+        found = contains_sorted(tag_work_ids(store, int(larger[pairs[0]])), works)
+        if 'removed_version' in store:
+            found &= store['removed_version'][works] == 0
+        counts[pairs] = np.bincount(labels[found], minlength=len(pairs))
+    return counts
+
+def work_tag_ids(store: dict, work_ids: np.ndarray) -> tuple:
+    """
+    Get the work-tag pairs of the given works from the columnar store's postings (the store
+    has no postings by work, so every tag's postings are read once, in chunks), including
+    those of removed works.
+
+    Parameters:
+        store (dict): Columnar store, as returned by load_columnar_store.
+        work_ids (np.ndarray): Work IDs.
+
+    Returns:
+        Tuple of arrays with one item per pair:
+            - work_ids (np.ndarray): Work ID.
+            - tag_ids (np.ndarray): Tag ID.
+    """
+    wanted = np.unique(np.asarray(work_ids, dtype=np.int64))
+    pair_works, pair_tags = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    for name in ('tag', 'delta'):
+        if f'{name}_offsets' not in store:
+            continue
+        offsets, works = np.asarray(store[f'{name}_offsets']), store[f'{name}_works']
+        for start in range(0, len(works), RELATED_CHUNK_PAIRS):
+            chunk = np.asarray(works[start:start + RELATED_CHUNK_PAIRS], dtype=np.int64)
+            positions = np.flatnonzero(contains_sorted(wanted, chunk))
+            pair_works.append(chunk[positions])
+            # The postings are in tag order, so the tag of each pair comes from the offsets
+            pair_tags.append(np.searchsorted(offsets, start + positions, side='right') - 1)
+    return np.concatenate(pair_works), np.concatenate(pair_tags)
+
+def recount_related(conn: sqlite3.Connection, store: dict, tag_ids: np.ndarray, postings: list,
+                    top_k: int) -> pd.DataFrame:
+    """
+    Count the related tags of a few tags again, gathering the tags of their works 
+    (see work_tag_ids).
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to fanfic.db.
+        store (dict): Columnar store, as returned by load_columnar_store.
+        tag_ids (np.ndarray): Tag IDs to count.
+        postings (list): Array of the work IDs of each tag in the latest dump.
+        top_k (int): Number of related tags to keep per tag and type.
+
+    Returns:
+        related (pd.DataFrame): DataFrame of tag_id, related_type, rank, related_id, and 
+                                num_works of the tags' related tags.
+    """
+    # Each work's counted tags, in work order
+    sources = np.repeat(np.asarray(tag_ids, dtype=np.int64), [len(works) for works in postings])
+    works = np.concatenate(postings).astype(np.int64)
+    order = np.argsort(works, kind='stable')
+    works, sources = works[order], sources[order]
+    pair_works, related = work_tag_ids(store, works)
+    # Each pair of a work is matched with every counted tag of the work
+    firsts = np.searchsorted(works, pair_works, side='left')
+    lengths = np.searchsorted(works, pair_works, side='right') - firsts
+    pair_sources = sources[expand_ranges(firsts, lengths)]
+    related = np.repeat(related, lengths)
+    keep = pair_sources != related
+    num_tags = int(max(related.max(initial=0), pair_sources.max(initial=0))) + 1
+    keys, counts = np.unique(pair_sources[keep] * num_tags + related[keep], return_counts=True)
+    rows = pd.DataFrame({'tag_id': keys // num_tags, 'related_id': keys % num_tags,
+                         'num_works': counts})
+    cur = conn.cursor()
+    cur.execute("CREATE TEMP TABLE recount_tags (tag_id INTEGER PRIMARY KEY)")
+    cur.executemany("INSERT INTO recount_tags VALUES (?)",
+                    ((tag_id,) for tag_id in np.unique(rows['related_id']).tolist()))
+    types = pd.read_sql_query("""
+        SELECT id AS related_id, type AS related_type FROM tags 
+        WHERE id IN (SELECT tag_id FROM recount_tags)
+        """, conn)
+    cur.execute("DROP TABLE recount_tags")
+    rows = rows.merge(types[types['related_type'].isin(RELATED_TYPES)], on='related_id')
+    return rank_related(rows, top_k)
+
+def rank_related(related: pd.DataFrame, top_k: int) -> pd.DataFrame:
+    """
+    Rank related tags within each (tag, type) list, most shared works first and ties broken
+    by tag ID, as count_related_chunk does, and keep the top_k of each list.
+
+    Parameters:
+        related (pd.DataFrame): DataFrame with tag_id, related_type, related_id, and num_works.
+        top_k (int): Number of related tags to keep per tag and type.
+
+    Returns:
+        related (pd.DataFrame): The kept rows, with their rank.
+    """
+    related = related.sort_values(['tag_id', 'related_type', 'num_works', 'related_id'],
+                                  ascending=[True, True, False, True])
+    related['rank'] = related.groupby(['tag_id', 'related_type']).cumcount()
+    return related[related['rank'] < top_k]
+
+def settle_related_lists(conn: sqlite3.Connection, store: dict, rows: pd.DataFrame,
+                         unsettled: pd.DataFrame, top_k: int) -> pd.DataFrame:
+    """
+    Complete the full related tag lists that a dump's removed works may have opened to tags 
+    they don't know (see update_related_table), for each tag in whichever way gathers fewer 
+    co-occurring tags: counting the tag again (see recount_related), which gathers the tags
+    of all its works, or counting every tag of the type with as many works as the list's last
+    count against it (see shared_works), which looks up the smaller tag's works in the other's.
+    Settling the lists may gather up to RELATED_SETTLE_RATIO of what counting every tag would.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to fanfic.db, with related_tag_sizes up to date.
+        store (dict): Columnar store, as returned by load_columnar_store.
+        rows (pd.DataFrame): Ranked related tags of the changed tags, as merged so far.
+        unsettled (pd.DataFrame): DataFrame of tag_id, related_type, count (the list's
+                                  number of known tags), and new_count (its last count).
+        top_k (int): Number of related tags kept per tag and type.
+
+    Returns:
+        rows (pd.DataFrame): Ranked related tags of the changed tags, or None if settling the
+                             lists would cost about as much as counting every tag again.
+    """
+    num_works = conn.execute("SELECT num_works FROM related_tag_sizes WHERE tag_id = 0").fetchone()[0]
+    average_tags = len(store['tag_works']) / max(num_works, 1)
+    budget = RELATED_SETTLE_RATIO * len(store['tag_works']) * average_tags
+    types = ', '.join('?' * len(RELATED_TYPES))
+    tag_sizes = pd.read_sql_query(f"""
+        SELECT related_tag_sizes.tag_id AS related_id, tags.type AS related_type, 
+               related_tag_sizes.num_works AS size
+        FROM related_tag_sizes
+        JOIN tags ON tags.id = related_tag_sizes.tag_id
+        WHERE related_tag_sizes.tag_id > 0 AND related_tag_sizes.num_works > 0 
+        AND tags.type IN ({types})
+        """, conn, params=RELATED_TYPES)
+    # Sizes of each type's tags in increasing order, with their running totals
+    sorted_sizes = {}
+    for related_type, sizes in tag_sizes.groupby('related_type')['size']:
+        sizes = np.sort(sizes.to_numpy())
+        sorted_sizes[related_type] = (sizes, np.r_[0, np.cumsum(sizes)])
+    tag_ids = unsettled['tag_id'].unique()
+    postings = {}
+    for tag_id in tag_ids.tolist():
+        works = tag_work_ids(store, tag_id)
+        if 'removed_version' in store:
+            works = works[store['removed_version'][works] == 0]
+        postings[tag_id] = works
+    # Cost of each list when counted against its possible tags (each lookup is one of the
+    # smaller tag's works), impossible if the list doesn't know enough tags to have a last count
+    lookups = {tag_id: 0.0 for tag_id in postings}
+    for tag_id, related_type, count, last_count in zip(unsettled['tag_id'].tolist(),
+                                                       unsettled['related_type'],
+                                                       unsettled['count'], unsettled['new_count']):
+        sizes, totals = sorted_sizes.get(related_type, (np.empty(0), np.zeros(1)))
+        if not count >= top_k:
+            lookups[tag_id] = np.inf
+            continue
+        size = len(postings[tag_id])
+        first = np.searchsorted(sizes, last_count, side='left')
+        larger = max(int(np.searchsorted(sizes, size, side='right')), first)
+        lookups[tag_id] += totals[larger] - totals[first] + size * (len(sizes) - larger)
+    recounted = [tag_id for tag_id in postings
+                 if len(postings[tag_id]) * average_tags <= lookups[tag_id]]
+    cost = sum(min(len(postings[tag_id]) * average_tags, lookups[tag_id]) for tag_id in postings)
+    # Gathering the tags of works reads every tag's postings once
+    cost += len(store['tag_works']) if recounted else 0
+    if cost > budget:
+        return None
+    if recounted:
+        rows = pd.concat([rows[~rows['tag_id'].isin(recounted)],
+                          recount_related(conn, store, np.array(recounted),
+                                          [postings[tag_id] for tag_id in recounted], top_k)])
+        conn.executemany("INSERT OR IGNORE INTO changed_tags VALUES (?)",
+                         ((tag_id,) for tag_id in recounted))
+    # Every tag of the type with at least the list's last count, that the list doesn't know
+    lists = unsettled[~unsettled['tag_id'].isin(recounted)]
+    candidates = lists[['tag_id', 'related_type', 'new_count']].merge(tag_sizes, on='related_type')
+    candidates = candidates[(candidates['size'] >= candidates['new_count'])
+                            & (candidates['related_id'] != candidates['tag_id'])]
+    candidates = candidates.merge(rows[['tag_id', 'related_type', 'related_id']], how='left',
+                                  on=['tag_id', 'related_type', 'related_id'], indicator=True)
+    candidates = candidates[candidates['_merge'] == 'left_only']
+    found = candidates[['tag_id', 'related_type', 'related_id']].copy()
+    found['num_works'] = shared_works(store, found['tag_id'], found['related_id'])
+    return rank_related(pd.concat([rows, found[found['num_works'] > 0]]), top_k)
+
+def update_related_table(added_works: np.ndarray, added_tags: np.ndarray, removed_works: np.ndarray,
+                         removed_tags: np.ndarray, top_k: int = RELATED_TOP_K,
+                         directory: str = COLUMNS_DIR) -> bool:
+    """
+    Bring the related_tags table up to date with a newer dump without counting every tag
+    again: the co-occurrences of the dump's added and removed work-tag pairs are counted
+    (see pair_cooccurrences) and merged into the kept counts of the tags they touch. 
+    A tag whose kept list was full (top_k tags) only knows that the tags left out shared at 
+    most as many works as its last one, so the tags the dump may have pushed past that are 
+    counted exactly from the store's postings (see shared_works), and a full list that lost
+    works is completed by settle_related_lists. The lifts of every row are then computed 
+    again, as the number of works and the tags' sizes have changed.
+    The columnar store must already include the dump (see update_columnar_store).
+
+    Parameters:
+        added_works (np.ndarray): Work ID of each work-tag pair added by the dump.
+        added_tags (np.ndarray): Tag ID of each work-tag pair added by the dump.
+        removed_works (np.ndarray): Work ID of each work-tag pair of the works removed by the dump.
+        removed_tags (np.ndarray): Tag ID of each work-tag pair of the works removed by the dump.
+        top_k (int): Number of related tags kept per tag and type (as built).
+        directory (str): Folder of the columnar store.
+
+    Returns:
+        boolean: True if the table was updated, False if every tag has to be counted again
+                 instead (see build_related_tags): the table predates related_tag_sizes, or
+                 completing the lists that lost works would cost about as much
+                 (see settle_related_lists).
+    """
+    start_time = time.perf_counter()
+    store = load_columnar_store(directory)
+    with sqlite3.connect(DB_PATH) as conn:
+        cur = conn.cursor()
+        if store is None or cur.execute("""
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'related_tag_sizes'
+            """).fetchone() is None:
+            return False
+        pairs = {'added': (np.asarray(added_works, dtype=np.int64), 
+                           np.asarray(added_tags, dtype=np.int64)),
+                 'removed': (np.asarray(removed_works, dtype=np.int64), 
+                             np.asarray(removed_tags, dtype=np.int64))}
+        tag_ids = np.unique(np.concatenate([pairs['added'][1], pairs['removed'][1]]))
+        num_tags = int(tag_ids[-1]) + 1 if len(tag_ids) else 1
+        cur.execute("CREATE TEMP TABLE delta_tags (tag_id INTEGER PRIMARY KEY)")
+        cur.executemany("INSERT INTO delta_tags VALUES (?)", ((tag_id,) for tag_id in tag_ids.tolist()))
+        # Type of each tag the dump touches, as an index into RELATED_TYPES
+        tag_types = np.full(num_tags, -1, dtype=np.int8)
+        for tag_id, tag_type in cur.execute("""
+            SELECT id, type FROM tags WHERE id IN (SELECT tag_id FROM delta_tags)
+            """):
+            if tag_type in RELATED_TYPES:
+                tag_types[tag_id] = RELATED_TYPES.index(tag_type)
+        # Sizes before the dump, and after it
+        old_sizes = np.zeros(num_tags, dtype=np.int64)
+        for tag_id, size in cur.execute("""
+            SELECT tag_id, num_works FROM related_tag_sizes WHERE tag_id IN (SELECT tag_id FROM delta_tags)
+            """):
+            old_sizes[tag_id] = size
+        sizes = (old_sizes + np.bincount(pairs['added'][1], minlength=num_tags)
+                 - np.bincount(pairs['removed'][1], minlength=num_tags))
+        num_works = (cur.execute("SELECT num_works FROM related_tag_sizes WHERE tag_id = 0").fetchone()[0]
+                     + len(np.unique(pairs['added'][0])) - len(np.unique(pairs['removed'][0])))
+        # Change in the works each two tags share, for the related tags of the shown types
+        keys, counts = [], []
+        for kind, sign in [('added', 1), ('removed', -1)]:
+            kind_keys, kind_counts = pair_cooccurrences(*pairs[kind], num_tags)
+            keys.append(kind_keys)
+            counts.append(sign * kind_counts)
+        keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        deltas = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+        keep = (deltas != 0) & (tag_types[keys % num_tags] >= 0)
+        keys, deltas = keys[keep], deltas[keep]
+        changes = pd.DataFrame({'tag_id': keys // num_tags, 'related_id': keys % num_tags,
+                                'delta': deltas})
+        changes['related_type'] = np.array(RELATED_TYPES)[tag_types[changes['related_id'].to_numpy()]]
+        cur.execute("CREATE TEMP TABLE changed_tags (tag_id INTEGER PRIMARY KEY)")
+        cur.executemany("INSERT INTO changed_tags VALUES (?)",
+                        ((tag_id,) for tag_id in changes['tag_id'].unique().tolist()))
+        kept = pd.read_sql_query("""
+            SELECT tag_id, related_type, rank, related_id, num_works AS old
+            FROM related_tags
+            WHERE tag_id IN (SELECT tag_id FROM changed_tags)
+            """, conn)
+        # Each kept list's length and last tag
+        lists = (kept.sort_values('rank').groupby(['tag_id', 'related_type'])
+                 .agg(listed=('rank', 'size'), last_count=('old', 'last'), last_id=('related_id', 'last'))
+                 .reset_index())
+        lists['full'] = lists['listed'] >= top_k
+        rows = (kept.merge(changes, on=['tag_id', 'related_type', 'related_id'], how='outer')
+                .merge(lists, on=['tag_id', 'related_type'], how='left'))
+        rows['delta'] = rows['delta'].fillna(0).astype(np.int64)
+        rows['full'] = rows['full'].eq(True)
+        listed = rows['old'].notna()
+        # Counts of the kept tags are known, and so are the others' in lists that weren't full
+        # (they shared no works before the dump)
+        rows['num_works'] = rows['old'].fillna(0) + rows['delta']
+        unknown = ~listed & rows['full']
+        if unknown.any():
+            # Lowest known count of each full list: a tag left out of it can only make the 
+            # list if it could have reached that many works
+            lowest = (rows[listed & rows['full']].groupby(['tag_id', 'related_type'])['num_works']
+                      .min().rename('lowest'))
+            rows = rows.join(lowest, on=['tag_id', 'related_type'])
+            # What a tag left out had shared is at most the list's last count and its own size
+            # (it is one of the dump's tags, as its count changed)
+            left_out = rows[unknown]
+            bound = (np.minimum(left_out['last_count'], old_sizes[left_out['related_id'].to_numpy()])
+                     + left_out['delta'])
+            recount = unknown.copy()
+            recount[unknown] = bound >= left_out['lowest']
+            rows.loc[recount, 'num_works'] = shared_works(store, rows.loc[recount, 'tag_id'],
+                                                          rows.loc[recount, 'related_id'])
+            rows = rows[~unknown | recount]
+        rows = rank_related(rows[rows['num_works'] > 0], top_k)
+        # A full list is settled if its last tag still beats every tag it didn't know 
+        # (which shared at most its old last count, and lost ties to its old last tag)
+        full = lists[lists['full']].merge(
+            rows.groupby(['tag_id', 'related_type']).agg(count=('rank', 'size'), 
+                                                         new_count=('num_works', 'last'),
+                                                         new_id=('related_id', 'last')).reset_index(),
+            on=['tag_id', 'related_type'], how='left')
+        settled = ((full['count'] == top_k)
+                   & ((full['new_count'] > full['last_count'])
+                      | ((full['new_count'] == full['last_count']) & (full['new_id'] <= full['last_id']))))
+        cur.executemany("INSERT OR REPLACE INTO related_tag_sizes VALUES (?, ?)",
+                        zip([0] + tag_ids.tolist(), [int(num_works)] + sizes[tag_ids].tolist()))
+        if not settled.all():
+            rows = settle_related_lists(conn, store, rows, full.loc[~settled], top_k)
+            if rows is None:
+                conn.rollback()
+                return False
+        cur.execute("DELETE FROM related_tags WHERE tag_id IN (SELECT tag_id FROM changed_tags)")
+        cur.executemany("INSERT INTO related_tags VALUES (?, ?, ?, ?, ?, NULL)",
+                        zip(rows['tag_id'].tolist(), rows['related_type'].tolist(), rows['rank'].tolist(),
+                            rows['related_id'].tolist(), rows['num_works'].astype(np.int64).tolist()))
+        # Every lift depends on the number of works, so they are all computed again 
+        # (a keyed update of the kept rows, without counting anything)
+        cur.execute("""
+        UPDATE related_tags
+        SET lift = ROUND(num_works * ? / (1.0 
+            * (SELECT num_works FROM related_tag_sizes WHERE tag_id = related_tags.tag_id)
+            * (SELECT num_works FROM related_tag_sizes WHERE tag_id = related_tags.related_id)), 3)
+        """, (int(num_works),))
+        num_tags = cur.execute("SELECT COUNT(*) FROM changed_tags").fetchone()[0]
+        conn.commit()
+    elapsed = time.perf_counter() - start_time
+    print(f"Updated the related tags of {num_tags:,} tags in {elapsed:.1f}s")
+    return True
@@ -1,47 +1,247 @@
+import io
 import os
+import csv
+import time
+import hashlib
 import sqlite3 
+import multiprocessing
+import numpy as np
 import pandas as pd
 import requests
+import shutil
 import zipfile
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src.columnar import build_columnar_store, build_related_tags, COLUMNS_DIR
+from src.search import build_tag_search
+from src.db import DB_PATH, is_compact, is_versioned
+from src.manifest import (DUMP_DATE, DERIVED_STAGES, dump_stage, load_manifest, save_manifest,
+                          stage_done, update_stage, finish_stage, reset_stages, stage_checkpoint,
+                          mark_ready, tag_stats_stale, WORD_BRACKET_EDGES)
 
-def import_data() -> None:
+def dump_url(dump_date: str) -> str:
+    """
+    Get the URL of the AO3-published zip file of the given data dump.
+    
+    Parameters:
+        dump_date (str): Date of the data dump, as YYYYMMDD.
+    
+    Returns:
+        url (str): URL of the zip file.
+    """
+    return (f"https://media.archiveofourown.org/ao3/stats/"
+            f"{dump_date[:4]}/{dump_date[4:6]}/{dump_date[6:]}/{dump_date}-stats.zip")
+
+# Data dump to use (DUMP_DATE comes from AO3_DUMP_DATE, see manifest.py),
+# configurable through environment variables (e.g. for a local test server)
+DUMP_URL = os.environ.get('AO3_DUMP_URL', dump_url(DUMP_DATE))
+
+def dump_paths(dump_date: str = DUMP_DATE) -> dict:
+    """
+    Get the paths of the files of the given data dump in the data folder (the database's folder).
+    
+    Parameters:
+        dump_date (str): Date of the data dump, as YYYYMMDD.
+    
+    Returns:
+        paths (dict): Paths of the "tags" and "works" CSV files and the "zip" file.
+    """
+    directory = os.path.dirname(DB_PATH)
+    return {
+        'tags': os.path.join(directory, f"tags-{dump_date}.csv"),
+        'works': os.path.join(directory, f"works-{dump_date}.csv"),
+        'zip': os.path.join(directory, f"{dump_date}-stats.zip")
+    }
+
+def file_checksum(path: str) -> str:
+    """
+    Compute the SHA-256 checksum of a file, reading it in chunks.
+    
+    Parameters:
+        path (str): Path of the file.
+    
+    Returns:
+        checksum (str): Hex digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def record_sources() -> None:
+    """
+    Record the size, modification time, and checksum of the data dump files in the manifest.
+    
+    Parameters:
+        None
+    
+    Returns:
+        None
+    """
+    manifest = load_manifest()
+    manifest['sources'] = {}
+    for path in dump_paths().values():
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            manifest['sources'][path] = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                                         'sha256': file_checksum(path)}
+    save_manifest(manifest)
+    return None
+
+def sources_changed() -> bool:
+    """
+    Check whether the data dump files differ (by size or modification time) from the ones
+    recorded in the manifest, or are missing.
+    
+    Parameters:
+        None
+    
+    Returns:
+        boolean: True if any recorded source file has changed.
+    """
+    sources = load_manifest()['sources']
+    if not sources:
+        return True
+    for path, recorded in sources.items():
+        if not os.path.isfile(path):
+            return True
+        stat = os.stat(path)
+        if stat.st_size != recorded['size'] or stat.st_mtime != recorded['mtime']:
+            return True
+    return False
+
+def download_file(url: str, path: str) -> None:
+    """
+    Download a file in chunks, so it never has to fit in memory, reporting progress.
+    The download is saved to path + ".part" until complete; if an earlier download was 
+    interrupted, it resumes from where it stopped using an HTTP Range request.
+    
+    Parameters:
+        url (str): URL to download.
+        path (str): Path to save the finished download to.
+    
+    Returns:
+        None
+    """
+    partial = path + '.part'
+    done = os.path.getsize(partial) if os.path.exists(partial) else 0
+    headers = {'Range': f'bytes={done}-'} if done else {}
+    with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 416:
+            # Nothing left to download, the earlier download had finished
+            os.replace(partial, path)
+            return None
+        response.raise_for_status()
+        if response.status_code == 206:
+            # Resuming: Content-Range is "bytes start-end/total", or "bytes start-end/*"
+            # if the server doesn't know the total size
+            total = response.headers.get('Content-Range', '').split('/')[-1]
+            total = int(total) if total.isdigit() else 0
+            print(f"Resuming download at {done / 1e6:,.1f} MB")
+            mode = 'ab'
+        else:
+            # The server sent the whole file
+            total = int(response.headers.get('Content-Length', 0))
+            done, mode = 0, 'wb'
+        reported = -1
+        with open(partial, mode) as file:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                file.write(chunk)
+                done += len(chunk)
+                # Report every 10% (or every 50 MB if the size is unknown)
+                step = done * 10 // total if total else done // 50_000_000
+                if step > reported:
+                    reported = step
+                    if total:
+                        print(f"Downloaded {done / 1e6:,.1f} of {total / 1e6:,.1f} MB "
+                              f"({done / total:.0%})")
+                    else:
+                        print(f"Downloaded {done / 1e6:,.1f} MB")
+    os.replace(partial, path)
+    return None
+
+def import_data(url: str = DUMP_URL, dump_date: str = DUMP_DATE, extract: bool = True) -> None:
     """
     Check if "tags" and "works" CSV files already exist and have been downloaded.
     If not, automatically download and extract data from AO3-published zip file.
     
     Parameters:
-        None
+        url (str): URL of the zip file.
+        dump_date (str): Date of the data dump, as YYYYMMDD, used in the file names.
+        extract (bool): If False, keep the CSV files in the zip file without extracting them,
+                        for ingesting directly from the zip file.
     
     Returns:
         None
     """
-    #Make /data folder if it doesn't exist already
-    Path("data").mkdir(parents=True, exist_ok=True)
+    #Make the data folder (the database's folder) if it doesn't exist already
+    Path(os.path.dirname(DB_PATH)).mkdir(parents=True, exist_ok=True)
     # Check if files exist first
-    tags = Path("data/tags-20210226.csv")
-    works = Path("data/works-20210226.csv")
+    paths = dump_paths(dump_date)
+    tags = Path(paths['tags'])
+    works = Path(paths['works'])
     if tags.is_file() and works.is_file():
         # If so, skip download process
         print('Files Already Exist')
-    else:
-        # If files don't exist, start download process 
-        url = "https://media.archiveofourown.org/ao3/stats/2021/02/26/20210226-stats.zip"
-        # Send the request to the URL to download
-        response = requests.get(url)
-        # Download and save zip file
-        with open("data/2021_stats.zip", "wb") as file:
-            file.write(response.content)
-        # Extract files from the zip file into data folder
-        with zipfile.ZipFile("data/2021_stats.zip", "r") as zip_ref:
-            zip_ref.extractall("data")
+        return None
+    # If files don't exist, start (or resume) download process, streaming it to the zip file
+    if not Path(paths['zip']).is_file():
+        download_file(url, paths['zip'])
         print('Downloading Completed')
+    if extract:
+        # Extract files from the zip file into data folder
+        with zipfile.ZipFile(paths['zip'], "r") as zip_ref:
+            for kind in ['tags', 'works']:
+                member = zip_member(zip_ref, paths[kind])
+                with zip_ref.open(member) as source, open(paths[kind], 'wb') as target:
+                    shutil.copyfileobj(source, target, 1 << 20)
     return None
 
+def zip_member(zip_ref: zipfile.ZipFile, path: str) -> str:
+    """
+    Find the member of the zip file with the same file name as the given path.
+    
+    Parameters:
+        zip_ref (zipfile.ZipFile): Open zip file.
+        path (str): Path of the file in the data folder.
+    
+    Returns:
+        member (str): Name of the matching member of the zip file.
+    """
+    name = os.path.basename(path)
+    for member in zip_ref.namelist():
+        if os.path.basename(member) == name:
+            return member
+    raise FileNotFoundError(f"{name} not found in the data dump.")
+
+def open_dump_csv(kind: str, dump_date: str = DUMP_DATE):
+    """
+    Open one of the data dump CSV files as a text stream: the extracted file if it exists,
+    otherwise the member of the zip file, read without extracting it.
+    
+    Parameters:
+        kind (str): "tags" or "works".
+        dump_date (str): Date of the data dump, as YYYYMMDD.
+    
+    Returns:
+        file: Open text stream of the CSV file.
+    """
+    paths = dump_paths(dump_date)
+    if os.path.isfile(paths[kind]):
+        return open(paths[kind], newline='', encoding='utf-8')
+    # The member stays readable after the zip file itself is closed
+    with zipfile.ZipFile(paths['zip'], "r") as zip_ref:
+        member = zip_ref.open(zip_member(zip_ref, paths[kind]))
+    return io.TextIOWrapper(member, newline='', encoding='utf-8')
+
 def csv_to_db() -> None:
     """
     Creates fanfic.db SQLite database, then converts both "works" and "tags" CSV files
     into Pandas DataFrames, then into SQL tables within the database.
+    Each chunk is committed and checkpointed in the build manifest, so an interrupted run
+    resumes after the last committed chunk instead of appending duplicate rows.
     
     Parameters:
         None
@@ -49,20 +249,34 @@ def csv_to_db() -> None:
     Returns:
         None
     """
+    checkpoint = stage_checkpoint('csv_to_db') or {}
     # Connect to SQLite database 
-    with sqlite3.connect('data/fanfic.db') as conn:
-        # Load "works" CSV data into Pandas DataFrame, using chunks 
-        chunks = pd.read_csv('data/works-20210226.csv', chunksize = 50000)
-        for chunk in chunks:
-            # Fix creation_date column name before converting
-            chunk.rename(columns={'creation date': 'creation_date'}, inplace=True)
-            # Convert DataFrame into SQL table
-            chunk.to_sql("works", conn, if_exists='append', index=False)
-        # Load "tags" CSV data into Pandas Dataframe, using chunks    
-        chunks = pd.read_csv('data/tags-20210226.csv', chunksize = 50000)
-        for chunk in chunks:
-            # Convert DataFrame into SQL table
-            chunk.to_sql("tags", conn, if_exists='append', index=False)
+    with sqlite3.connect(DB_PATH) as conn:
+        cur = conn.cursor()
+        rows = {}
+        for table, kind in [("works", 'works'), ("tags", 'tags')]:
+            done = checkpoint.get(table, 0)
+            if done:
+                # Drop rows written after the last checkpoint
+                cur.execute(f"DELETE FROM {table} WHERE rowid > ?", (done,))
+            else:
+                # Starting over, so drop anything left from an earlier run
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.commit()
+            # Load CSV data into Pandas DataFrame, using chunks, skipping committed rows
+            with open_dump_csv(kind) as file:
+                chunks = pd.read_csv(file, chunksize = 50000, skiprows = range(1, done + 1))
+                for chunk in chunks:
+                    # Fix creation_date column name before converting
+                    chunk.rename(columns={'creation date': 'creation_date'}, inplace=True)
+                    # Convert DataFrame into SQL table
+                    chunk.to_sql(table, conn, if_exists='append', index=False)
+                    conn.commit()
+                    done += len(chunk)
+                    checkpoint[table] = done
+                    update_stage('csv_to_db', status='running', checkpoint=checkpoint)
+            rows[table] = done
+    finish_stage('csv_to_db', **rows)
     return None
 
 def preprocess() -> None:
@@ -76,12 +290,13 @@ def preprocess() -> None:
     Returns:
         None
     """
-    with sqlite3.connect('data/fanfic.db') as conn:
+    with sqlite3.connect(DB_PATH) as conn:
         # Create a cursor object 
         cur = conn.cursor() 
         # Tags table preprocessing
         cur.execute("DELETE FROM tags WHERE cached_count < 5")
-        # Works table preprocessing
+        # Works table preprocessing (dropping any new_works left by an interrupted run)
+        cur.execute("DROP TABLE IF EXISTS new_works")
         # Creates new table new_works, which contains autoincrement work_id
         cur.execute("""
                 CREATE TABLE IF NOT EXISTS new_works(work_id INTEGER PRIMARY KEY AUTOINCREMENT, 
@@ -101,21 +316,105 @@ def preprocess() -> None:
         cur.execute("DROP TABLE works")
         # new_works becomes the new works table, with work_id
         cur.execute("ALTER TABLE new_works RENAME TO works")
+        # All of the above is one transaction, so a crash leaves the tables as they were
         conn.commit()
+    finish_stage('preprocess')
+    return None
+
+# Tag IDs used by parse_tag_chunk, set in each worker process by init_tag_worker
+worker_tag_ids = {}
+
+def init_tag_worker(tag_ids: dict) -> None:
+    """
+    Gives a tag-splitting worker process the tag IDs to keep, once, instead of with every chunk.
+    
+    Parameters:
+        tag_ids (dict): Dictionary of tag ID text to integer tag ID.
+    
+    Returns:
+        None
+    """
+    global worker_tag_ids
+    worker_tag_ids = tag_ids
     return None
 
-def split_tags() -> None:
+def parse_tag_chunk(chunk: tuple) -> tuple:
+    """
+    Splits the tags of a chunk of works into (work_id, tag_id) pairs,
+    keeping only the tags given to init_tag_worker.
+    
+    Parameters:
+        chunk (tuple): (work_ids, tag_texts) - the work IDs and their '+'-separated tags.
+    
+    Returns:
+        Tuple:
+            - pair_works (np.ndarray): Work ID of each pair.
+            - pair_tags (np.ndarray): Tag ID of each pair.
+    """
+    work_ids, tag_texts = chunk
+    get_tag = worker_tag_ids.get
+    pair_works, pair_tags = [], []
+    for work_id, tags in zip(work_ids, tag_texts):
+        # Skip works with missing tags
+        if not isinstance(tags, str):
+            continue
+        # Only keep tags that exist in tag_ids (valid tags with >= 5 works)
+        kept = [tag_id for tag_id in map(get_tag, map(str.strip, tags.split('+')))
+                if tag_id is not None]
+        pair_works.extend([work_id] * len(kept))
+        pair_tags.extend(kept)
+    return np.array(pair_works, dtype=np.int64), np.array(pair_tags, dtype=np.int64)
+
+def parse_tag_pairs(batches, tag_ids: dict, workers: int = 1):
+    """
+    Runs parse_tag_chunk over batches of works, in worker processes if workers > 1,
+    yielding the results in the original order so the output matches the serial path.
+    At most two batches per worker are in flight, so memory use stays flat.
+    
+    Parameters:
+        batches: Iterable of (payload, work_ids, tag_texts) tuples. The payload stays in 
+                 this process and is passed back with the batch's pairs.
+        tag_ids (dict): Dictionary of tag ID text to integer tag ID.
+        workers (int): Number of worker processes (1 parses in this process).
+    
+    Yields:
+        Tuple of (payload, pair_works, pair_tags) for each batch, in order.
+    """
+    # Worker processes are forked, so they never re-import app.py; 
+    # where forking isn't available, parse in this process
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=init_tag_worker,
+                                 initargs=(tag_ids,)) as pool:
+            pending = deque()
+            for payload, work_ids, tag_texts in batches:
+                pending.append((payload, pool.submit(parse_tag_chunk, (work_ids, tag_texts))))
+                if len(pending) >= 2 * workers:
+                    payload, future = pending.popleft()
+                    yield (payload, *future.result())
+            while pending:
+                payload, future = pending.popleft()
+                yield (payload, *future.result())
+    else:
+        init_tag_worker(tag_ids)
+        for payload, work_ids, tag_texts in batches:
+            yield (payload, *parse_tag_chunk((work_ids, tag_texts)))
+
+def split_tags(workers: int = 1) -> None:
     """
     Splits the 'tags' column in the 'works' table into individual rows 
     in new work_tag_pairs table.
+    Each chunk is committed and checkpointed in the build manifest, so an interrupted run
+    resumes after the last committed work.
     
     Parameters:
-        None
+        workers (int): Number of worker processes splitting tags in parallel 
+                       (1 splits in this process). The output is the same either way.
     
     Returns:
         None
     """
-    with sqlite3.connect('data/fanfic.db') as conn:
+    with sqlite3.connect(DB_PATH) as conn:
         cur = conn.cursor()
         #Create new table of work ID and tag ID
         cur.execute("""
@@ -128,35 +427,489 @@ def split_tags() -> None:
         """)
         # Select all tag IDs from tags table
         tag_ids = pd.read_sql_query("SELECT id FROM tags", conn)
-        # Convert ID column into strings
-        tag_set = set(tag_ids["id"].astype(str))
+        # Map each ID's text (as found in the works table) to the ID
+        tag_ids = {str(tag_id): int(tag_id) for tag_id in tag_ids["id"]}
+        # Resume after the last committed work, dropping pairs written after it
+        checkpoint = stage_checkpoint('split_tags') or {'work_id': 0, 'pairs': 0}
+        cur.execute("DELETE FROM work_tag_pairs WHERE work_id > ?", (checkpoint['work_id'],))
+        conn.commit()
         # Process the works table into Pandas DataFrame in chunks
-        chunks = pd.read_sql_query("SELECT work_id, tags FROM works", conn, chunksize=50000)
-        for chunk in chunks:
-            # Drop rows with missing tags
-            chunk = chunk.dropna(subset=["tags"])
-             # Split the tags by '+' into lists
-            chunk['tag_list'] = chunk['tags'].str.split('+') 
-            # Only keep tags that exist in tag_set (valid tags with > 5 works)
-            chunk['tag_list'] = chunk['tag_list'].apply(
-                lambda x: [tag.strip() for tag in x if tag.strip() in tag_set]
-                )
-            pairs = []
-            # For each work and its list of tags
-            for work_id, tags in zip(chunk['work_id'], chunk['tag_list']):
-                # For each tag in that list of tags
-                for tag_id in tags:
-                    # Append a tuple of that work and tag to pairs list
-                    pairs.append((work_id, tag_id))
-            if pairs:
+        chunks = pd.read_sql_query("SELECT work_id, tags FROM works WHERE work_id > ?", conn, 
+                                   params=(checkpoint['work_id'],), chunksize=50000)
+        batches = ((chunk['work_id'].iloc[-1], chunk['work_id'].tolist(), chunk['tags'].tolist()) 
+                   for chunk in chunks)
+        # Split each chunk's tags (in parallel if workers > 1), writing the pairs as they arrive
+        for last_work_id, pair_works, pair_tags in parse_tag_pairs(batches, tag_ids, workers):
+            if len(pair_works):
                 # Insert many (work_id, tag_id) pairs into work_tag_pairs table
-                cur.executemany("INSERT INTO work_tag_pairs (work_id, tag_id) VALUES (?, ?)", pairs)
+                cur.executemany("INSERT INTO work_tag_pairs (work_id, tag_id) VALUES (?, ?)", 
+                                zip(pair_works.tolist(), pair_tags.tolist()))
+            conn.commit()
+            checkpoint = {'work_id': int(last_work_id), 'pairs': checkpoint['pairs'] + len(pair_works)}
+            update_stage('split_tags', status='running', checkpoint=checkpoint)
+    finish_stage('split_tags', work_tag_pairs=checkpoint['pairs'])
+    return None
+
+# Convert "true"/"false" CSV values into 1/0 (None if missing)
+BOOL_VALUES = {'true': 1, 'false': 0, 'True': 1, 'False': 0, 'TRUE': 1, 'FALSE': 0}
+
+def parse_bool(value: str):
+    """
+    Convert a "true"/"false" CSV value into 1/0 (None if missing).
+    """
+    return BOOL_VALUES.get(value.strip())
+
+def parse_number(value: str):
+    """
+    Convert a numeric CSV value into an int (None if missing).
+    """
+    if value == '':
+        return None
+    return int(float(value))
+
+def ingest_tags(file, conn: sqlite3.Connection) -> dict:
+    """
+    Streams the "tags" CSV into the tags table, keeping only tags with five or more 
+    associated works, in a single pass.
+    
+    Parameters:
+        file: Open text file (or stream) of the tags CSV.
+        conn (sqlite3.Connection): Connection to fanfic.db.
+    
+    Returns:
+        tag_ids (dict): Dictionary of the kept tags' IDs, from their text in the works CSV 
+                        to their integer value.
+    """
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS tags")
+    cur.execute("""
+    CREATE TABLE tags (
+    id INTEGER,
+    type TEXT,
+    name TEXT,
+    canonical INTEGER,
+    cached_count INTEGER,
+    merger_id REAL
+    );
+    """)
+    reader = csv.reader(file)
+    header = next(reader)
+    columns = {name: index for index, name in enumerate(header)}
+    tag_ids = {}
+    rows = []
+    for row in reader:
+        cached_count = parse_number(row[columns['cached_count']])
+        if cached_count is None or cached_count < 5:
+            continue
+        tag_id = int(row[columns['id']])
+        tag_ids[str(tag_id)] = tag_id
+        rows.append((tag_id,
+                     row[columns['type']] or None,
+                     row[columns['name']] or None,
+                     parse_bool(row[columns['canonical']]),
+                     cached_count,
+                     parse_number(row[columns['merger_id']])))
+        if len(rows) >= 50000:
+            cur.executemany("INSERT INTO tags VALUES (?, ?, ?, ?, ?, ?)", rows)
+            rows = []
+    cur.executemany("INSERT INTO tags VALUES (?, ?, ?, ?, ?, ?)", rows)
+    return tag_ids
+
+def ingest_works(file, conn: sqlite3.Connection, tag_ids: dict, workers: int = 1,
+                 checkpoint: dict = None) -> tuple:
+    """
+    Streams the "works" CSV into the works table, assigning work_id in file order,
+    and fills work_tag_pairs from each work's tags in the same pass.
+    Each batch is committed and checkpointed in the build manifest (as the "ingest" stage).
+    
+    Parameters:
+        file: Open text file (or stream) of the works CSV.
+        conn (sqlite3.Connection): Connection to fanfic.db.
+        tag_ids (dict): IDs of the tags to keep pairs for, as returned by ingest_tags.
+        workers (int): Number of worker processes splitting tags in parallel.
+        checkpoint (dict): Checkpoint of an interrupted run to resume after,
+                           holding the last committed work_id and the number of pairs so far.
+    
+    Returns:
+        Tuple:
+            - num_works (int): Number of works loaded (by this run).
+            - num_pairs (int): Number of work-tag pairs loaded (by this run).
+    """
+    checkpoint = dict(checkpoint or {})
+    resume_after = checkpoint.get('work_id', 0)
+    cur = conn.cursor()
+    if resume_after:
+        # Drop rows written after the last checkpoint
+        cur.execute("DELETE FROM works WHERE work_id > ?", (resume_after,))
+        cur.execute("DELETE FROM work_tag_pairs WHERE work_id > ?", (resume_after,))
+        conn.commit()
+        return continue_ingest_works(file, conn, tag_ids, workers, checkpoint)
+    cur.execute("DROP TABLE IF EXISTS works")
+    cur.execute("DROP TABLE IF EXISTS work_tag_pairs")
+    cur.execute("""
+    CREATE TABLE works(work_id INTEGER PRIMARY KEY AUTOINCREMENT, 
+                       creation_date TEXT, 
+                       language TEXT, 
+                       restricted BOOL, 
+                       complete BOOL, 
+                       word_count INT, 
+                       tags TEXT)
+    """)
+    cur.execute("""
+    CREATE TABLE work_tag_pairs (
+    work_id INTEGER,
+    tag_id INTEGER,
+    FOREIGN KEY (work_id) REFERENCES works(work_id),
+    FOREIGN KEY (tag_id) REFERENCES tags(tag_id)
+    );
+    """)
+    conn.commit()
+    return continue_ingest_works(file, conn, tag_ids, workers, checkpoint)
+
+def continue_ingest_works(file, conn: sqlite3.Connection, tag_ids: dict, workers: int,
+                          checkpoint: dict) -> tuple:
+    """
+    Loads the works after the checkpoint's work_id from the works CSV, as ingest_works does.
+    
+    Parameters:
+        file: Open text file (or stream) of the works CSV.
+        conn (sqlite3.Connection): Connection to fanfic.db.
+        tag_ids (dict): IDs of the tags to keep pairs for, as returned by ingest_tags.
+        workers (int): Number of worker processes splitting tags in parallel.
+        checkpoint (dict): Checkpoint to continue from (may be empty).
+    
+    Returns:
+        Tuple:
+            - num_works (int): Number of works loaded.
+            - num_pairs (int): Number of work-tag pairs loaded.
+    """
+    resume_after = checkpoint.get('work_id', 0)
+    cur = conn.cursor()
+    reader = csv.reader(file)
+    header = next(reader)
+    columns = {name: index for index, name in enumerate(header)}
+    date, language = columns['creation date'], columns['language']
+    restricted, complete = columns['restricted'], columns['complete']
+    word_count, tags = columns['word_count'], columns['tags']
+    def read_batches():
+        # Yield batches of work rows, along with their work IDs and tags for splitting
+        works = []
+        get_bool = BOOL_VALUES.get
+        for work_id, row in enumerate(reader, start=1):
+            # Skip works committed before the checkpoint
+            if work_id <= resume_after:
+                continue
+            works.append((work_id,
+                          row[date] or None,
+                          row[language] or None,
+                          get_bool(row[restricted]),
+                          get_bool(row[complete]),
+                          parse_number(row[word_count]),
+                          row[tags] or None))
+            if len(works) >= 50000:
+                yield works, [work[0] for work in works], [work[6] for work in works]
+                works = []
+        yield works, [work[0] for work in works], [work[6] for work in works]
+
+    num_works = num_pairs = 0
+    # Split the tags (in parallel if workers > 1) while this process reads and writes
+    for works, pair_works, pair_tags in parse_tag_pairs(read_batches(), tag_ids, workers):
+        cur.executemany("INSERT INTO works VALUES (?, ?, ?, ?, ?, ?, ?)", works)
+        cur.executemany("INSERT INTO work_tag_pairs VALUES (?, ?)",
+                        zip(pair_works.tolist(), pair_tags.tolist()))
+        conn.commit()
+        num_works, num_pairs = num_works + len(works), num_pairs + len(pair_works)
+        if works:
+            checkpoint['work_id'] = works[-1][0]
+            checkpoint['pairs'] = checkpoint.get('pairs', 0) + len(pair_works)
+            update_stage('ingest', status='running', checkpoint=checkpoint)
+    return num_works, num_pairs
+
+def stream_ingest(workers: int = 1) -> None:
+    """
+    Builds the tags, works, and work_tag_pairs tables in a single streaming pass over each CSV,
+    replacing csv_to_db, preprocess, and split_tags. Tags are read first so work-tag pairs
+    can be filtered while the works are loaded. Uses bulk inserts with a write-ahead log and
+    syncing turned off, creates the indexes after loading, and reports rows/s for each stage.
+    Progress is checkpointed in the build manifest, so an interrupted run resumes 
+    after the last committed batch of works.
+    
+    Parameters:
+        workers (int): Number of worker processes splitting tags in parallel.
+    
+    Returns:
+        None
+    """
+    checkpoint = stage_checkpoint('ingest') or {}
+    with sqlite3.connect(DB_PATH) as conn:
+        # Build-time settings: write-ahead log (so an interrupted build can't corrupt 
+        # the database), no waiting for the disk, bigger page cache
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")
+        start = time.perf_counter()
+        if checkpoint.get('tags'):
+            # Tags were loaded before the interruption
+            tag_ids = {str(tag_id): tag_id for (tag_id,) in conn.execute("SELECT id FROM tags")}
+        else:
+            with open_dump_csv('tags') as file:
+                tag_ids = ingest_tags(file, conn)
+            conn.commit()
+            checkpoint = {'tags': len(tag_ids)}
+            update_stage('ingest', status='running', checkpoint=checkpoint)
+        elapsed = time.perf_counter() - start
+        print(f"Loaded {len(tag_ids):,} tags in {elapsed:.1f}s "
+              f"({len(tag_ids) / max(elapsed, 1e-9):,.0f} rows/s)")
+        start = time.perf_counter()
+        if checkpoint.get('work_id'):
+            print(f"Resuming after work {checkpoint['work_id']:,}")
+        with open_dump_csv('works') as file:
+            num_works, num_pairs = ingest_works(file, conn, tag_ids, workers, checkpoint)
+        elapsed = time.perf_counter() - start
+        print(f"Loaded {num_works:,} works and {num_pairs:,} work-tag pairs in {elapsed:.1f}s "
+              f"({(num_works + num_pairs) / max(elapsed, 1e-9):,.0f} rows/s)")
+        checkpoint = stage_checkpoint('ingest')
+        # Fold the write-ahead log back in, leaving a single database file
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA journal_mode = DELETE")
+    finish_stage('ingest', tags=len(tag_ids), works=checkpoint.get('work_id', 0),
+                 work_tag_pairs=checkpoint.get('pairs', 0))
+    # Index after loading, which is much faster than keeping the index up to date while inserting
+    start = time.perf_counter()
+    create_indexes()
+    elapsed = time.perf_counter() - start
+    num_pairs = checkpoint.get('pairs', 0)
+    print(f"Indexed {num_pairs:,} work-tag pairs in {elapsed:.1f}s "
+          f"({num_pairs / max(elapsed, 1e-9):,.0f} rows/s)")
+    return None
+
+def build_tag_stats() -> None:
+    """
+    Creates the tag_stats table, holding each tag's works counted by creation year, 
+    word bracket, and completion, along with the word count sum and maximum, and the
+    tag_word_bins table, holding each tag's works counted by word count histogram bin
+    (see processing.WORD_BIN_EDGES).
+    All tags are counted together in one grouped pass over work_tag_pairs and works per table,
+    so the dashboard can answer a search with a single keyed lookup.
+    
+    Parameters:
+        None
+    
+    Returns:
+        None
+    """
+    from src.processing import word_bracket_sql, word_bin_sql, works_sql, filter_sql
+    with sqlite3.connect(DB_PATH) as conn:
+        cur = conn.cursor()
+        year, complete_works = works_sql(is_compact(conn))
+        # Only works in the latest dump, if newer dumps have been added
+        current, _ = filter_sql({}, is_compact(conn), is_versioned(conn))
+        # Replace any partially built table from an earlier run
+        cur.execute("DROP TABLE IF EXISTS tag_stats")
+        cur.execute("""
+        CREATE TABLE tag_stats (
+        tag_id INTEGER,
+        creation_year TEXT,
+        word_bracket TEXT,
+        complete INTEGER,
+        num_works INTEGER,
+        total_words INTEGER,
+        max_words INTEGER,
+        PRIMARY KEY (tag_id, creation_year, word_bracket, complete)
+        ) WITHOUT ROWID;
+        """)
+        # Group every work-tag pair by tag and the three dashboard dimensions at once
+        cur.execute(f"""
+        INSERT INTO tag_stats
+        SELECT
+            work_tag_pairs.tag_id,
+            {year} AS creation_year,
+            {word_bracket_sql("works.word_count")} AS word_bracket,
+            works.complete,
+            COUNT(*),
+            SUM(works.word_count),
+            MAX(works.word_count)
+        FROM work_tag_pairs
+        JOIN works ON works.work_id = work_tag_pairs.work_id
+        WHERE {complete_works}{current}
+        GROUP BY work_tag_pairs.tag_id, creation_year, word_bracket, works.complete
+        """)
+        cur.execute("DROP TABLE IF EXISTS tag_word_bins")
+        cur.execute("""
+        CREATE TABLE tag_word_bins (
+        tag_id INTEGER,
+        word_bin INTEGER,
+        num_works INTEGER,
+        PRIMARY KEY (tag_id, word_bin)
+        ) WITHOUT ROWID;
+        """)
+        cur.execute(f"""
+        INSERT INTO tag_word_bins
+        SELECT
+            work_tag_pairs.tag_id,
+            {word_bin_sql("works.word_count")} AS word_bin,
+            COUNT(*)
+        FROM work_tag_pairs
+        JOIN works ON works.work_id = work_tag_pairs.work_id
+        WHERE {complete_works}{current}
+        GROUP BY work_tag_pairs.tag_id, word_bin
+        """)
         conn.commit()
     return None
 
+def table_exists(table: str) -> bool:
+    """
+    Check if the given table exists in fanfic.db.
+    
+    Parameters:
+        table (str): Name of the table.
+    
+    Returns:
+        boolean: True if the table exists, False if not.
+    """
+    with sqlite3.connect(DB_PATH) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,))
+        return cur.fetchone() is not None
+
+def create_indexes() -> None:
+    """
+    Creates the indexes used when searching for a tag's works, if they don't exist already.
+    The (tag_id, work_id) index lets a tag's works be found and joined to the works table
+    without scanning all of work_tag_pairs, and the tags indexes find a tag's name by its ID
+    (e.g. for the related tags) and a tag's ID by its name, ignoring case (see processing.find_tag).
+    
+    Parameters:
+        None
+    
+    Returns:
+        None
+    """
+    with sqlite3.connect(DB_PATH) as conn:
+        cur = conn.cursor()
+        # A compacted work_tag_pairs table is already stored in (tag_id, work_id) order
+        if not is_compact(conn):
+            cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_work_tag_pairs_tag
+            ON work_tag_pairs (tag_id, work_id)
+            """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_tags_id ON tags (id)")
+        # Built with the same collation as find_tag's comparison, so SQLite can search it
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_tags_name ON tags (name COLLATE NOCASE)")
+        conn.commit()
+    return None
+
+def compact_database() -> None:
+    """
+    Rewrites fanfic.db in the compact layout, which is read the same way but takes less space,
+    so more of it fits in the page cache:
+    - works stores the creation year and day (days since 1970-01-01) as integers, 
+      so years aren't sliced out of date text on every search, and languages as IDs
+      into a new languages table. The tags text, already split into work_tag_pairs, is dropped.
+    - work_tag_pairs becomes a WITHOUT ROWID table keyed by (tag_id, work_id), so a tag's works
+      are read straight from the table instead of through a separate index.
+    The file is then vacuumed to give the freed pages back, and its size before and after
+    is printed and recorded in the build manifest.
+    
+    Parameters:
+        None
+    
+    Returns:
+        None
+    """
+    size_before = os.path.getsize(DB_PATH)
+    with sqlite3.connect(DB_PATH) as conn:
+        cur = conn.cursor()
+        if not is_compact(conn):
+            # Replace any partially built tables from an earlier run
+            for table in ['languages', 'compact_works', 'compact_pairs']:
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
+            cur.execute("CREATE TABLE languages (id INTEGER PRIMARY KEY, code TEXT UNIQUE)")
+            cur.execute("""
+            INSERT INTO languages (code)
+            SELECT DISTINCT language FROM works WHERE language IS NOT NULL ORDER BY language
+            """)
+            # Keep the dump versions of databases that newer dumps were added to
+            versioned = is_versioned(conn)
+            versions = ", first_version INTEGER NOT NULL DEFAULT 1, removed_version INTEGER" if versioned else ""
+            cur.execute(f"""
+            CREATE TABLE compact_works (work_id INTEGER PRIMARY KEY, 
+                                        creation_year INTEGER, 
+                                        creation_day INTEGER, 
+                                        language INTEGER, 
+                                        restricted INTEGER, 
+                                        complete INTEGER, 
+                                        word_count INTEGER{versions})
+            """)
+            # julianday() of 1970-01-01 is 2440587.5
+            cur.execute(f"""
+            INSERT INTO compact_works
+            SELECT works.work_id,
+                   CAST(substr(works.creation_date, 1, 4) AS INTEGER),
+                   CAST(julianday(works.creation_date) - 2440587.5 AS INTEGER),
+                   languages.id,
+                   works.restricted,
+                   works.complete,
+                   works.word_count
+                   {", works.first_version, works.removed_version" if versioned else ""}
+            FROM works
+            LEFT JOIN languages ON languages.code = works.language
+            """)
+            cur.execute("""
+            CREATE TABLE compact_pairs (
+            tag_id INTEGER,
+            work_id INTEGER,
+            PRIMARY KEY (tag_id, work_id)
+            ) WITHOUT ROWID
+            """)
+            # Inserting in key order appends to the table's B-tree
+            cur.execute("""
+            INSERT OR IGNORE INTO compact_pairs
+            SELECT tag_id, work_id FROM work_tag_pairs ORDER BY tag_id, work_id
+            """)
+            # Swap the compact tables in (dropping work_tag_pairs also drops its index)
+            cur.execute("DROP TABLE works")
+            cur.execute("ALTER TABLE compact_works RENAME TO works")
+            cur.execute("DROP TABLE work_tag_pairs")
+            cur.execute("ALTER TABLE compact_pairs RENAME TO work_tag_pairs")
+            # All of the above is one transaction, so a crash leaves the old tables as they were
+            conn.commit()
+        # Rewrite the file without the freed pages
+        conn.execute("VACUUM")
+    size_after = os.path.getsize(DB_PATH)
+    print(f"Compacted fanfic.db from {size_before / 2**20:,.1f} MB to {size_after / 2**20:,.1f} MB "
+          f"({1 - size_after / max(size_before, 1):.0%} smaller)")
+    update_stage('compact', size_before=size_before, size_after=size_after)
+    return None
+
+def drop_derived_data() -> None:
+    """
+    Deletes the tables and files built from the works and tags tables 
+    (tag search index, tag statistics, related tags, and columnar store), so they are rebuilt,
+    along with the work hashes of newer dumps that were added.
+    
+    Parameters:
+        None
+    
+    Returns:
+        None
+    """
+    from src.incremental import HASHES_PATH
+    if os.path.exists(DB_PATH):
+        with sqlite3.connect(DB_PATH) as conn:
+            cur = conn.cursor()
+            for table in ['tag_search', 'tag_names', 'tag_stats', 'tag_word_bins', 'related_tags',
+                          'related_tag_sizes']:
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.commit()
+    shutil.rmtree(COLUMNS_DIR, ignore_errors=True)
+    if os.path.exists(HASHES_PATH):
+        os.remove(HASHES_PATH)
+    return None
+
 def check_if_exists():
     """
-    Check if "tags" and "works" CSV files already exist.
+    Check if "tags" and "works" CSV files (or the zip file containing them) already exist.
     Check if SQLite fanfic.db database already exists.
     Check that works, tags, and work_tag_pairs tables exist in fanfic.db database
     
@@ -167,35 +920,32 @@ def check_if_exists():
         boolean: False if any of the above checks fail, 
                  True if all necessary files, databases, and tables exist.
     """
-    # Check if both CSV files exist, return False if not
-    tags = Path("data/tags-20210226.csv")
-    works = Path("data/works-20210226.csv")
-    if not (tags.is_file() and works.is_file()):
+    # Check if both CSV files (or the zip file) exist, return False if not
+    paths = dump_paths()
+    tags = Path(paths['tags'])
+    works = Path(paths['works'])
+    if not (tags.is_file() and works.is_file()) and not Path(paths['zip']).is_file():
         return False
     
     # Check if fanfic.db database exists, return False if not
-    if not os.path.exists('data/fanfic.db'):
+    if not os.path.exists(DB_PATH):
         return False
     
-    with sqlite3.connect('data/fanfic.db') as conn:
-        # Check if the tables exist in the database
-        tables_exist = {'works': False, 'tags': False, 'work_tag_pairs': False}
-        # Get the DataFrame of existing tables in fanfic.db
-        query = "SELECT name FROM sqlite_master WHERE type='table';"
-        existing_tables = pd.read_sql_query(query, conn)
-        # Check if each of the three tables in tables_exist exist
-        for table in tables_exist:
-            if table in existing_tables['name'].values:
-                tables_exist[table] = True
-        # If any one of the tables is missing, return False
-        if not all(tables_exist.values()):
-            return False
+    # Check that the works, tags, and work_tag_pairs tables exist in the database
+    # (a plain SQL query, so checking doesn't need pandas)
+    with sqlite3.connect(DB_PATH) as conn:
+        existing_tables = {row[0] for row in 
+                           conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    # If any one of the tables is missing, return False
+    if not {'works', 'tags', 'work_tag_pairs'} <= existing_tables:
+        return False
     # Return True if all checks have passed
     return True
 
-def data_prep_process() -> None:
+def adopt_existing_build() -> None:
     """
-    Check if all necessary files exist - if not, run the data preparation process.
+    Records a database built before the build manifest existed in a new manifest,
+    marking the stages whose tables (or files) exist as done.
     
     Parameters:
         None
@@ -203,18 +953,129 @@ def data_prep_process() -> None:
     Returns:
         None
     """
-    # If the check fails:
-    if not check_if_exists():
-        # Import data
-        print("Importing Data...")
-        import_data()
-        # Create fanfic.db database
-        print("Creating SQL Database...")
-        csv_to_db()
-        # Preprocessing steps
-        print("Preprocessing...")
-        preprocess()
-        # Create work_tag_pairs table in fanfic.db
-        print("Creating work-tag pairs... (This may take some time, thank you for your patience)")
-        split_tags()
-    return None
\ No newline at end of file
+    record_sources()
+    finish_stage('import')
+    finish_stage('database')
+    for stage, exists in [('tag_search', table_exists('tag_search')),
+                          ('tag_stats', table_exists('tag_stats')),
+                          ('columns', os.path.isdir(COLUMNS_DIR))]:
+        if exists:
+            finish_stage(stage)
+    return None
+
+def data_prep_process(build_stats: bool = False, build_columns: bool = False, 
+                      build_related: bool = False, streaming: bool = False,
+                      compact: bool = False, workers: int = 1, extra_dumps: list = None) -> None:
+    """
+    Check if all necessary files exist - if not, run the data preparation process.
+    Each stage is recorded in the build manifest (manifest.json, next to the database) when it finishes, 
+    so finished stages are skipped without touching the database, and a stage that was
+    interrupted resumes from its last checkpoint.
+    
+    Parameters:
+        build_stats (bool): If True, also precompute the tag_stats table 
+                            (if it doesn't exist already) after the work-tag pairs are created.
+        build_columns (bool): If True, also save the memory-mapped columnar store 
+                              (if it doesn't exist already).
+        build_related (bool): If True, also count every tag's related tags into the 
+                              related_tags table (this needs the columnar store, so it is 
+                              saved too).
+        streaming (bool): If True, build the database with stream_ingest instead of
+                          csv_to_db, preprocess, and split_tags.
+        compact (bool): If True, also rewrite the database in the smaller compact layout
+                        (see compact_database) once it is built.
+        workers (int): Number of worker processes splitting tags into work-tag pairs
+                       and counting related tags.
+        extra_dumps (list): Newer data dumps to add to the database once it is built
+                            (see incremental.add_dump), as (dump_date, partial) tuples.
+    
+    Returns:
+        None
+    """
+    # Databases built before the manifest existed are recorded as they are
+    if not load_manifest()['stages'] and check_if_exists():
+        adopt_existing_build()
+    # If the database was deleted, everything has to be built again
+    if stage_done('database') and not os.path.exists(DB_PATH):
+        reset_stages(list(load_manifest()['stages']))
+    if not stage_done('database'):
+        # Import data (again, if the files changed or disappeared before the database was built)
+        if not stage_done('import') or sources_changed():
+            reset_stages(['import', 'ingest', 'csv_to_db', 'preprocess', 'split_tags'])
+            print("Importing Data...")
+            # The streaming build reads the CSV files straight from the zip file
+            import_data(extract=not streaming)
+            record_sources()
+            finish_stage('import')
+        # Anything derived from an earlier database is out of date, 
+        # and newer dumps are added to the new database again
+        reset_stages(DERIVED_STAGES + [stage for stage in load_manifest()['stages'] 
+                                       if stage.startswith('dump_')])
+        drop_derived_data()
+        if streaming:
+            # Create the tables of fanfic.db in one streaming pass over each CSV
+            print("Creating SQL Database (streaming)...")
+            stream_ingest(workers)
+        else:
+            if not stage_done('csv_to_db'):
+                # Create fanfic.db database
+                print("Creating SQL Database...")
+                csv_to_db()
+            if not stage_done('preprocess'):
+                # Preprocessing steps
+                print("Preprocessing...")
+                preprocess()
+            if not stage_done('split_tags'):
+                # Create work_tag_pairs table in fanfic.db
+                print("Creating work-tag pairs... (This may take some time, thank you for your patience)")
+                split_tags(workers)
+        finish_stage('database')
+    # Optional stage: rewrite the database in the compact layout
+    if compact and not stage_done('compact'):
+        print("Compacting database...")
+        compact_database()
+        finish_stage('compact')
+    # Index work_tag_pairs by tag (also upgrades databases built before the index existed)
+    if not stage_done('indexes'):
+        create_indexes()
+        finish_stage('indexes')
+    # Build the tag search index
+    if not stage_done('tag_search'):
+        print("Indexing tag names...")
+        build_tag_search()
+        finish_stage('tag_search')
+    # Statistics counted with other word brackets than the configured ones are counted again
+    if tag_stats_stale():
+        with sqlite3.connect(DB_PATH) as conn:
+            conn.execute("DROP TABLE IF EXISTS tag_stats")
+        reset_stages(['tag_stats'])
+    # Optional final stage: precompute per-tag statistics
+    if build_stats and not stage_done('tag_stats'):
+        print("Precomputing tag statistics...")
+        build_tag_stats()
+        update_stage('tag_stats', word_brackets=WORD_BRACKET_EDGES)
+        finish_stage('tag_stats')
+    # Optional final stage: save the columnar store
+    if (build_columns or build_related) and not stage_done('columns'):
+        print("Saving columnar store...")
+        build_columnar_store()
+        finish_stage('columns')
+    # Optional final stage: count each tag's related tags from the columnar store
+    if build_related and not stage_done('related_tags'):
+        print("Finding related tags...")
+        # Databases indexed before the tags index existed get it here
+        create_indexes()
+        build_related_tags(workers=workers)
+        finish_stage('related_tags')
+    # Add the newer dumps, oldest first, updating the tables and store built above in place
+    for dump_date, partial in sorted(extra_dumps or []):
+        if not stage_done(dump_stage(dump_date)):
+            from src.incremental import add_dump
+            print(f"Adding the {dump_date} dump...")
+            add_dump(dump_date, partial, workers)
+            finish_stage(dump_stage(dump_date))
+    # Record the finished database, so the next start can skip these checks (see dataset_ready),
+    # with the filter options, so it doesn't have to count them either
+    from src.processing import count_filter_options
+    mark_ready(count_filter_options())
+    return None
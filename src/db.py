@@ -0,0 +1,168 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+
+# Path of the database, configurable through an environment variable
+DB_PATH = os.environ.get('AO3_DB_PATH', 'data/fanfic.db')
+
+# Open read connections with immutable=1, so SQLite skips file locking and change detection.
+# Nothing writes to the database while serving (it is only written by data prep, and
+# connections are reopened when it changes), so this is on unless turned off.
+DB_IMMUTABLE = os.environ.get('AO3_DB_IMMUTABLE', '1') == '1'
+
+# PRAGMAs set on every read connection: memory-map the file so pages are shared between
+# processes through the page cache, keep a larger page cache, and refuse to write
+READ_PRAGMAS = {
+    'mmap_size': int(os.environ.get('AO3_DB_MMAP_MB', '1024')) * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+    'query_only': 1
+}
+
+# Each thread's read connection, reopened if the database file is replaced
+local = threading.local()
+
+class MissingTableError(sqlite3.OperationalError):
+    """
+    Raised by query_frame and query_rows when the query reads a table that hasn't been built,
+    so optional tables (tag_stats, related_tags, the tag search index, ...) can be told apart
+    from other database errors, such as an interrupted or failed query.
+    """
+    pass
+
+def database_fingerprint(path: str = DB_PATH) -> tuple:
+    """
+    Identify the current version of the database from its size and modification time,
+    so cached results (and connections) can be dropped when the database is rebuilt.
+
+    Parameters:
+        path (str): Path of the database file.
+
+    Returns:
+        fingerprint (tuple): (size, modification time), or None if the file doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+def open_read_connection(path: str = DB_PATH) -> sqlite3.Connection:
+    """
+    Open a read-only connection to the database, set up for serving queries.
+
+    Parameters:
+        path (str): Path of the database file.
+
+    Returns:
+        conn (sqlite3.Connection): Read-only connection.
+    """
+    uri = f"file:{os.path.abspath(path)}?mode=ro"
+    if DB_IMMUTABLE:
+        uri += "&immutable=1"
+    # Statements are prepared once per connection and reused from its statement cache
+    conn = sqlite3.connect(uri, uri=True, cached_statements=256)
+    for pragma, value in READ_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    return conn
+
+def read_connection() -> sqlite3.Connection:
+    """
+    Get this thread's read-only connection to the database, opening it on first use.
+    The connection is reopened when the database file changes (e.g. after a rebuild)
+    or in a new process (connections must not be shared across a fork).
+
+    Parameters:
+        None
+
+    Returns:
+        conn (sqlite3.Connection): Read-only connection.
+    """
+    key = (os.getpid(), database_fingerprint(DB_PATH))
+    if getattr(local, 'key', None) != key:
+        if getattr(local, 'conn', None) is not None and local.key[0] == os.getpid():
+            local.conn.close()
+        local.conn = open_read_connection(DB_PATH)
+        local.key = key
+    return local.conn
+
+def is_compact(conn: sqlite3.Connection = None) -> bool:
+    """
+    Check whether the database uses the compact layout (see data_prep.compact_database),
+    where the works table stores integer creation years, days, and language IDs
+    instead of the creation date, language, and tags text.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to check (default: this thread's read connection).
+
+    Returns:
+        boolean: True if the works table has the compact layout.
+    """
+    if conn is None:
+        conn = read_connection()
+    return any(row[1] == 'creation_day' for row in conn.execute("PRAGMA table_info(works)"))
+
+def is_versioned(conn: sqlite3.Connection = None) -> bool:
+    """
+    Check whether newer data dumps have been added to the database (see incremental.add_dump),
+    so each work records the dump version it first appeared in and the one it was removed in.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to check (default: this thread's read connection).
+
+    Returns:
+        boolean: True if the works table has version columns.
+    """
+    if conn is None:
+        conn = read_connection()
+    return any(row[1] == 'removed_version' for row in conn.execute("PRAGMA table_info(works)"))
+
+def query_frame(sql: str, params: tuple = ()) -> pd.DataFrame:
+    """
+    Run a parameterized query on this thread's read connection.
+
+    Parameters:
+        sql (str): SQL query, with ? placeholders for every value.
+        params (tuple): Values of the placeholders.
+
+    Returns:
+        result (pd.DataFrame): Query result.
+    """
+    try:
+        return pd.read_sql_query(sql, read_connection(), params=params)
+    except pd.errors.DatabaseError as error:
+        # pandas wraps the SQLite error, which is kept as the cause
+        if is_missing_table(error.__cause__):
+            raise MissingTableError(str(error.__cause__)) from error
+        raise
+
+def query_rows(sql: str, params: tuple = ()) -> list:
+    """
+    Run a parameterized query on this thread's read connection.
+
+    Parameters:
+        sql (str): SQL query, with ? placeholders for every value.
+        params (tuple): Values of the placeholders.
+
+    Returns:
+        rows (list): List of result rows, as tuples.
+    """
+    try:
+        return read_connection().execute(sql, params).fetchall()
+    except sqlite3.OperationalError as error:
+        if is_missing_table(error):
+            raise MissingTableError(str(error)) from error
+        raise
+
+def is_missing_table(error: Exception) -> bool:
+    """
+    Check whether a database error is about a table that doesn't exist.
+
+    Parameters:
+        error (Exception): Error raised by SQLite.
+
+    Returns:
+        boolean: True if the error is SQLite's "no such table".
+    """
+    return isinstance(error, sqlite3.OperationalError) and str(error).startswith('no such table')
@@ -0,0 +1,603 @@
+import os
+import csv
+import time
+import sqlite3
+import hashlib
+import datetime
+import numpy as np
+from src.db import DB_PATH, is_compact, is_versioned
+from src.search import fold_tag
+from src.manifest import DUMP_DATE, update_stage, finish_stage, stage_done, tag_stats_stale
+from src.columnar import (update_columnar_store, build_columnar_store, build_related_tags,
+                          update_related_table, load_columnar_store, work_tag_ids)
+from src.data_prep import (BOOL_VALUES, parse_bool, parse_number, parse_tag_pairs,
+                           open_dump_csv, import_data, dump_url)
+
+# Adding a newer data dump to fanfic.db in place, instead of building the database again.
+# Dumps have no work IDs, so works are matched by a hash of their contents: a work whose
+# contents changed is removed (with the dump's version) and added again as a new work.
+
+# Content hash of every work, indexed by work_id, kept next to the database
+HASHES_PATH = os.path.join(os.path.dirname(DB_PATH), 'work_hashes.npy')
+
+# Rows of the works CSV written per batch
+BATCH_ROWS = 50000
+
+def work_hash(row: list, columns: dict) -> int:
+    """
+    Hash the contents of a row of the works CSV, in a form that doesn't depend on how the
+    dump writes its values (e.g. "true" or "True", or the order of the tags).
+
+    Parameters:
+        row (list): Row of the works CSV.
+        columns (dict): Index of each column of the works CSV, by name.
+
+    Returns:
+        hash (int): Signed 64-bit hash of the work.
+    """
+    tags = row[columns['tags']]
+    key = '\x1f'.join([row[columns['creation date']], row[columns['language']],
+                       str(parse_bool(row[columns['restricted']])),
+                       str(parse_bool(row[columns['complete']])),
+                       str(parse_number(row[columns['word_count']])),
+                       '+'.join(sorted(tag.strip() for tag in tags.split('+'))) if tags else ''])
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+def dump_hashes(dump_date: str) -> np.ndarray:
+    """
+    Hash every work of a data dump's works CSV, in file order.
+
+    Parameters:
+        dump_date (str): Date of the data dump, as YYYYMMDD.
+
+    Returns:
+        hashes (np.ndarray): Hash of each row of the works CSV.
+    """
+    with open_dump_csv('works', dump_date) as file:
+        reader = csv.reader(file)
+        columns = {name: index for index, name in enumerate(next(reader))}
+        return np.fromiter((work_hash(row, columns) for row in reader), dtype=np.int64)
+
+def surplus_rows(keys: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """
+    Find the keys that have no match among the others, counting duplicates: if a key
+    appears three times in keys and once in others, its last two appearances are surplus.
+
+    Parameters:
+        keys (np.ndarray): Keys to match.
+        others (np.ndarray): Keys to match them against.
+
+    Returns:
+        surplus (np.ndarray): Boolean mask of the keys without a match.
+    """
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    # Rank of each key among the equal keys before it
+    ranks = np.arange(len(keys)) - np.searchsorted(sorted_keys, sorted_keys, side='left')
+    others = np.sort(others)
+    available = (np.searchsorted(others, sorted_keys, side='right')
+                 - np.searchsorted(others, sorted_keys, side='left'))
+    surplus = np.zeros(len(keys), dtype=bool)
+    surplus[order] = ranks >= available
+    return surplus
+
+def has_table(conn: sqlite3.Connection, table: str) -> bool:
+    """
+    Check if the given table exists, on the dump's own connection (a second connection
+    would wait for the dump's transaction).
+    """
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", 
+                        (table,)).fetchone() is not None
+
+def enable_versions(conn: sqlite3.Connection) -> None:
+    """
+    Prepare the database for newer dumps (once): add the first_version and removed_version
+    columns to the works table, create the dumps table with the original dump as version 1,
+    and save the content hash of every work (from the original dump's works CSV).
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to fanfic.db.
+
+    Returns:
+        None
+    """
+    cur = conn.cursor()
+    if not is_versioned(conn):
+        # Adding columns with a constant default doesn't rewrite the table
+        cur.execute("ALTER TABLE works ADD COLUMN first_version INTEGER NOT NULL DEFAULT 1")
+        cur.execute("ALTER TABLE works ADD COLUMN removed_version INTEGER")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS dumps (
+    version INTEGER PRIMARY KEY,
+    dump_date TEXT UNIQUE,
+    partial INTEGER,
+    works INTEGER,
+    added INTEGER,
+    removed INTEGER,
+    ingested REAL
+    );
+    """)
+    if cur.execute("SELECT COUNT(*) FROM dumps").fetchone()[0] == 0:
+        num_works = cur.execute("SELECT COUNT(*) FROM works").fetchone()[0]
+        cur.execute("INSERT INTO dumps VALUES (1, ?, 0, ?, ?, 0, ?)",
+                    (DUMP_DATE, num_works, num_works, time.time()))
+    conn.commit()
+    if not os.path.isfile(HASHES_PATH):
+        # Work IDs were given in the original works CSV's order, from 1
+        print("Hashing the original dump's works...")
+        np.save(HASHES_PATH, np.concatenate([[0], dump_hashes(DUMP_DATE)]))
+    return None
+
+def upsert_tags(conn: sqlite3.Connection, dump_date: str) -> list:
+    """
+    Bring the tags table up to date with a dump's tags CSV: tags with five or more
+    associated works are added if they are new, and updated if their name, type, or
+    count changed. The tag search index is updated for the changed tags only.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to fanfic.db, in the dump's transaction.
+        dump_date (str): Date of the data dump, as YYYYMMDD.
+
+    Returns:
+        new_tags (list): IDs of the tags added to the tags table.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+    CREATE TEMP TABLE dump_tags (
+    id INTEGER PRIMARY KEY,
+    type TEXT,
+    name TEXT,
+    canonical INTEGER,
+    cached_count INTEGER,
+    merger_id REAL
+    );
+    """)
+    with open_dump_csv('tags', dump_date) as file:
+        reader = csv.reader(file)
+        columns = {name: index for index, name in enumerate(next(reader))}
+        rows = []
+        for row in reader:
+            cached_count = parse_number(row[columns['cached_count']])
+            if cached_count is None or cached_count < 5:
+                continue
+            rows.append((int(row[columns['id']]),
+                         row[columns['type']] or None,
+                         row[columns['name']] or None,
+                         parse_bool(row[columns['canonical']]),
+                         cached_count,
+                         parse_number(row[columns['merger_id']])))
+            if len(rows) >= BATCH_ROWS:
+                cur.executemany("INSERT OR REPLACE INTO dump_tags VALUES (?, ?, ?, ?, ?, ?)", rows)
+                rows = []
+        cur.executemany("INSERT OR REPLACE INTO dump_tags VALUES (?, ?, ?, ?, ?, ?)", rows)
+    # Tags that are new or differ from the tags table
+    cur.execute("""
+    CREATE TEMP TABLE changed_tags AS
+    SELECT dump_tags.id, tags.name AS old_name, tags.id IS NULL AS added
+    FROM dump_tags
+    LEFT JOIN tags ON tags.id = dump_tags.id
+    WHERE tags.id IS NULL
+       OR tags.type IS NOT dump_tags.type
+       OR tags.name IS NOT dump_tags.name
+       OR tags.canonical IS NOT dump_tags.canonical
+       OR tags.cached_count IS NOT dump_tags.cached_count
+       OR tags.merger_id IS NOT dump_tags.merger_id
+    """)
+    cur.execute("""
+    UPDATE tags
+    SET type = dump_tags.type, name = dump_tags.name, canonical = dump_tags.canonical,
+        cached_count = dump_tags.cached_count, merger_id = dump_tags.merger_id
+    FROM dump_tags
+    WHERE tags.id = dump_tags.id
+      AND tags.id IN (SELECT id FROM changed_tags WHERE NOT added)
+    """)
+    cur.execute("""
+    INSERT INTO tags
+    SELECT id, type, name, canonical, cached_count, merger_id FROM dump_tags
+    WHERE id IN (SELECT id FROM changed_tags WHERE added)
+    """)
+    changed = cur.execute("""
+    SELECT changed_tags.id, changed_tags.old_name, changed_tags.added,
+           dump_tags.name, dump_tags.cached_count
+    FROM changed_tags
+    JOIN dump_tags ON dump_tags.id = changed_tags.id
+    """).fetchall()
+    if has_table(conn, 'tag_names'):
+        # The trigram index reads its content from tag_names, so a renamed tag's old name is
+        # deleted from it (with the old content) before the new name is added
+        deleted, names, indexed = [], [], []
+        for tag_id, old_name, added, name, cached_count in changed:
+            old_folded = None if added else fold_tag(old_name)
+            folded = fold_tag(name)
+            if old_folded is not None and old_folded != folded:
+                deleted.append(('delete', tag_id, old_folded))
+            if folded is not None:
+                names.append((tag_id, folded, cached_count))
+                if old_folded != folded:
+                    indexed.append((tag_id, folded))
+        cur.executemany("INSERT INTO tag_search (tag_search, rowid, folded) VALUES (?, ?, ?)", deleted)
+        cur.executemany("INSERT OR REPLACE INTO tag_names (id, folded, cached_count) VALUES (?, ?, ?)",
+                        names)
+        cur.executemany("INSERT INTO tag_search (rowid, folded) VALUES (?, ?)", indexed)
+    cur.execute("DROP TABLE dump_tags")
+    cur.execute("DROP TABLE changed_tags")
+    return [tag_id for tag_id, _, added, _, _ in changed if added]
+
+def work_row(row: list, columns: dict, work_id: int, version: int, compact: bool,
+             language_ids: dict, cur: sqlite3.Cursor) -> tuple:
+    """
+    Convert a row of the works CSV into a row of the works table, in the database's layout.
+
+    Parameters:
+        row (list): Row of the works CSV.
+        columns (dict): Index of each column of the works CSV, by name.
+        work_id (int): Work ID to give the work.
+        version (int): Version of the dump adding the work.
+        compact (bool): True if the database uses the compact layout.
+        language_ids (dict): ID of each language code (compact layout),
+                             extended with the codes first seen in this dump.
+        cur (sqlite3.Cursor): Cursor, to add new language codes with.
+
+    Returns:
+        work (tuple): Values of the works table's columns.
+    """
+    date, language = row[columns['creation date']] or None, row[columns['language']] or None
+    restricted = BOOL_VALUES.get(row[columns['restricted']])
+    complete = BOOL_VALUES.get(row[columns['complete']])
+    word_count = parse_number(row[columns['word_count']])
+    if not compact:
+        return (work_id, date, language, restricted, complete, word_count,
+                row[columns['tags']] or None, version)
+    try:
+        day = datetime.date.fromisoformat(date[:10])
+        year, day = day.year, (day - datetime.date(1970, 1, 1)).days
+    except (TypeError, ValueError):
+        year = day = None
+    if language is not None and language not in language_ids:
+        cur.execute("INSERT INTO languages (code) VALUES (?)", (language,))
+        language_ids[language] = cur.lastrowid
+    return (work_id, year, day, language_ids.get(language), restricted, complete, word_count, version)
+
+def insert_works(conn: sqlite3.Connection, dump_date: str, added: np.ndarray, matched: np.ndarray,
+                 first_work_id: int, version: int, tag_ids: dict, new_tags: dict,
+                 workers: int = 1) -> tuple:
+    """
+    Insert a dump's added works into the works table with new work IDs, and their work-tag
+    pairs into work_tag_pairs, along with pairs between the works that didn't change and
+    the tags that reached five works in this dump.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to fanfic.db, in the dump's transaction.
+        dump_date (str): Date of the data dump, as YYYYMMDD.
+        added (np.ndarray): Boolean mask of the works CSV rows to add.
+        matched (np.ndarray): Work ID of each row that isn't added (0 for added rows).
+        first_work_id (int): Work ID of the first added work.
+        version (int): Version of the dump.
+        tag_ids (dict): Dictionary of tag ID text to integer tag ID, of every tag.
+        new_tags (dict): The same, for the tags added by this dump only.
+        workers (int): Number of worker processes splitting tags in parallel.
+
+    Returns:
+        Tuple:
+            - pair_works (np.ndarray): Work ID of each pair added.
+            - pair_tags (np.ndarray): Tag ID of each pair added.
+    """
+    cur = conn.cursor()
+    compact = is_compact(conn)
+    language_ids = dict((code, language_id) for language_id, code in
+                        cur.execute("SELECT id, code FROM languages")) if compact else {}
+    with open_dump_csv('works', dump_date) as file:
+        reader = csv.reader(file)
+        columns = {name: index for index, name in enumerate(next(reader))}
+        tags = columns['tags']
+
+        def read_batches():
+            # Yield batches of added works with their work IDs and tags for splitting,
+            # and the pairs of unchanged works with the new tags (found in this process)
+            work_id = first_work_id
+            works, texts, old_works, old_tags = [], [], [], []
+            for row_number, row in enumerate(reader):
+                if added[row_number]:
+                    works.append(work_row(row, columns, work_id, version, compact, language_ids, cur))
+                    texts.append(row[tags] or None)
+                    work_id += 1
+                elif new_tags and row[tags]:
+                    for tag in row[tags].split('+'):
+                        tag_id = new_tags.get(tag.strip())
+                        if tag_id is not None:
+                            old_works.append(int(matched[row_number]))
+                            old_tags.append(tag_id)
+                if len(works) + len(old_works) >= BATCH_ROWS:
+                    yield (works, old_works, old_tags), [work[0] for work in works], texts
+                    works, texts, old_works, old_tags = [], [], [], []
+            yield (works, old_works, old_tags), [work[0] for work in works], texts
+
+        pair_works, pair_tags = [], []
+        for (works, old_works, old_tags), works_found, tags_found in parse_tag_pairs(
+                read_batches(), tag_ids, workers):
+            # The version columns come last (see enable_versions)
+            cur.executemany("INSERT INTO works VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)", works)
+            pair_works.extend([works_found, np.array(old_works, dtype=np.int64)])
+            pair_tags.extend([tags_found, np.array(old_tags, dtype=np.int64)])
+    pair_works = np.concatenate(pair_works) if pair_works else np.empty(0, dtype=np.int64)
+    pair_tags = np.concatenate(pair_tags) if pair_tags else np.empty(0, dtype=np.int64)
+    if compact:
+        # The compact work_tag_pairs table is keyed by (tag_id, work_id), so pairs are unique
+        keys = np.unique(pair_tags * (int(pair_works.max(initial=0)) + 1) + pair_works)
+        pair_tags, pair_works = np.divmod(keys, int(pair_works.max(initial=0)) + 1)
+    cur.executemany("INSERT INTO work_tag_pairs (work_id, tag_id) VALUES (?, ?)",
+                    zip(pair_works.tolist(), pair_tags.tolist()))
+    return pair_works, pair_tags
+
+def related_pair_changes(pair_works: np.ndarray, pair_tags: np.ndarray, removed: np.ndarray,
+                         first_work_id: int) -> tuple:
+    """
+    Get the work-tag pairs a dump added and removed, as columnar.update_related_table counts
+    them: the added works' pairs are added and the removed works' pairs removed, and the
+    unchanged works that gained tags (see insert_works) have their pairs from before the dump
+    removed and all their pairs added, so the gained tags are counted with the tags they had.
+    The works' pairs are read from the columnar store, which must already include the dump.
+
+    Parameters:
+        pair_works (np.ndarray): Work ID of each pair added by the dump.
+        pair_tags (np.ndarray): Tag ID of each pair added by the dump.
+        removed (np.ndarray): Work IDs of the works removed by the dump.
+        first_work_id (int): Work ID of the first added work.
+
+    Returns:
+        Tuple of arrays:
+            - added_works (np.ndarray): Work ID of each added pair.
+            - added_tags (np.ndarray): Tag ID of each added pair.
+            - removed_works (np.ndarray): Work ID of each removed pair.
+            - removed_tags (np.ndarray): Tag ID of each removed pair.
+    """
+    pair_works = np.asarray(pair_works, dtype=np.int64)
+    pair_tags = np.asarray(pair_tags, dtype=np.int64)
+    new = pair_works >= first_work_id
+    gained = np.unique(pair_works[~new])
+    work_ids, tag_ids = work_tag_ids(load_columnar_store(),
+                                     np.concatenate([np.asarray(removed, dtype=np.int64), gained]))
+    is_gained = np.isin(work_ids, gained)
+    # The gained works' pairs from before the dump are all but the ones it added
+    size = int(max(tag_ids.max(initial=0), pair_tags.max(initial=0))) + 1
+    before = is_gained & ~np.isin(work_ids * size + tag_ids, pair_works[~new] * size + pair_tags[~new])
+    return (np.concatenate([pair_works[new], work_ids[is_gained]]),
+            np.concatenate([pair_tags[new], tag_ids[is_gained]]),
+            np.concatenate([work_ids[~is_gained], work_ids[before]]),
+            np.concatenate([tag_ids[~is_gained], tag_ids[before]]))
+
+def update_tag_stats(conn: sqlite3.Connection, removed: np.ndarray, version: int) -> None:
+    """
+    Mark the removed works with the dump's version, and bring the tag_stats and tag_word_bins
+    tables up to date in place: the removed works' cells are subtracted (and their maximum 
+    word count found again if the maximum was removed), and the added pairs' cells 
+    (in the delta_pairs table) are added.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to fanfic.db, in the dump's transaction.
+        removed (np.ndarray): Work IDs of the works removed by the dump.
+        version (int): Version of the dump.
+
+    Returns:
+        None
+    """
+    from src.processing import word_bracket_sql, word_bin_sql, works_sql, filter_sql
+    cur = conn.cursor()
+    compact = is_compact(conn)
+    year, complete_works = works_sql(compact)
+    bracket = word_bracket_sql("works.word_count")
+    word_bin = word_bin_sql("works.word_count")
+    current, _ = filter_sql({}, compact, True)
+    # Statistics counted with other word brackets are rebuilt by data prep instead
+    stats = has_table(conn, 'tag_stats') and not tag_stats_stale()
+    bins = has_table(conn, 'tag_word_bins')
+    cur.execute("CREATE TEMP TABLE removed_works (work_id INTEGER PRIMARY KEY)")
+    cur.executemany("INSERT INTO removed_works VALUES (?)", ((int(work_id),) for work_id in removed))
+    # The removed works' cells, counted before they are marked as removed.
+    # Their pairs are found in one pass over work_tag_pairs, which is keyed by tag
+    removed_pairs = f"""
+    FROM work_tag_pairs
+    JOIN works ON works.work_id = work_tag_pairs.work_id
+    WHERE work_tag_pairs.work_id IN (SELECT work_id FROM removed_works) AND {complete_works}
+    """
+    if stats and len(removed):
+        cur.execute(f"""
+        CREATE TEMP TABLE removed_cells AS
+        SELECT work_tag_pairs.tag_id,
+               {year} AS creation_year,
+               {bracket} AS word_bracket,
+               works.complete,
+               COUNT(*) AS num_works,
+               SUM(works.word_count) AS total_words,
+               MAX(works.word_count) AS max_words
+        {removed_pairs}
+        GROUP BY work_tag_pairs.tag_id, creation_year, word_bracket, works.complete
+        """)
+    if bins and len(removed):
+        cur.execute(f"""
+        CREATE TEMP TABLE removed_bins AS
+        SELECT work_tag_pairs.tag_id, {word_bin} AS word_bin, COUNT(*) AS num_works
+        {removed_pairs}
+        GROUP BY work_tag_pairs.tag_id, word_bin
+        """)
+    cur.execute("""
+    UPDATE works SET removed_version = ? 
+    WHERE work_id IN (SELECT work_id FROM removed_works)
+    """, (version,))
+    if bins:
+        if len(removed):
+            cur.execute("""
+            UPDATE tag_word_bins
+            SET num_works = tag_word_bins.num_works - cells.num_works
+            FROM removed_bins AS cells
+            WHERE tag_word_bins.tag_id = cells.tag_id AND tag_word_bins.word_bin = cells.word_bin
+            """)
+            cur.execute("DELETE FROM tag_word_bins WHERE num_works <= 0")
+            cur.execute("DROP TABLE removed_bins")
+        cur.execute(f"""
+        INSERT INTO tag_word_bins
+        SELECT delta_pairs.tag_id, {word_bin} AS word_bin, COUNT(*)
+        FROM delta_pairs
+        JOIN works ON works.work_id = delta_pairs.work_id
+        WHERE {complete_works}{current}
+        GROUP BY delta_pairs.tag_id, word_bin
+        ON CONFLICT (tag_id, word_bin) DO UPDATE
+        SET num_works = num_works + excluded.num_works
+        """)
+    if not stats:
+        return None
+    cells = """
+    tag_stats.tag_id = cells.tag_id AND tag_stats.creation_year = cells.creation_year
+    AND tag_stats.word_bracket = cells.word_bracket AND tag_stats.complete = cells.complete
+    """
+    if len(removed):
+        cur.execute(f"""
+        UPDATE tag_stats
+        SET num_works = tag_stats.num_works - cells.num_works,
+            total_words = tag_stats.total_words - cells.total_words
+        FROM removed_cells AS cells
+        WHERE {cells}
+        """)
+        cur.execute("DELETE FROM tag_stats WHERE num_works <= 0")
+        # A cell's maximum is only found again if it may have been one of the removed works
+        cur.execute(f"""
+        UPDATE tag_stats
+        SET max_words = (
+            SELECT MAX(works.word_count)
+            FROM work_tag_pairs
+            JOIN works ON works.work_id = work_tag_pairs.work_id
+            WHERE work_tag_pairs.tag_id = tag_stats.tag_id 
+              AND {year} = tag_stats.creation_year
+              AND {bracket} = tag_stats.word_bracket
+              AND works.complete = tag_stats.complete
+              AND {complete_works}{current})
+        FROM removed_cells AS cells
+        WHERE {cells} AND cells.max_words >= tag_stats.max_words
+        """)
+        cur.execute("DROP TABLE removed_cells")
+    cur.execute(f"""
+    INSERT INTO tag_stats
+    SELECT
+        delta_pairs.tag_id,
+        {year} AS creation_year,
+        {bracket} AS word_bracket,
+        works.complete,
+        COUNT(*),
+        SUM(works.word_count),
+        MAX(works.word_count)
+    FROM delta_pairs
+    JOIN works ON works.work_id = delta_pairs.work_id
+    WHERE {complete_works}{current}
+    GROUP BY delta_pairs.tag_id, creation_year, word_bracket, works.complete
+    ON CONFLICT (tag_id, creation_year, word_bracket, complete) DO UPDATE
+    SET num_works = num_works + excluded.num_works,
+        total_words = total_words + excluded.total_words,
+        max_words = MAX(max_words, excluded.max_words)
+    """)
+    return None
+
+def add_dump(dump_date: str, partial: bool = False, workers: int = 1) -> None:
+    """
+    Add a newer data dump to fanfic.db in place, in one transaction, so the database keeps
+    every dump as a snapshot (see processing.list_snapshots) and the work of adding it
+    grows with the changes rather than with the archive:
+    - Tags are added or updated (see upsert_tags).
+    - The dump's works are matched with the current works by content hash. Works without
+      a match are added with new work IDs, along with their work-tag pairs, and current works
+      without a match are marked as removed by this dump. A partial export (only new works)
+      adds every work and removes none.
+    - tag_stats and tag_word_bins are updated for the added and removed works (see
+      update_tag_stats), and the tag search index for the changed tags.
+    - The columnar store is updated in place (see columnar.update_columnar_store), or rebuilt
+      once the added postings have grown too large to keep apart, and the added and removed
+      pairs are merged into related_tags (see columnar.update_related_table), or every tag
+      is counted again when that can't be done exactly.
+    Adding a dump that was added before does nothing.
+
+    Parameters:
+        dump_date (str): Date of the data dump, as YYYYMMDD (downloaded if not in the data folder).
+        partial (bool): True if the dump is an export of new works only.
+        workers (int): Number of worker processes splitting tags and counting related tags.
+
+    Returns:
+        None
+    """
+    start = time.perf_counter()
+    import_data(dump_url(dump_date), dump_date, extract=False)
+    with sqlite3.connect(DB_PATH) as conn:
+        enable_versions(conn)
+        cur = conn.cursor()
+        if cur.execute("SELECT 1 FROM dumps WHERE dump_date = ?", (dump_date,)).fetchone():
+            print(f"The {dump_date} dump has already been added")
+            return None
+        version, latest = cur.execute("SELECT MAX(version), MAX(dump_date) FROM dumps").fetchone()
+        if dump_date < latest:
+            raise ValueError(f"The {dump_date} dump is older than the {latest} dump in the database.")
+        version += 1
+        last_work_id = cur.execute("SELECT MAX(work_id) FROM works").fetchone()[0]
+        hashes = np.load(HASHES_PATH)
+        if len(hashes) != last_work_id + 1:
+            raise RuntimeError(f"{HASHES_PATH} doesn't match fanfic.db, rebuild the database.")
+        # Match the dump's works with the current works
+        print(f"Hashing the {dump_date} dump's works...")
+        dump = dump_hashes(dump_date)
+        current = np.ones(last_work_id + 1, dtype=bool)
+        current[0] = False
+        current[[row[0] for row in cur.execute(
+            "SELECT work_id FROM works WHERE removed_version IS NOT NULL")]] = False
+        current = np.flatnonzero(current)
+        if partial:
+            added = np.ones(len(dump), dtype=bool)
+            removed = np.empty(0, dtype=np.int64)
+            matched = np.zeros(len(dump), dtype=np.int64)
+        else:
+            added = surplus_rows(dump, hashes[current])
+            kept = surplus_rows(hashes[current], dump)
+            removed, current = current[kept], current[~kept]
+            # The unchanged rows and works have the same hashes, so sorting both by hash
+            # lines each row up with its work
+            rows = np.flatnonzero(~added)
+            matched = np.zeros(len(dump), dtype=np.int64)
+            matched[rows[np.argsort(dump[rows], kind='stable')]] = \
+                current[np.argsort(hashes[current], kind='stable')]
+        # Everything from here on is one transaction
+        cur.execute("BEGIN")
+        new_tags = {str(tag_id): tag_id for tag_id in upsert_tags(conn, dump_date)}
+        tag_ids = {str(tag_id): int(tag_id) for (tag_id,) in cur.execute("SELECT id FROM tags")}
+        pair_works, pair_tags = insert_works(conn, dump_date, added, matched, last_work_id + 1,
+                                             version, tag_ids, new_tags if not partial else {},
+                                             workers)
+        cur.execute("CREATE TEMP TABLE delta_pairs (tag_id INTEGER, work_id INTEGER)")
+        cur.executemany("INSERT INTO delta_pairs VALUES (?, ?)",
+                        zip(pair_tags.tolist(), pair_works.tolist()))
+        update_tag_stats(conn, removed, version)
+        num_works = len(current) + int(added.sum())
+        cur.execute("INSERT INTO dumps VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (version, dump_date, int(partial), num_works, int(added.sum()), len(removed),
+                     time.time()))
+        # The added works' hashes are saved next to the old ones, and swapped in once committed
+        np.save(HASHES_PATH + '.tmp.npy', np.concatenate([hashes, dump[added]]))
+        conn.commit()
+        os.replace(HASHES_PATH + '.tmp.npy', HASHES_PATH)
+    elapsed = time.perf_counter() - start
+    print(f"Added the {dump_date} dump as version {version}: {int(added.sum()):,} works added, "
+          f"{len(removed):,} removed, {len(pair_works):,} work-tag pairs added in {elapsed:.1f}s")
+    # Bring the columnar store up to date, if it was built
+    if stage_done('columns'):
+        update_stage('columns', status='running')
+        if not update_columnar_store(last_work_id + 1, pair_works, pair_tags, removed, version):
+            print("Merging the columnar store...")
+            build_columnar_store()
+        finish_stage('columns')
+        # Related tags are out of date until the dump's pairs are merged in, or every tag
+        # is counted again (an interrupted update is finished by the next data_prep_process)
+        if stage_done('related_tags'):
+            update_stage('related_tags', status='running')
+            print("Updating related tags...")
+            changes = related_pair_changes(pair_works, pair_tags, removed, last_work_id + 1)
+            if not update_related_table(*changes):
+                print("Finding related tags...")
+                build_related_tags(workers=workers)
+            finish_stage('related_tags')
+    return None
@@ -0,0 +1,260 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from src.cache import ResultCache
+from src.db import DB_PATH, read_connection
+from src.processing import (analyze_tag, time_series, word_distribution, estimate_works,
+                            result_key, normalize_filters, analysis_cache, cancel_checks)
+
+# Searches for tags with many works are computed in the background: each part of the results
+# (the analysis, the word count distribution, and the time series) is computed on a pool of
+# worker processes and cached in analysis_cache, while the callback that started it returns
+# right away, so slow searches don't hold up the server's threads serving fast ones.
+# Setting AO3_BACKGROUND_WORKERS to 0 computes every search in its callback instead
+BACKGROUND_WORKERS = int(os.environ.get('AO3_BACKGROUND_WORKERS', '2'))
+
+# Tags (or tag queries) estimated to have at least this many works are computed in the background
+BACKGROUND_MIN_WORKS = int(os.environ.get('AO3_BACKGROUND_MIN_WORKS', '100000'))
+
+# Seconds after which a queued or running part is presumed lost (e.g. its server was
+# restarted) and is submitted again
+BACKGROUND_TIMEOUT = 600
+
+# How often a running part checks whether it has been cancelled, in seconds
+CANCEL_CHECK_SECONDS = 0.25
+
+# How often a background worker checks that its server process is still running, in seconds
+SERVER_CHECK_SECONDS = 1
+
+# State of each submitted part (queued, running, failed, or cancelled), shared between the
+# server's processes through the disk file (next to the database), so any of them can cancel
+# or check on a part
+part_states = ResultCache(max_entries=1024, db_path=DB_PATH,
+                          disk_path=os.path.join(os.path.dirname(DB_PATH), 'jobs.db'))
+
+# This process's pool of background workers, started on first use
+pool = None
+pool_lock = threading.Lock()
+
+def background_pool() -> ProcessPoolExecutor:
+    """
+    Get this process's pool of background workers, starting it on first use.
+
+    Parameters:
+        None
+
+    Returns:
+        pool (ProcessPoolExecutor): Pool of BACKGROUND_WORKERS processes.
+    """
+    global pool
+    with pool_lock:
+        if pool is None:
+            # The server's threads are running, so workers are started fresh instead of forked
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            pool = ProcessPoolExecutor(BACKGROUND_WORKERS, mp_context=context,
+                                       initializer=watch_server, initargs=(os.getpid(),))
+        return pool
+
+def watch_server(server_pid: int) -> None:
+    """
+    Runs in each background worker as it starts: exits the worker once the server process
+    that started it is gone. A server killed without shutting down its pool (e.g. by SIGTERM
+    under `python app.py`) would otherwise leave its workers waiting for parts forever.
+
+    Parameters:
+        server_pid (int): Process ID of the server.
+
+    Returns:
+        None
+    """
+    def watch() -> None:
+        while True:
+            time.sleep(SERVER_CHECK_SECONDS)
+            try:
+                os.kill(server_pid, 0)
+            except ProcessLookupError:
+                os._exit(0)
+
+    threading.Thread(target=watch, daemon=True).start()
+    return None
+
+def part_state(tagname: str, filters: dict, part: str) -> dict:
+    """
+    Read the current state of a part, straight from the shared disk file
+    (the in-memory copy may be out of date if another process changed it).
+    A part is shared by every search of the same tag and filters, so it is keyed on its
+    analysis_cache key.
+
+    Parameters:
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+        filters (dict): Filters on the works, see processing.normalize_filters.
+        part (str): Part of the results (see processing.result_key).
+
+    Returns:
+        state (dict): Dictionary of status ("queued", "running", "failed", or "cancelled"),
+                      the time it was set, the error of a failed part, the ID of the run
+                      computing it, and the IDs of the jobs waiting for it,
+                      or None if the part was never submitted.
+    """
+    return part_states.disk_get(result_key(tagname, filters, part))
+
+def update_part_state(tagname: str, filters: dict, part: str, change) -> dict:
+    """
+    Change the state of a part (see part_state) in one step, so changes made by several
+    of the server's processes at once never overwrite each other.
+
+    Parameters:
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+        filters (dict): Filters on the works, see processing.normalize_filters.
+        part (str): Part of the results (see processing.result_key).
+        change (callable): Function given the current state (or None) and returning the new one.
+
+    Returns:
+        state (dict): The new state.
+    """
+    return part_states.update(result_key(tagname, filters, part), change)
+
+def needs_background(tagname: str, filters: dict, parts: list) -> bool:
+    """
+    Check whether the given parts of a search should be computed in the background:
+    background workers are enabled, a part isn't cached yet, and the tag (or query) has
+    at least BACKGROUND_MIN_WORKS works according to tags.cached_count.
+
+    Parameters:
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+        filters (dict): Filters on the works, see processing.normalize_filters.
+        parts (list): Parts of the results the caller needs (see processing.result_key).
+
+    Returns:
+        boolean: True if the parts should be submitted with submit_parts.
+    """
+    if BACKGROUND_WORKERS <= 0:
+        return False
+    if all(analysis_cache.peek(result_key(tagname, filters, part)) is not None for part in parts):
+        return False
+    # Raises TagNotFoundError if a tag is not found
+    return estimate_works(tagname) >= BACKGROUND_MIN_WORKS
+
+def compute_part(run: str, tagname: str, filters: dict, part: str) -> bool:
+    """
+    Compute one part of a search's results in a background worker, caching it in
+    analysis_cache. A cancelled part is skipped if it hasn't started. If it has, its SQL query
+    is interrupted, and its NumPy stages stop at the next check (see processing.check_cancelled).
+
+    Parameters:
+        run (str): ID of this run of the part, as set by submit_parts (a part cancelled and
+                   submitted again gets a new run, so the old one still stops).
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+        filters (dict): Filters on the works, see processing.normalize_filters.
+        part (str): Part of the results (see processing.result_key).
+
+    Returns:
+        boolean: True if the part was computed, False if it was cancelled or failed.
+    """
+    def stopped(state: dict) -> bool:
+        return state is None or state['run'] != run or state['status'] == 'cancelled'
+
+    state = update_part_state(tagname, filters, part, lambda state: state if stopped(state)
+                              else dict(state, status='running', time=time.time()))
+    if stopped(state):
+        return False
+    conn = read_connection()
+    cancelled = threading.Event()
+    finished = threading.Event()
+
+    def watch() -> None:
+        # Interrupting the connection stops its running query
+        while not finished.wait(CANCEL_CHECK_SECONDS):
+            if stopped(part_state(tagname, filters, part)):
+                cancelled.set()
+                conn.interrupt()
+                return
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    cancel_checks.cancelled = cancelled.is_set
+    try:
+        if part == 'analysis':
+            analyze_tag(tagname, filters)
+        elif part == 'words':
+            word_distribution(tagname, filters)
+        else:
+            time_series(tagname, part.split(':', 1)[1], filters)
+    except Exception as error:
+        update_part_state(tagname, filters, part, lambda state: state if stopped(state)
+                          else dict(state, status='failed', time=time.time(), error=str(error)))
+        return False
+    finally:
+        cancel_checks.cancelled = None
+        finished.set()
+        watcher.join()
+    return True
+
+def submit_parts(tagname: str, filters: dict, parts: list, job_id: str = None) -> str:
+    """
+    Compute the given parts of a search's results in the background for a job (one search
+    of one user), unless they are cached already. A part that is already queued or running
+    in any of the server's processes, e.g. for another user searching the same tag, isn't
+    submitted again: the job is added to the jobs waiting for it. A part that was cancelled,
+    failed, or is presumed lost is submitted again.
+
+    Parameters:
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+        filters (dict): Filters on the works, see processing.normalize_filters.
+        parts (list): Parts of the results (see processing.result_key).
+        job_id (str): ID of the job, or None to start a new job.
+
+    Returns:
+        job_id (str): ID of the job, to check on its parts and cancel them with.
+    """
+    filters = normalize_filters(filters)
+    job_id = job_id or uuid.uuid4().hex
+    for part in parts:
+        if analysis_cache.peek(result_key(tagname, filters, part)) is not None:
+            continue
+        run = uuid.uuid4().hex
+
+        def subscribe(state: dict) -> dict:
+            if (state is not None and state['status'] in ('queued', 'running')
+                    and time.time() - state['time'] < BACKGROUND_TIMEOUT):
+                return dict(state, jobs=sorted(set(state['jobs']) | {job_id}))
+            return {'status': 'queued', 'time': time.time(), 'error': None, 'run': run,
+                    'jobs': [job_id]}
+
+        if update_part_state(tagname, filters, part, subscribe)['run'] == run:
+            background_pool().submit(compute_part, run, tagname, filters, part)
+    return job_id
+
+def cancel_job(job_id: str, tagname: str, filters: dict, parts: list) -> None:
+    """
+    Stop waiting for the parts of a job, e.g. because the user started another search.
+    Parts no other job is waiting for are cancelled: queued parts are skipped, and running
+    ones stopped.
+
+    Parameters:
+        job_id (str): ID of the job, as returned by submit_parts.
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+        filters (dict): Filters on the works, see processing.normalize_filters.
+        parts (list): Parts of the results (see processing.result_key).
+
+    Returns:
+        None
+    """
+    def unsubscribe(state: dict) -> dict:
+        if state is None or job_id not in state['jobs']:
+            return state
+        jobs = [waiting for waiting in state['jobs'] if waiting != job_id]
+        if not jobs and state['status'] in ('queued', 'running'):
+            return dict(state, jobs=jobs, status='cancelled', time=time.time())
+        return dict(state, jobs=jobs)
+
+    for part in parts:
+        # Reading first skips the write lock for parts the job isn't waiting for
+        state = part_state(tagname, filters, part)
+        if state is not None and job_id in state['jobs']:
+            update_part_state(tagname, filters, part, unsubscribe)
+    return None
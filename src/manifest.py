@@ -0,0 +1,240 @@
+import os
+import json
+import time
+from src.db import DB_PATH, database_fingerprint
+
+# The build manifest only needs the standard library (and no database access), so a worker 
+# can check that the data is ready without importing the data preparation code
+
+# Data dump to use, configurable through an environment variable
+DUMP_DATE = os.environ.get('AO3_DUMP_DATE', '20210226')
+
+# Build manifest, recording which stages are done, their row counts, the source files,
+# and the last committed chunk of stages that are still running, kept next to the database
+MANIFEST_PATH = os.path.join(os.path.dirname(DB_PATH), 'manifest.json')
+
+# Stages built from the database, in order (rebuilt whenever the database is rebuilt)
+DERIVED_STAGES = ['compact', 'indexes', 'tag_search', 'tag_stats', 'columns', 'related_tags']
+
+# Newer data dumps to add to the database once it is built (see incremental.add_dump), 
+# as comma-separated dates, each followed by ":partial" if it only holds new works
+EXTRA_DUMPS = [(dump.strip().split(':')[0], dump.strip().endswith(':partial'))
+               for dump in os.environ.get('AO3_EXTRA_DUMPS', '').split(',') if dump.strip()]
+
+# Upper edges of the dashboard's word count brackets (the last bracket has no upper edge),
+# configurable as comma-separated word counts. tag_stats is counted by bracket, so the
+# edges it was built with are recorded in its stage and it is rebuilt when they change
+DEFAULT_WORD_BRACKETS = [1000, 2500, 5000, 10000, 25000, 50000, 75000, 100000, 150000, 200000]
+WORD_BRACKET_EDGES = sorted({int(edge) for edge in os.environ.get('AO3_WORD_BRACKETS', '').split(',') 
+                             if edge.strip()}) or DEFAULT_WORD_BRACKETS
+
+# Last answer of tag_stats_stale, and the size and modification time of the manifest it
+# was read from
+stale_check = {'version': None, 'stale': None}
+
+def dump_stage(dump_date: str) -> str:
+    """
+    Get the name of the stage adding the given newer data dump.
+    
+    Parameters:
+        dump_date (str): Date of the data dump, as YYYYMMDD.
+    
+    Returns:
+        stage (str): Name of the stage.
+    """
+    return f"dump_{dump_date}"
+
+def load_manifest() -> dict:
+    """
+    Read the build manifest, or start a new one if it doesn't exist or is for another dump.
+    
+    Parameters:
+        None
+    
+    Returns:
+        manifest (dict): Dictionary with the dump_date, the source files, and the stages.
+    """
+    try:
+        with open(MANIFEST_PATH) as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+    if manifest.get('dump_date') != DUMP_DATE:
+        manifest = {'dump_date': DUMP_DATE, 'sources': {}, 'stages': {}}
+    return manifest
+
+def save_manifest(manifest: dict) -> None:
+    """
+    Write the build manifest, replacing the old one in one step so it is never half-written.
+    
+    Parameters:
+        manifest (dict): Build manifest.
+    
+    Returns:
+        None
+    """
+    os.makedirs(os.path.dirname(MANIFEST_PATH) or '.', exist_ok=True)
+    with open(MANIFEST_PATH + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(MANIFEST_PATH + '.tmp', MANIFEST_PATH)
+    return None
+
+def stage_done(stage: str) -> bool:
+    """
+    Check if the build manifest records the given stage as done.
+    
+    Parameters:
+        stage (str): Name of the stage.
+    
+    Returns:
+        boolean: True if the stage is done.
+    """
+    return load_manifest()['stages'].get(stage, {}).get('status') == 'done'
+
+def update_stage(stage: str, **info) -> None:
+    """
+    Record information about a stage in the build manifest, such as its status, 
+    row counts, or checkpoint (the last committed chunk).
+    
+    Parameters:
+        stage (str): Name of the stage.
+        **info: Values to record for the stage.
+    
+    Returns:
+        None
+    """
+    manifest = load_manifest()
+    manifest['stages'].setdefault(stage, {}).update(info)
+    save_manifest(manifest)
+    return None
+
+def finish_stage(stage: str, **rows) -> None:
+    """
+    Record a stage as done in the build manifest, along with its row counts.
+    
+    Parameters:
+        stage (str): Name of the stage.
+        **rows: Row counts of the tables the stage created.
+    
+    Returns:
+        None
+    """
+    update_stage(stage, status='done', rows=rows, checkpoint=None, finished=time.time())
+    return None
+
+def reset_stages(stages: list) -> None:
+    """
+    Remove stages from the build manifest, so they run again from the start.
+    
+    Parameters:
+        stages (list): Names of the stages.
+    
+    Returns:
+        None
+    """
+    manifest = load_manifest()
+    for stage in stages:
+        manifest['stages'].pop(stage, None)
+    save_manifest(manifest)
+    return None
+
+def stage_checkpoint(stage: str) -> dict:
+    """
+    Get the checkpoint of a stage that was interrupted, to resume it from there.
+    
+    Parameters:
+        stage (str): Name of the stage.
+    
+    Returns:
+        checkpoint (dict): Last recorded checkpoint, or None if the stage hasn't started.
+    """
+    return load_manifest()['stages'].get(stage, {}).get('checkpoint')
+
+def mark_ready(filter_options: dict = None) -> None:
+    """
+    Record that data preparation has finished, along with the fingerprint of the finished
+    database, so later starts can check the data is ready from the manifest alone.
+    
+    Parameters:
+        filter_options (dict): Values the dashboard's filters can take in the finished database
+                               (see processing.filter_options), kept so starts don't count them.
+    
+    Returns:
+        None
+    """
+    manifest = load_manifest()
+    fingerprint = database_fingerprint(DB_PATH)
+    manifest['ready'] = {'fingerprint': list(fingerprint) if fingerprint else None,
+                         'stages': sorted(stage for stage, info in manifest['stages'].items()
+                                          if info.get('status') == 'done')}
+    if filter_options is not None:
+        manifest['ready']['filter_options'] = filter_options
+    save_manifest(manifest)
+    return None
+
+def dataset_ready(stages: list) -> bool:
+    """
+    Check, without opening the database or reading the CSV files, that the given stages
+    are done and the database is the one they produced: one read of the manifest
+    and one stat of the database file.
+    
+    Parameters:
+        stages (list): Names of the stages that must be done.
+    
+    Returns:
+        boolean: True if the data is ready to serve.
+    """
+    ready = load_manifest().get('ready')
+    if not ready or not set(stages) <= set(ready['stages']):
+        return False
+    fingerprint = database_fingerprint(DB_PATH)
+    return fingerprint is not None and list(fingerprint) == ready['fingerprint']
+
+def saved_filter_options() -> dict:
+    """
+    Get the filter options recorded by mark_ready, if the database is still the one 
+    they were counted in.
+    
+    Parameters:
+        None
+    
+    Returns:
+        options (dict): Dictionary with "languages" (list of (code, number of works)) and 
+                        "years" ((first, last)), or None if none are recorded for this database.
+    """
+    ready = load_manifest().get('ready')
+    if not ready or 'filter_options' not in ready:
+        return None
+    fingerprint = database_fingerprint(DB_PATH)
+    if fingerprint is None or list(fingerprint) != ready['fingerprint']:
+        return None
+    # JSON turned the tuples into lists
+    options = ready['filter_options']
+    return {'languages': [tuple(language) for language in options['languages']],
+            'years': tuple(options['years'])}
+
+def tag_stats_stale() -> bool:
+    """
+    Check if tag_stats was built with other word bracket edges than WORD_BRACKET_EDGES
+    (builds that didn't record their edges used the defaults).
+    The answer is kept until the manifest changes, so checking it on every search
+    costs one stat instead of reading the manifest.
+    
+    Parameters:
+        None
+    
+    Returns:
+        boolean: True if tag_stats has been built with other edges, False if it has been 
+                 built with the current ones or not built at all.
+    """
+    try:
+        stat = os.stat(MANIFEST_PATH)
+        version = (stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        version = None
+    if stale_check['version'] != version or stale_check['stale'] is None:
+        stage = load_manifest()['stages'].get('tag_stats')
+        stale = (stage is not None
+                 and stage.get('word_brackets', DEFAULT_WORD_BRACKETS) != WORD_BRACKET_EDGES)
+        stale_check.update(version=version, stale=stale)
+    return stale_check['stale']
@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from src.db import DB_PATH
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Requests taking at least this long are written to the slow query log as JSON lines
+# (configurable through environment variables, a negative threshold turns the log off)
+SLOW_QUERY_SECONDS = float(os.environ.get('AO3_SLOW_QUERY_MS', '1000')) / 1000
+# (the log is kept next to the database by default)
+SLOW_QUERY_LOG = os.environ.get('AO3_SLOW_QUERY_LOG',
+                                os.path.join(os.path.dirname(DB_PATH), 'slow_queries.log'))
+
+def escape_label(value: str) -> str:
+    """
+    Escape a label value for the Prometheus text format.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Histogram:
+    """
+    Thread-safe latency histogram with one label, rendered in the Prometheus text format.
+    Each label value keeps its own bucket counts, sum, and count.
+    """
+
+    def __init__(self, name: str, description: str, label: str,
+                 buckets: tuple = LATENCY_BUCKETS):
+        """
+        Parameters:
+            name (str): Metric name, e.g. "ao3_stage_seconds".
+            description (str): Help text of the metric.
+            label (str): Name of the label the observations are split by, e.g. "stage".
+            buckets (tuple): Bucket upper bounds in seconds, in increasing order.
+        """
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float) -> None:
+        """
+        Record one observation.
+
+        Parameters:
+            label_value (str): Value of the label, e.g. the stage name.
+            seconds (float): Observed duration.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            series = self.series.setdefault(label_value, {
+                'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            # Buckets are cumulative, so the observation counts in every bucket it fits
+            for index, upper in enumerate(self.buckets):
+                if seconds <= upper:
+                    series['buckets'][index] += 1
+            series['sum'] += seconds
+            series['count'] += 1
+        return None
+
+    def render(self) -> list:
+        """
+        Render the histogram in the Prometheus text exposition format.
+
+        Returns:
+            lines (list): Lines of the HELP, TYPE, bucket, sum, and count samples.
+        """
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {value: {**data, 'buckets': list(data['buckets'])}
+                      for value, data in self.series.items()}
+        for value, data in sorted(series.items()):
+            label = f'{self.label}="{escape_label(value)}"'
+            for upper, count in zip(self.buckets, data['buckets']):
+                lines.append(f'{self.name}_bucket{{{label},le="{upper}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {data["count"]}')
+            lines.append(f'{self.name}_sum{{{label}}} {data["sum"]:.6f}')
+            lines.append(f'{self.name}_count{{{label}}} {data["count"]}')
+        return lines
+
+# Time spent in each stage of a request (tag lookup, aggregation, figures, serialization, ...)
+stage_seconds = Histogram('ao3_stage_seconds', 'Time spent in each stage of a dashboard request.',
+                          'stage')
+# Time spent in each SQL query, by the function that runs it
+query_seconds = Histogram('ao3_query_seconds', 'Time spent in each SQL query.', 'query')
+# Total time of each request, from receiving it to the serialized response
+request_seconds = Histogram('ao3_request_seconds', 'Time spent serving each request.', 'path')
+
+# Values set once per process (e.g. how long it took to start), rendered as gauges
+gauges = {}
+
+def set_gauge(name: str, value: float, description: str) -> None:
+    """
+    Set a process-wide gauge, e.g. ao3_startup_seconds.
+
+    Parameters:
+        name (str): Metric name.
+        value (float): Current value.
+        description (str): Help text of the metric.
+
+    Returns:
+        None
+    """
+    gauges[name] = (value, description)
+    return None
+
+# Breakdown of the request being served by this thread, if it is traced
+current = threading.local()
+
+def start_trace(**info) -> None:
+    """
+    Start recording the stages and queries of the request served by this thread.
+
+    Parameters:
+        **info: Details of the request to keep with the trace, e.g. path.
+
+    Returns:
+        None
+    """
+    current.trace = {'start': time.perf_counter(), 'info': dict(info), 'stages': {}, 'queries': {}}
+    return None
+
+def annotate_trace(**info) -> None:
+    """
+    Add details to the current trace, e.g. the tag searched and its number of works.
+    Does nothing if the request isn't traced.
+    """
+    trace = getattr(current, 'trace', None)
+    if trace is not None:
+        trace['info'].update(info)
+    return None
+
+def record(histogram: Histogram, kind: str, name: str, seconds: float) -> None:
+    """
+    Record a duration in the histogram and add it to the current trace, if there is one.
+
+    Parameters:
+        histogram (Histogram): Histogram to record the duration in.
+        kind (str): "stages" or "queries", where the duration goes in the trace.
+        name (str): Name of the stage or query.
+        seconds (float): Duration.
+
+    Returns:
+        None
+    """
+    histogram.observe(name, seconds)
+    trace = getattr(current, 'trace', None)
+    if trace is not None:
+        # Stages and queries run several times per request (e.g. one tag lookup per tag) add up
+        trace[kind][name] = trace[kind].get(name, 0.0) + seconds
+    return None
+
+def record_stage(stage: str, seconds: float) -> None:
+    """
+    Record the duration of a stage measured by the caller.
+    """
+    record(stage_seconds, 'stages', stage, seconds)
+    return None
+
+@contextmanager
+def time_stage(stage: str):
+    """
+    Time the code inside the with block as the given stage.
+
+    Parameters:
+        stage (str): Name of the stage, e.g. "tag_lookup".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage_seconds, 'stages', stage, time.perf_counter() - start)
+
+@contextmanager
+def time_query(query: str):
+    """
+    Time the SQL query inside the with block.
+
+    Parameters:
+        query (str): Name of the query, usually the function running it.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(query_seconds, 'queries', query, time.perf_counter() - start)
+
+def timed_stage(stage: str):
+    """
+    Decorator timing every call of the decorated function as the given stage.
+
+    Parameters:
+        stage (str): Name of the stage, e.g. "callback".
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with time_stage(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_remainder(stage: str, measured: list) -> None:
+    """
+    Record the time of the current request so far that wasn't spent in the measured stages
+    as the given stage, e.g. the time Dash spends serializing a callback's output after
+    the callback returns. Does nothing if the request isn't traced.
+
+    Parameters:
+        stage (str): Name of the stage to record.
+        measured (list): Names of the stages already covering the rest of the request.
+
+    Returns:
+        None
+    """
+    trace = getattr(current, 'trace', None)
+    if trace is None:
+        return None
+    elapsed = time.perf_counter() - trace['start']
+    spent = sum(trace['stages'].get(name, 0.0) for name in measured)
+    if spent:
+        record_stage(stage, max(elapsed - spent, 0.0))
+    return None
+
+def finish_trace() -> dict:
+    """
+    Stop tracing the request served by this thread, record its total time,
+    and write it to the slow query log if it took at least SLOW_QUERY_SECONDS.
+
+    Returns:
+        trace (dict): Details of the request with its total time and per-stage and
+                      per-query breakdown in milliseconds, or None if it wasn't traced.
+    """
+    trace = getattr(current, 'trace', None)
+    if trace is None:
+        return None
+    current.trace = None
+    seconds = time.perf_counter() - trace['start']
+    request_seconds.observe(trace['info'].get('path', ''), seconds)
+    entry = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        **trace['info'],
+        'total_ms': round(seconds * 1000, 3),
+        'stages_ms': {name: round(value * 1000, 3) for name, value in trace['stages'].items()},
+        'queries_ms': {name: round(value * 1000, 3) for name, value in trace['queries'].items()}
+    }
+    if 0 <= SLOW_QUERY_SECONDS <= seconds:
+        log_slow_query(entry)
+    return entry
+
+# Serializes writes to the slow query log between threads
+log_lock = threading.Lock()
+
+def log_slow_query(entry: dict) -> None:
+    """
+    Append a slow request to the slow query log, as one JSON line.
+    The log is written while the response is handled, so failing to write it
+    (e.g. its folder is missing or read-only) never fails the request.
+
+    Parameters:
+        entry (dict): Trace of the request, as returned by finish_trace.
+
+    Returns:
+        None
+    """
+    with log_lock:
+        try:
+            with open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry, default=str) + '\n')
+        except OSError:
+            # The entry is lost, but the request's timings are still in /metrics
+            pass
+    return None
+
+def render_metrics(caches: dict = None) -> str:
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    Parameters:
+        caches (dict): Dictionary of cache name to ResultCache, whose counters are included.
+
+    Returns:
+        text (str): Metrics page.
+    """
+    lines = stage_seconds.render() + query_seconds.render() + request_seconds.render()
+    for name, (value, description) in sorted(gauges.items()):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {value:.6f}"]
+    if caches:
+        cache_stats = {name: cache.stats() for name, cache in caches.items()}
+        for stat, kind, description in [('hits', 'counter', 'Cache lookups that found a result.'),
+                                        ('misses', 'counter', 'Cache lookups that found nothing.'),
+                                        ('evictions', 'counter', 'Entries evicted from the cache.'),
+                                        ('entries', 'gauge', 'Entries held in memory.')]:
+            name = f"ao3_cache_{stat}_total" if kind == 'counter' else f"ao3_cache_{stat}"
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            lines += [f'{name}{{cache="{escape_label(cache)}"}} {stats[stat]}'
+                      for cache, stats in cache_stats.items()]
+    return '\n'.join(lines) + '\n'
@@ -1,6 +1,313 @@
+import os
+import re
+import json
 import sqlite3 
+import threading
+import numpy as np
 import pandas as pd
+from src.search import search_tags, find_folded_tag
+from src.cache import ResultCache
+from src.metrics import time_stage, time_query, timed_stage
+from src.db import DB_PATH, MissingTableError, query_frame, query_rows, is_compact, is_versioned
+from src.manifest import WORD_BRACKET_EDGES, tag_stats_stale, saved_filter_options
 
+def format_words(words: int) -> str:
+    """
+    Format a word count compactly for labels, e.g. 2500 as "2.5k" and 1200000 as "1.2M".
+    
+    Parameters:
+        words (int): Word count.
+    
+    Returns:
+        label (str): Formatted word count.
+    """
+    if words >= 1_000_000:
+        return f"{words / 1_000_000:.3g}M"
+    if words >= 1000:
+        return f"{words / 1000:.3g}k"
+    return str(int(words))
+
+# Word count brackets in increasing order, as (label, upper bound) pairs, from the
+# configurable edges (see manifest.WORD_BRACKET_EDGES). The last bracket has no upper bound.
+WORD_BRACKETS = ([(f"< {format_words(WORD_BRACKET_EDGES[0])}", WORD_BRACKET_EDGES[0])]
+                 + [(f"{format_words(lower)}-{format_words(upper)}", upper) 
+                    for lower, upper in zip(WORD_BRACKET_EDGES, WORD_BRACKET_EDGES[1:])]
+                 + [(f"{format_words(WORD_BRACKET_EDGES[-1])}+", None)])
+
+# Fine word count bins for the word count histogram and percentiles: twenty bins for every 
+# tenfold increase (each about 12% wider than the last), up to 100 million words.
+# Bin 0 holds works without words, and bin i the word counts from WORD_BIN_EDGES[i - 1]
+# up to (not including) WORD_BIN_EDGES[i]; the last bin has no upper bound.
+# The edges are fixed, so per-tag bin counts can be precomputed and added together
+WORD_BINS_PER_DECADE = 20
+WORD_BIN_EDGES = np.unique(np.ceil(np.round(
+    10 ** (np.arange(8 * WORD_BINS_PER_DECADE + 1) / WORD_BINS_PER_DECADE), 6))).astype(np.int64)
+NUM_WORD_BINS = len(WORD_BIN_EDGES) + 1
+
+# Word count percentiles shown on the dashboard
+WORD_PERCENTILES = {'median_words': 0.5, 'p90_words': 0.9, 'p99_words': 0.99}
+
+# Works with a missing value in any column are left out of every analysis
+# (very few rows have NaN word count, etc.)
+COMPLETE_WORKS = """
+    works.creation_date IS NOT NULL
+    AND works.language IS NOT NULL
+    AND works.restricted IS NOT NULL
+    AND works.complete IS NOT NULL
+    AND works.word_count IS NOT NULL
+    AND works.tags IS NOT NULL
+"""
+
+# The same condition for a compacted database (see data_prep.compact_database), where
+# the creation date is stored as integers and the tags text is gone (works without tags 
+# have no work-tag pairs, so they are never selected anyway)
+COMPACT_COMPLETE_WORKS = """
+    works.creation_day IS NOT NULL
+    AND works.language IS NOT NULL
+    AND works.restricted IS NOT NULL
+    AND works.complete IS NOT NULL
+    AND works.word_count IS NOT NULL
+"""
+
+# Granularities of the time series chart. Periods are numbered from 1970: years, months,
+# or weeks (starting on Monday) since then, so works are bucketed with integer arithmetic
+TIME_GRANULARITIES = ['year', 'month', 'week']
+
+# Works found by this thread's last create_master_table call, which the sort_* functions
+# sort when they aren't given works (as they sorted the last search before)
+master_tables = threading.local()
+
+# Cache of analyses by normalized query, shared between worker processes through the disk file
+# (kept next to the database, so a database set with AO3_DB_PATH gets its own cache).
+# Its results are DataFrames that callers may change, so each lookup gets its own copy
+analysis_cache = ResultCache(max_entries=512, db_path=DB_PATH, copies=True,
+                             disk_path=os.path.join(os.path.dirname(DB_PATH), 'analysis_cache.db'))
+
+# Function each thread's search calls between its stages to find out whether it has been
+# cancelled (set by jobs.compute_part for searches computed in the background)
+cancel_checks = threading.local()
+
+class SearchCancelledError(Exception):
+    """
+    Raised by check_cancelled when the current thread's search has been cancelled.
+    """
+
+def check_cancelled() -> None:
+    """
+    Stop the current thread's search if it has been cancelled (see jobs.compute_part).
+    Called between the NumPy stages of a search, which interrupting its SQL connection
+    can't stop.
+
+    Parameters:
+        None
+
+    Returns:
+        None
+    """
+    cancelled = getattr(cancel_checks, 'cancelled', None)
+    if cancelled is not None and cancelled():
+        raise SearchCancelledError("The search was cancelled.")
+    return None
+
+class TagNotFoundError(ValueError):
+    """
+    Raised when a tag name is not found in the tags table.
+    The missing name is kept in the tagname attribute, so similar tags can be suggested for it.
+    """
+    def __init__(self, tagname: str):
+        super().__init__(f"'{tagname}' tag not found.")
+        self.tagname = tagname
+
+def word_bracket_sql(column: str = "word_count") -> str:
+    """
+    Build the SQL CASE expression that sorts the given word count column into WORD_BRACKETS.
+    
+    Parameters:
+        column (str): Name of the word count column in the query.
+    
+    Returns:
+        case (str): SQL CASE expression evaluating to the word bracket label.
+    """
+    case = "CASE"
+    for label, upper in WORD_BRACKETS:
+        if upper is None:
+            case += f" ELSE '{label}'"
+        else:
+            case += f" WHEN {column} < {upper} THEN '{label}'"
+    return case + " END"
+
+def word_bin_sql(column: str = "word_count", first: int = 0, last: int = NUM_WORD_BINS - 1) -> str:
+    """
+    Build the SQL expression that finds the given word count column's bin (see WORD_BIN_EDGES),
+    as nested CASE expressions splitting the bins in half, so a bin is found in a handful
+    of comparisons instead of one per bin.
+    
+    Parameters:
+        column (str): Name of the word count column in the query.
+        first, last (int): Range of bins the word count is known to be in.
+    
+    Returns:
+        case (str): SQL expression evaluating to the bin number.
+    """
+    if first == last:
+        return str(first)
+    middle = (first + last) // 2
+    # Bins up to middle hold the word counts below the middle bin's upper edge
+    return (f"CASE WHEN {column} < {WORD_BIN_EDGES[middle]} "
+            f"THEN {word_bin_sql(column, first, middle)} "
+            f"ELSE {word_bin_sql(column, middle + 1, last)} END")
+
+def work_word_bins(word_counts: np.ndarray) -> np.ndarray:
+    """
+    Find the bins (see WORD_BIN_EDGES) of the given word counts, matching word_bin_sql.
+    
+    Parameters:
+        word_counts (np.ndarray): Word counts.
+    
+    Returns:
+        bins (np.ndarray): Bin number of each word count.
+    """
+    return np.searchsorted(WORD_BIN_EDGES, word_counts, side='right').astype(np.int16)
+
+def works_sql(compact: bool) -> tuple:
+    """
+    Get the SQL for the works table's creation year and complete-works condition, 
+    for the database's layout.
+    
+    Parameters:
+        compact (bool): True if the database uses the compact layout (see db.is_compact).
+    
+    Returns:
+        Tuple:
+            - year (str): SQL expression of the creation year, as text.
+            - complete (str): SQL condition leaving out works with missing values.
+    """
+    if compact:
+        return "CAST(works.creation_year AS TEXT)", COMPACT_COMPLETE_WORKS
+    return "substr(works.creation_date, 1, 4)", COMPLETE_WORKS
+
+def normalize_filters(filters: dict = None) -> dict:
+    """
+    Put filters in a fixed form, dropping the ones that aren't set, 
+    so the same filters always give the same cache key.
+    
+    Parameters:
+        filters (dict): Filters on the works, any of:
+            - "languages" (list): Language codes the works must be in.
+            - "restricted" (bool): Only restricted (True) or only public (False) works.
+            - "complete" (bool): Only complete (True) or only incomplete (False) works.
+            - "years" (list): First and last creation year, inclusive.
+            - "snapshot" (int): Version of the data dump to count the works of
+                                (see list_snapshots), instead of the latest one.
+    
+    Returns:
+        filters (dict): Filters that are set, or an empty dictionary.
+    """
+    normalized = {}
+    if not filters:
+        return normalized
+    if filters.get('languages'):
+        normalized['languages'] = sorted(set(filters['languages']))
+    for name in ['restricted', 'complete']:
+        if filters.get(name) is not None:
+            normalized[name] = bool(filters[name])
+    if filters.get('years'):
+        first, last = filters['years']
+        normalized['years'] = [int(first), int(last)]
+    if filters.get('snapshot') is not None:
+        normalized['snapshot'] = int(filters['snapshot'])
+    return normalized
+
+def filters_key(filters: dict = None) -> str:
+    """
+    Describe the filters as text for cache keys (empty if no filter is set).
+    
+    Parameters:
+        filters (dict): Filters, see normalize_filters.
+    
+    Returns:
+        key (str): JSON text of the normalized filters, or "".
+    """
+    filters = normalize_filters(filters)
+    return json.dumps(filters, sort_keys=True, separators=(',', ':')) if filters else ''
+
+def filter_sql(filters: dict, compact: bool, versioned: bool = False) -> tuple:
+    """
+    Build the SQL conditions applying the filters to the works table. In a database with
+    several data dumps, works are counted in the latest dump unless a snapshot is picked.
+    
+    Parameters:
+        filters (dict): Filters, as returned by normalize_filters.
+        compact (bool): True if the database uses the compact layout (see db.is_compact).
+        versioned (bool): True if the works have dump versions (see db.is_versioned).
+    
+    Returns:
+        Tuple:
+            - conditions (str): SQL conditions, each starting with AND ("" if no filter is set).
+            - params (tuple): Values of the conditions' placeholders.
+    """
+    conditions, params = [], []
+    if 'languages' in filters:
+        placeholders = ','.join('?' for _ in filters['languages'])
+        if compact:
+            conditions.append(f"works.language IN (SELECT id FROM languages WHERE code IN ({placeholders}))")
+        else:
+            conditions.append(f"works.language IN ({placeholders})")
+        params.extend(filters['languages'])
+    for column in ['restricted', 'complete']:
+        if column in filters:
+            conditions.append(f"works.{column} = ?")
+            params.append(int(filters[column]))
+    if 'years' in filters:
+        year = "works.creation_year" if compact else "CAST(substr(works.creation_date, 1, 4) AS INTEGER)"
+        conditions.append(f"{year} BETWEEN ? AND ?")
+        params.extend(filters['years'])
+    if versioned:
+        if 'snapshot' in filters:
+            # Works added by that dump or an earlier one, and not removed by then
+            conditions.append("works.first_version <= ? AND (works.removed_version IS NULL "
+                              "OR works.removed_version > ?)")
+            params.extend([filters['snapshot'], filters['snapshot']])
+        else:
+            conditions.append("works.removed_version IS NULL")
+    return ''.join(f" AND {condition}" for condition in conditions), tuple(params)
+
+def day_periods(days: np.ndarray, granularity: str) -> np.ndarray:
+    """
+    Bucket creation days into the periods of the time series chart.
+    
+    Parameters:
+        days (np.ndarray): Creation days, as days since 1970-01-01.
+        granularity (str): "year", "month", or "week" (see TIME_GRANULARITIES).
+    
+    Returns:
+        periods (np.ndarray): Period numbers, as years, months, or weeks since 1970.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    if granularity == 'week':
+        # 1970-01-01 was a Thursday, so the first week starting on Monday began 3 days earlier
+        return (days + 3) // 7
+    unit = 'Y' if granularity == 'year' else 'M'
+    return days.astype('datetime64[D]').astype(f'datetime64[{unit}]').astype(np.int64)
+
+def period_starts(periods: np.ndarray, granularity: str) -> np.ndarray:
+    """
+    Get the first day of each period, for the time series chart's axis.
+    
+    Parameters:
+        periods (np.ndarray): Period numbers, as returned by day_periods.
+        granularity (str): "year", "month", or "week".
+    
+    Returns:
+        starts (np.ndarray): First day of each period, as datetime64 values.
+    """
+    periods = np.asarray(periods, dtype=np.int64)
+    if granularity == 'week':
+        return (periods * 7 - 3).astype('datetime64[D]')
+    unit = 'Y' if granularity == 'year' else 'M'
+    return periods.astype(f'datetime64[{unit}]').astype('datetime64[D]')
+
+@timed_stage('tag_lookup')
 def find_tag(tagname: str) -> int:
     """
     Find the tag ID of the given tag name, or raise ValueError if tag not found.
@@ -9,21 +316,27 @@ def find_tag(tagname: str) -> int:
         tagname (str): Name of the tag, as found in the tags table.
     
     Returns:
-        tag["id"].values[0] (int): Tag ID associated with the given tag name.
+        tag[0][0] (int): Tag ID associated with the given tag name.
     """
-    # Create DataFrame of the given tag's data from tags table
-    with sqlite3.connect('data/fanfic.db') as conn:
-        tag = pd.read_sql_query(f"""
-        SELECT *
+    # Find the given tag in the tags table (ignoring the case of ASCII letters, like LIKE does)
+    with time_query('find_tag'):
+        tag = query_rows("""
+        SELECT id
         FROM tags
-        WHERE name LIKE '{tagname}';
-        """, conn)
-    # If the DataFrame is empty and there is no matching tag, 
-    # raise ValueError stating that tag could not be found
-    if tag.empty:
-        raise ValueError(f"'{tagname}' tag not found.")
+        WHERE name = ? COLLATE NOCASE
+        LIMIT 1
+        """, (tagname,))
+    # If there is no match, try again ignoring case and accents
+    if not tag:
+        with time_query('find_folded_tag'):
+            tag_id = find_folded_tag(tagname)
+        # If there is still no matching tag, 
+        # raise TagNotFoundError (a ValueError) stating that tag could not be found
+        if tag_id is None:
+            raise TagNotFoundError(tagname)
+        return tag_id
     # Return the tag ID
-    return tag["id"].values[0]
+    return tag[0][0]
 
 def find_works(tagname: str) -> pd.DataFrame:
     """
@@ -38,12 +351,12 @@ def find_works(tagname: str) -> pd.DataFrame:
     # Find the tag ID of the given tag
     tag_id = find_tag(tagname)
     # Select all work IDs paired with the tag ID
-    with sqlite3.connect('data/fanfic.db') as conn:
-        works = pd.read_sql_query(f"""
+    with time_query('find_works'):
+        works = query_frame("""
         SELECT work_id
         FROM work_tag_pairs
-        WHERE tag_id = '{tag_id}';
-        """, conn)
+        WHERE tag_id = ?
+        """, (int(tag_id),))
     return works
 
 def get_work_data(tagname: str) -> pd.DataFrame:
@@ -57,23 +370,23 @@ def get_work_data(tagname: str) -> pd.DataFrame:
         work_data (pd.DataFrame): DataFrame containing the data for all works 
                                   containing the given tag.
     """
-    # Get list of all work IDs paired with the tag ID
-    work_list = list(find_works(tagname)["work_id"])
-    # Convert work_list into comma-separated string
-    work_str = ','.join(str(work) for work in work_list)
-    # Select all data from works table for each work ID in work_str
-    with sqlite3.connect('data/fanfic.db') as conn:
-        work_data = pd.read_sql_query(f"""
+    # Find the tag ID of the given tag
+    tag_id = find_tag(tagname)
+    # Select all data from works table for each work paired with the tag ID
+    # (selected in SQL, instead of pasting every work ID into the query)
+    with time_query('get_work_data'):
+        work_data = query_frame("""
         SELECT *
         FROM works
-        WHERE work_id IN ({work_str});
-        """, conn)
+        WHERE work_id IN (SELECT work_id FROM work_tag_pairs WHERE tag_id = ?)
+        """, (int(tag_id),))
     return work_data
 
 def create_master_table(tagname: str) -> pd.DataFrame:
     """
-    Adds creation_year column from creation_date,
-    and converts DataFrame of works containing given tag into SQL table "selected_works".
+    Finds the works containing the given tag, leaving out works with missing values,
+    and adds creation_year column from creation_date.
+    Nothing is written to the database, so concurrent searches can't affect each other.
     
     Parameters:
         tagname (str): Name of the tag, as found in the tags table.
@@ -83,107 +396,112 @@ def create_master_table(tagname: str) -> pd.DataFrame:
                                     containing the given tag.
     """
     # Get table of works containing the given tag.
-    work_data = get_work_data(tagname)
+    with time_stage('work_fetch'):
+        work_data = get_work_data(tagname)
     # Clears out any rows with NaN values (very few rows have NaN word count, etc.)
     work_no_nan = work_data[~work_data.isna().any(axis=1)].copy()
-    # Create creation_year column from creation_date
-    work_no_nan['creation_year'] = work_no_nan['creation_date'].astype(str).str[:4]
-    # Create selected_works table in fanfic.db from work_no_nan 
-    # (replacing table for previous search, if necessary)
-    with sqlite3.connect('data/fanfic.db') as conn:
-        work_no_nan.to_sql("selected_works", conn, if_exists='replace', index=False)
+    # Create creation_year column from creation_date 
+    # (a compacted database stores it already, as an integer)
+    if 'creation_year' in work_no_nan:
+        work_no_nan['creation_year'] = work_no_nan['creation_year'].astype(str)
+    else:
+        work_no_nan['creation_year'] = work_no_nan['creation_date'].astype(str).str[:4]
+    master_tables.works = work_no_nan
     return work_no_nan
 
-def sort_years() -> pd.DataFrame:
+def master_table(works: pd.DataFrame = None) -> pd.DataFrame:
     """
-    Sort works in selected_works by year.
+    Get the works for the sort_* functions: the given works, or else the works found
+    by this thread's last create_master_table call.
     
     Parameters:
-        None
+        works (pd.DataFrame): Works, as returned by create_master_table, or None.
+    
+    Returns:
+        works (pd.DataFrame): Works to sort.
+    """
+    if works is None:
+        works = getattr(master_tables, 'works', None)
+        if works is None:
+            raise ValueError("No works to sort, call create_master_table first.")
+    return works
+
+@timed_stage('sort_years')
+def sort_years(works: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Sort the given works by year.
+    
+    Parameters:
+        works (pd.DataFrame): Works, as returned by create_master_table 
+                              (by default, the last ones it returned in this thread).
     
     Returns:
         years_data (pd.DataFrame): DataFrame containing years and number of works created 
                                    in that year.
     """
-    # Create years_data DataFrame, grouping selected_works by creation_year
-    with sqlite3.connect('data/fanfic.db') as conn:
-        years_data = pd.read_sql_query("""
-        SELECT creation_year, count(work_id) as num_works
-        FROM selected_works
-        GROUP BY creation_year
-        """, conn)
+    works = master_table(works)
+    # Create years_data DataFrame, grouping works by creation_year
+    years_data = (works.groupby('creation_year', as_index=False)['work_id'].count()
+                       .rename(columns={'work_id': 'num_works'}))
     return years_data
 
-def sort_word_counts() -> pd.DataFrame:
+@timed_stage('sort_word_counts')
+def sort_word_counts(works: pd.DataFrame = None) -> pd.DataFrame:
     """
-    Sort works in selected_works by word count ranges.
+    Sort the given works by word count ranges.
     
     Parameters:
-        None
+        works (pd.DataFrame): Works, as returned by create_master_table 
+                              (by default, the last ones it returned in this thread).
     
     Returns:
         word_count_data (pd.DataFrame): DataFrame containing ranges of word counts,
                                         and the number of works that fall within those ranges.
     """
-    # Create word_count_data with word_bracket (ranges of word counts) and num_works
-    with sqlite3.connect('data/fanfic.db') as conn:
-        word_count_data = pd.read_sql_query("""
-        SELECT 
-            CASE
-                WHEN word_count < 1000 THEN '< 1k'
-                WHEN word_count BETWEEN 1000 AND 2499 THEN '1k-2.5k'
-                WHEN word_count BETWEEN 2500 AND 4999 THEN '2.5k-5k'
-                WHEN word_count BETWEEN 5000 AND 9999 THEN '5k-10k'
-                WHEN word_count BETWEEN 10000 AND 24999 THEN '10k-25k'
-                WHEN word_count BETWEEN 25000 AND 49999 THEN '25k-50k'
-                WHEN word_count BETWEEN 50000 AND 74999 THEN '50k-75k'
-                WHEN word_count BETWEEN 75000 AND 99999 THEN '75k-100k'
-                WHEN word_count BETWEEN 100000 AND 149999 THEN '100k-150k'
-                WHEN word_count BETWEEN 150000 AND 199999 THEN '150k-200k'
-                WHEN word_count > 199999 THEN '200k+'
-            END AS word_bracket,
-            COUNT(*) AS num_works
-        FROM selected_works
-        GROUP BY word_bracket
-        """, conn)
+    works = master_table(works)
     # Word count brackets in increasing order
-    order = ['< 1k', '1k-2.5k', '2.5k-5k', '5k-10k', '10k-25k', '25k-50k', '50k-75k',
-         '75k-100k', '100k-150k', '150k-200k', '200k+']
-    # Use the order of word counts as listed above, instead of alphabetical order
-    word_count_data['word_bracket'] = pd.Categorical(word_count_data['word_bracket'], 
-                                                     categories=order, 
-                                                     ordered=True)
-    # Sort word_count_data by word_bracket order
-    word_count_data = word_count_data.sort_values('word_bracket')
+    order = [label for label, _ in WORD_BRACKETS]
+    # Bracket edges, so each bracket holds the word counts below its upper bound
+    edges = [float('-inf')] + [upper if upper is not None else float('inf')
+                               for _, upper in WORD_BRACKETS]
+    # Create word_count_data with word_bracket (ranges of word counts) and num_works,
+    # keeping the order of word counts as listed above, instead of alphabetical order
+    word_brackets = pd.cut(works['word_count'], bins=edges, labels=order, right=False)
+    word_count_data = (word_brackets.value_counts(sort=False)
+                                    .rename_axis('word_bracket')
+                                    .reset_index(name='num_works'))
+    # Only keep the brackets that contain works
+    word_count_data = word_count_data[word_count_data['num_works'] > 0].reset_index(drop=True)
     return word_count_data
 
-def sort_completion() -> pd.DataFrame:
+@timed_stage('sort_completion')
+def sort_completion(works: pd.DataFrame = None) -> pd.DataFrame:
     """
-    Sort works in selected_works by completion.
+    Sort the given works by completion.
     
     Parameters:
-        None
+        works (pd.DataFrame): Works, as returned by create_master_table 
+                              (by default, the last ones it returned in this thread).
     
     Returns:
         completion_data (pd.DataFrame): DataFrame containing number of 
                                         complete and incomplete works
     """
-    # Get table of number of complete and incomplete works from selected_works
-    with sqlite3.connect('data/fanfic.db') as conn:
-        completion_data = pd.read_sql_query("""
-        SELECT complete, count(work_id) as num_works
-        FROM selected_works
-        GROUP BY complete
-        """, conn)
+    works = master_table(works)
+    # Get table of number of complete and incomplete works
+    completion_data = (works.groupby('complete', as_index=False)['work_id'].count()
+                            .rename(columns={'work_id': 'num_works'}))
     # Turn complete/incomplete values into actual "Complete" and "Incomplete" in DataFrame
-    completion_data['complete'] = completion_data['complete'].map({1: 'Complete', 
-                                                                   0: 'Incomplete'})
+    completion_data['complete'] = completion_data['complete'].astype(int).map({1: 'Complete', 
+                                                                               0: 'Incomplete'})
     return completion_data
 
+@timed_stage('autocorrect')
 def autocorrect(tagname: str) -> list:
     """
     Find the ten most used tags that contain the given tag name somewhere within their name,
     intended to find tags similar to the one the user looked up.
+    Uses the tag search index (ignoring case and accents, and allowing for typos) if it exists.
     
     Parameters:
         tagname (str): Name of the tag that user looked up.
@@ -191,14 +509,885 @@ def autocorrect(tagname: str) -> list:
     Returns:
         close_tags['name'].tolist() (list): List of ten most used tags containing "tagname"
     """
+    try:
+        with time_query('search_tags'):
+            return [name for name, _ in search_tags(tagname)]
+    except MissingTableError:
+        # The search index has not been built, so scan the tags table instead
+        pass
     # Search tags table for 10 most commonly used tags with "tagname" within
-    with sqlite3.connect('data/fanfic.db') as conn:
-        close_tags = pd.read_sql_query(f"""
+    with time_query('autocorrect'):
+        close_tags = query_frame("""
             SELECT name, cached_count
             FROM tags
-            WHERE name LIKE '%{tagname}%'
+            WHERE name LIKE '%' || ? || '%'
             ORDER BY cached_count DESC
-            LIMIT 10;
-        """, conn)
+            LIMIT 10
+        """, (tagname,))
     # Return the matching tag names as a list
-    return close_tags['name'].tolist()
\ No newline at end of file
+    return close_tags['name'].tolist()
+
+
+def aggregate_selection(selection: str, params: tuple = (), filters: dict = None) -> pd.DataFrame:
+    """
+    Count the works selected by the given SQL query by creation year, word bracket, 
+    and completion, using a single join/aggregate pass over the selection and works.
+    Only the grouped counts are returned, so memory stays small no matter how many works 
+    are selected.
+    
+    Parameters:
+        selection (str): SQL query returning a work_id column.
+        params (tuple): Parameters for the selection query.
+        filters (dict): Filters on the works, as returned by normalize_filters.
+    
+    Returns:
+        cube (pd.DataFrame): DataFrame with one row per (creation_year, word_bracket, complete)
+                             combination, holding num_works, total_words and max_words.
+    """
+    compact = is_compact()
+    year, complete_works = works_sql(compact)
+    conditions, filter_params = filter_sql(normalize_filters(filters), compact, is_versioned())
+    with time_query('aggregate_selection'):
+        cube = query_frame(f"""
+        WITH selected AS ({selection})
+        SELECT
+            {year} AS creation_year,
+            {word_bracket_sql("works.word_count")} AS word_bracket,
+            works.complete AS complete,
+            COUNT(*) AS num_works,
+            SUM(works.word_count) AS total_words,
+            MAX(works.word_count) AS max_words
+        FROM selected
+        JOIN works ON works.work_id = selected.work_id
+        WHERE {complete_works}{conditions}
+        GROUP BY creation_year, word_bracket, complete
+        """, tuple(params) + filter_params)
+    return cube
+
+
+def aggregate_tag(tag_id: int, filters: dict = None) -> pd.DataFrame:
+    """
+    Count the works paired with the given tag ID by creation year, word bracket, and completion,
+    using a single join/aggregate pass over work_tag_pairs and works.
+    
+    Parameters:
+        tag_id (int): Tag ID, as found in the tags table.
+        filters (dict): Filters on the works, as returned by normalize_filters.
+    
+    Returns:
+        cube (pd.DataFrame): Grouped counts, as returned by aggregate_selection.
+    """
+    return aggregate_selection("SELECT work_id FROM work_tag_pairs WHERE tag_id = ?", 
+                               (int(tag_id),), filters)
+
+def aggregate_tags(tag_ids: list, filters: dict = None) -> pd.DataFrame:
+    """
+    Count the works of several tags at once, in a single join/aggregate pass over 
+    work_tag_pairs and works grouped by tag_id, instead of one query per tag.
+    
+    Parameters:
+        tag_ids (list): Tag IDs, as found in the tags table.
+        filters (dict): Filters on the works, as returned by normalize_filters.
+    
+    Returns:
+        cube (pd.DataFrame): Grouped counts like aggregate_selection returns, 
+                             with a tag_id column.
+    """
+    compact = is_compact()
+    year, complete_works = works_sql(compact)
+    conditions, filter_params = filter_sql(normalize_filters(filters), compact, is_versioned())
+    placeholders = ','.join('?' for _ in tag_ids)
+    with time_query('aggregate_tags'):
+        cube = query_frame(f"""
+        SELECT
+            work_tag_pairs.tag_id AS tag_id,
+            {year} AS creation_year,
+            {word_bracket_sql("works.word_count")} AS word_bracket,
+            works.complete AS complete,
+            COUNT(*) AS num_works,
+            SUM(works.word_count) AS total_words,
+            MAX(works.word_count) AS max_words
+        FROM work_tag_pairs
+        JOIN works ON works.work_id = work_tag_pairs.work_id
+        WHERE work_tag_pairs.tag_id IN ({placeholders})
+        AND {complete_works}{conditions}
+        GROUP BY work_tag_pairs.tag_id, creation_year, word_bracket, complete
+        """, tuple(int(tag_id) for tag_id in tag_ids) + filter_params)
+    return cube
+
+def parse_tag_query(query: str) -> tuple:
+    """
+    Split a tag query into the groups of tags to include and exclude.
+    Tags are combined with the uppercase keywords OR, AND, and NOT. 
+    OR binds tightest, so "A/B OR B/A AND Slow Burn NOT Character Death" means
+    works tagged (A/B or B/A) and Slow Burn, but not Character Death.
+    "AND NOT" is read as NOT. A tag in double quotes is read as it is, so tags containing
+    a keyword can be searched, e.g. "Romeo AND Juliet" OR Fluff. A query without keywords
+    is a single tag, and a query starting or ending with a keyword (or with two keywords 
+    in a row) can't be read.
+    
+    Parameters:
+        query (str): Tag query entered by the user.
+    
+    Returns:
+        Tuple:
+            - include (list): List of OR groups (lists of tag names) that works must match.
+            - exclude (list): List of OR groups (lists of tag names) that works must not match.
+    """
+    include, exclude = [], []
+    # Keywords followed by an odd number of quotes are inside quotes, so they aren't split on
+    # (quotes that don't pair up are just part of a tag name, e.g. 5'11")
+    outside_quotes = r'(?=(?:[^"]*"[^"]*")*[^"]*$)' if query.count('"') % 2 == 0 else ''
+    # Split into alternating tags and keywords, e.g. ['A', 'OR', 'B', 'AND', 'C'].
+    # Keywords stand alone between spaces (or at either end, leaving an empty tag there)
+    parts = re.split(r'\s*(?<!\S)(AND\s+NOT|AND|OR|NOT)(?!\S)\s*' + outside_quotes, query.strip())
+
+    def unquote(tagname: str) -> str:
+        # A tag written wholly in quotes is read without them
+        tagname = tagname.strip()
+        if len(tagname) >= 2 and tagname[0] == tagname[-1] == '"' and '"' not in tagname[1:-1]:
+            return tagname[1:-1].strip()
+        return tagname
+
+    groups = include
+    group = [unquote(parts[0])]
+    for keyword, tagname in zip(parts[1::2], parts[2::2]):
+        if keyword == 'OR':
+            group.append(unquote(tagname))
+            continue
+        # AND/NOT closes the current group and starts a new one
+        groups.append(group)
+        groups = include if keyword == 'AND' else exclude
+        group = [unquote(tagname)]
+    groups.append(group)
+    if any(not tagname for group in include + exclude for tagname in group):
+        raise ValueError(f"Could not read tag query '{query}'.")
+    return include, exclude
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a tag query so that queries for the same tags share a cache entry,
+    ignoring case, extra spaces, and the order of tags and groups.
+    
+    Parameters:
+        query (str): Tag query entered by the user.
+    
+    Returns:
+        normalized (str): Normalized query.
+    """
+    include, exclude = parse_tag_query(query)
+    def normalize_groups(groups: list) -> list:
+        return sorted(' OR '.join(sorted(' '.join(name.split()).casefold() for name in group))
+                      for group in groups)
+    normalized = ' AND '.join(normalize_groups(include))
+    for group in normalize_groups(exclude):
+        normalized += f' NOT {group}'
+    return normalized
+
+def result_key(tagname: str, filters: dict = None, part: str = "analysis") -> str:
+    """
+    Build the analysis_cache key of one part of a tag's (or tag query's) results, 
+    so it can be looked up without computing it (e.g. while it is computed in the background).
+    
+    Parameters:
+        tagname (str): Name of the tag, or a tag query.
+        filters (dict): Filters on the works, see normalize_filters.
+        part (str): "analysis" (analyze_tag), "words" (word_distribution), 
+                    or "time:" followed by the granularity (time_series).
+    
+    Returns:
+        key (str): Cache key.
+    """
+    key = normalize_query(tagname)
+    if part != "analysis":
+        key = f"{part}:{key}"
+    filters = normalize_filters(filters)
+    if filters:
+        key += ' | ' + filters_key(filters)
+    return key
+
+def estimate_works(tagname: str) -> int:
+    """
+    Estimate the number of works of a tag (or tag query) from tags.cached_count without
+    counting them: the tag's own count, or for a query, the smallest total of the
+    AND groups' tags (no more works can match).
+    
+    Parameters:
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+    
+    Returns:
+        works (int): Estimated number of works, before any filters.
+    """
+    include, _ = parse_tag_query(tagname)
+    # Find the tag ID of every tag (raises TagNotFoundError if one is not found)
+    include = [[find_tag(name) for name in group] for group in include]
+    sizes = tag_sizes([tag_id for group in include for tag_id in group])
+    return min(sum(sizes.get(tag_id) or 0 for tag_id in group) for group in include)
+
+def tag_sizes(tag_ids: list) -> dict:
+    """
+    Get the number of works using each of the given tags, from tags.cached_count.
+    
+    Parameters:
+        tag_ids (list): Tag IDs, as found in the tags table.
+    
+    Returns:
+        sizes (dict): Dictionary of tag ID to number of works.
+    """
+    placeholders = ','.join('?' for _ in tag_ids)
+    with time_query('tag_sizes'):
+        return dict(query_rows(f"SELECT id, cached_count FROM tags WHERE id IN ({placeholders})",
+                               tuple(int(tag_id) for tag_id in tag_ids)))
+
+def query_selection(include: list, exclude: list) -> tuple:
+    """
+    Build the SQL selecting the works matching a multi-tag query, given as groups of tag IDs.
+    The work sets are combined with INTERSECT and EXCEPT, starting from the smallest group 
+    so the intermediate results stay small.
+    
+    Parameters:
+        include (list): List of OR groups (lists of tag IDs) that works must match.
+        exclude (list): List of OR groups (lists of tag IDs) that works must not match.
+    
+    Returns:
+        Tuple:
+            - selection (str): SQL query returning a work_id column.
+            - params (tuple): Parameters for the selection query.
+    """
+    sizes = tag_sizes([tag_id for group in include + exclude for tag_id in group])
+    # Smallest group first
+    include = sorted(include, key=lambda group: sum(sizes.get(tag_id, 0) for tag_id in group))
+    selects, params = [], []
+    for group in include + exclude:
+        placeholders = ','.join('?' for _ in group)
+        selects.append(f"SELECT DISTINCT work_id FROM work_tag_pairs WHERE tag_id IN ({placeholders})")
+        params.extend(int(tag_id) for tag_id in group)
+    # Compound selects run left to right
+    selection = selects[0]
+    for index, select in enumerate(selects[1:], start=1):
+        operator = "INTERSECT" if index < len(include) else "EXCEPT"
+        selection += f" {operator} {select}"
+    return selection, tuple(params)
+
+def aggregate_query(include: list, exclude: list, filters: dict = None) -> pd.DataFrame:
+    """
+    Count the works matching a multi-tag query, given as groups of tag IDs,
+    combining the tags' works with query_selection.
+    
+    Parameters:
+        include (list): List of OR groups (lists of tag IDs) that works must match.
+        exclude (list): List of OR groups (lists of tag IDs) that works must not match.
+        filters (dict): Filters on the works, as returned by normalize_filters.
+    
+    Returns:
+        cube (pd.DataFrame): Grouped counts, as returned by aggregate_selection.
+    """
+    return aggregate_selection(*query_selection(include, exclude), filters)
+
+def count_days(selection: str, params: tuple = (), filters: dict = None) -> pd.DataFrame:
+    """
+    Count the works selected by the given SQL query per creation day, grouping on the
+    integer day column of a compacted database, for the time series chart.
+    
+    Parameters:
+        selection (str): SQL query returning a work_id column.
+        params (tuple): Parameters for the selection query.
+        filters (dict): Filters on the works, as returned by normalize_filters.
+    
+    Returns:
+        days (pd.DataFrame): DataFrame of creation_day (days since 1970-01-01) and num_works.
+    """
+    compact = is_compact()
+    _, complete_works = works_sql(compact)
+    conditions, filter_params = filter_sql(normalize_filters(filters), compact, is_versioned())
+    # julianday() of 1970-01-01 is 2440587.5. It is NULL for dates that can't be read, which
+    # are left out like a compacted database leaves them out (their creation_day is NULL)
+    day = "works.creation_day" if compact else "CAST(julianday(works.creation_date) - 2440587.5 AS INTEGER)"
+    readable = "" if compact else " AND julianday(works.creation_date) IS NOT NULL"
+    with time_query('count_days'):
+        days = query_frame(f"""
+        WITH selected AS ({selection})
+        SELECT {day} AS creation_day, COUNT(*) AS num_works
+        FROM selected
+        JOIN works ON works.work_id = selected.work_id
+        WHERE {complete_works}{readable}{conditions}
+        GROUP BY creation_day
+        """, tuple(params) + filter_params)
+    return days
+
+def count_word_bins(selection: str, params: tuple = (), filters: dict = None) -> np.ndarray:
+    """
+    Count the works selected by the given SQL query per word count bin (see WORD_BIN_EDGES),
+    for the word count histogram and percentiles.
+    
+    Parameters:
+        selection (str): SQL query returning a work_id column.
+        params (tuple): Parameters for the selection query.
+        filters (dict): Filters on the works, as returned by normalize_filters.
+    
+    Returns:
+        counts (np.ndarray): Number of works in each of the NUM_WORD_BINS bins.
+    """
+    compact = is_compact()
+    _, complete_works = works_sql(compact)
+    conditions, filter_params = filter_sql(normalize_filters(filters), compact, is_versioned())
+    with time_query('count_word_bins'):
+        bins = query_frame(f"""
+        WITH selected AS ({selection})
+        SELECT {word_bin_sql("works.word_count")} AS word_bin, COUNT(*) AS num_works
+        FROM selected
+        JOIN works ON works.work_id = selected.work_id
+        WHERE {complete_works}{conditions}
+        GROUP BY word_bin
+        """, tuple(params) + filter_params)
+    counts = np.zeros(NUM_WORD_BINS, dtype=np.int64)
+    counts[bins['word_bin'].to_numpy(dtype=np.int64)] = bins['num_works'].to_numpy()
+    return counts
+
+def lookup_word_bins(tag_id: int) -> np.ndarray:
+    """
+    Read the given tag's precomputed word count bin counts from the tag_word_bins table
+    built along with tag_stats during data prep.
+    
+    Parameters:
+        tag_id (int): Tag ID, as found in the tags table.
+    
+    Returns:
+        counts (np.ndarray): Number of works in each of the NUM_WORD_BINS bins,
+                             or None if the tag_word_bins table has not been built.
+    """
+    try:
+        with time_query('lookup_word_bins'):
+            bins = query_frame("""
+            SELECT word_bin, num_works
+            FROM tag_word_bins
+            WHERE tag_id = ?
+            """, (int(tag_id),))
+    except MissingTableError:
+        # tag_word_bins is optional, so fall back to counting from the works
+        return None
+    counts = np.zeros(NUM_WORD_BINS, dtype=np.int64)
+    counts[bins['word_bin'].to_numpy(dtype=np.int64)] = bins['num_works'].to_numpy()
+    return counts
+
+def lookup_tag_stats(tag_id: int) -> pd.DataFrame:
+    """
+    Read the given tag's precomputed counts from the tag_stats table built during data prep.
+    
+    Parameters:
+        tag_id (int): Tag ID, as found in the tags table.
+    
+    Returns:
+        cube (pd.DataFrame): Grouped counts in the same form as aggregate_tag returns,
+                             or None if the tag_stats table has not been built.
+    """
+    # Counts by other word brackets than the current ones can't be used
+    if tag_stats_stale():
+        return None
+    try:
+        with time_query('lookup_tag_stats'):
+            cube = query_frame("""
+            SELECT creation_year, word_bracket, complete, num_works, total_words, max_words
+            FROM tag_stats
+            WHERE tag_id = ?
+            """, (int(tag_id),))
+    except MissingTableError:
+        # tag_stats is optional, so fall back to aggregating from the works
+        return None
+    return cube
+
+def lookup_tags_stats(tag_ids: list) -> pd.DataFrame:
+    """
+    Read several tags' precomputed counts from the tag_stats table in one query.
+    
+    Parameters:
+        tag_ids (list): Tag IDs, as found in the tags table.
+    
+    Returns:
+        cube (pd.DataFrame): Grouped counts like aggregate_tags returns,
+                             or None if the tag_stats table has not been built.
+    """
+    if tag_stats_stale():
+        return None
+    placeholders = ','.join('?' for _ in tag_ids)
+    try:
+        with time_query('lookup_tags_stats'):
+            cube = query_frame(f"""
+            SELECT tag_id, creation_year, word_bracket, complete, num_works, total_words, max_words
+            FROM tag_stats
+            WHERE tag_id IN ({placeholders})
+            """, tuple(int(tag_id) for tag_id in tag_ids))
+    except MissingTableError:
+        return None
+    return cube
+
+def summarize_cube(cube: pd.DataFrame) -> dict:
+    """
+    Turn the grouped counts from aggregate_tag into the year, word count, and completion 
+    tables and summary statistics shown on the dashboard.
+    
+    Parameters:
+        cube (pd.DataFrame): Grouped counts, as returned by aggregate_tag.
+    
+    Returns:
+        analysis (dict): Dictionary containing:
+            - "years": DataFrame of creation_year and num_works.
+            - "word_counts": DataFrame of word_bracket and num_works, in bracket order.
+            - "completion": DataFrame of complete ("Complete"/"Incomplete") and num_works.
+            - "total_works", "total_words", "max_words", "complete_works", 
+              "incomplete_works" (int) and "average_words" (float).
+    """
+    # Works per year
+    years = (cube.groupby('creation_year', as_index=False)['num_works'].sum()
+                 .sort_values('creation_year', ignore_index=True))
+    # Works per word bracket, using the order of WORD_BRACKETS instead of alphabetical order
+    order = [label for label, _ in WORD_BRACKETS]
+    word_counts = cube.groupby('word_bracket', as_index=False)['num_works'].sum()
+    word_counts['word_bracket'] = pd.Categorical(word_counts['word_bracket'], 
+                                                 categories=order, 
+                                                 ordered=True)
+    word_counts = word_counts.sort_values('word_bracket', ignore_index=True)
+    # Works per completion status
+    completion = cube.groupby('complete', as_index=False)['num_works'].sum()
+    completion['complete'] = completion['complete'].astype(int).map({1: 'Complete', 
+                                                                     0: 'Incomplete'})
+    # Summary statistics
+    total_works = int(cube['num_works'].sum())
+    total_words = int(cube['total_words'].sum())
+    complete_works = int(cube.loc[cube['complete'].astype(int) == 1, 'num_works'].sum())
+    return {
+        "years": years,
+        "word_counts": word_counts,
+        "completion": completion,
+        "total_works": total_works,
+        "total_words": total_words,
+        "max_words": int(cube['max_words'].max()) if total_works else 0,
+        "average_words": total_words / total_works if total_works else 0.0,
+        "complete_works": complete_works,
+        "incomplete_works": total_works - complete_works
+    }
+
+def summarize_cubes(cube: pd.DataFrame, tag_ids: list) -> dict:
+    """
+    Summarize the grouped counts of several tags at once, giving the same analysis per tag
+    as summarize_cube: each table is grouped once for all the tags, then sliced per tag.
+
+    Parameters:
+        cube (pd.DataFrame): Grouped counts with a tag_id column, as returned by aggregate_tags.
+        tag_ids (list): Tag IDs to summarize (tags without works get empty tables).
+
+    Returns:
+        analyses (dict): Dictionary of tag ID to analysis, as returned by summarize_cube.
+    """
+    order = [label for label, _ in WORD_BRACKETS]
+    cube = cube.assign(tag_id=cube['tag_id'].astype(np.int64),
+                       complete=cube['complete'].astype(int),
+                       word_bracket=pd.Categorical(cube['word_bracket'], categories=order,
+                                                   ordered=True))
+    # One grouped table per dimension, sorted by tag and then by the dimension
+    years = cube.groupby(['tag_id', 'creation_year'], as_index=False)['num_works'].sum()
+    word_counts = cube.groupby(['tag_id', 'word_bracket'], as_index=False,
+                               observed=True)['num_works'].sum()
+    completion = cube.groupby(['tag_id', 'complete'], as_index=False)['num_works'].sum()
+    completion['complete'] = completion['complete'].map({1: 'Complete', 0: 'Incomplete'})
+    totals = cube.groupby('tag_id').agg(num_works=('num_works', 'sum'),
+                                        total_words=('total_words', 'sum'),
+                                        max_words=('max_words', 'max'))
+    complete_totals = cube[cube['complete'] == 1].groupby('tag_id')['num_works'].sum()
+
+    def rows(table: pd.DataFrame, tag_id: int) -> pd.DataFrame:
+        # Each table is sorted by tag, so a tag's rows are found by binary search
+        tag_column = table['tag_id'].to_numpy()
+        start, end = np.searchsorted(tag_column, [tag_id, tag_id + 1])
+        return table.iloc[start:end].drop(columns='tag_id').reset_index(drop=True)
+
+    analyses = {}
+    for tag_id in tag_ids:
+        tag_id = int(tag_id)
+        total_works = int(totals['num_works'].get(tag_id, 0))
+        total_words = int(totals['total_words'].get(tag_id, 0))
+        complete_works = int(complete_totals.get(tag_id, 0))
+        analyses[tag_id] = {
+            "years": rows(years, tag_id),
+            "word_counts": rows(word_counts, tag_id),
+            "completion": rows(completion, tag_id),
+            "total_works": total_works,
+            "total_words": total_words,
+            "max_words": int(totals['max_words'].get(tag_id, 0)) if total_works else 0,
+            "average_words": total_words / total_works if total_works else 0.0,
+            "complete_works": complete_works,
+            "incomplete_works": total_works - complete_works
+        }
+    return analyses
+
+def analyze_tag(tagname: str, filters: dict = None) -> dict:
+    """
+    Find the given tag (or tag query, see parse_tag_query) and compute everything 
+    the dashboard shows for it, without loading the works or writing the selected_works table.
+    Uses the precomputed tag_stats table or the columnar store when they exist,
+    and reuses cached analyses of the same query and filters.
+    
+    Parameters:
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+        filters (dict): Filters on the works (language, restricted, completion, creation years),
+                        see normalize_filters.
+    
+    Returns:
+        analysis (dict): Tables and summary statistics, as returned by summarize_cube.
+    """
+    from src.columnar import columnar_aggregate_tag, columnar_aggregate_query
+    filters = normalize_filters(filters)
+    key = result_key(tagname, filters)
+    with time_stage('cache_lookup'):
+        analysis = analysis_cache.get(key)
+    if analysis is not None:
+        return analysis
+    include, exclude = parse_tag_query(tagname)
+    # Find the tag ID of every tag (raises TagNotFoundError if one is not found)
+    include = [[find_tag(name) for name in group] for group in include]
+    exclude = [[find_tag(name) for name in group] for group in exclude]
+    with time_stage('aggregate'):
+        if len(include) == 1 and len(include[0]) == 1 and not exclude:
+            tag_id = include[0][0]
+            # Use the precomputed counts if available (they are unfiltered), 
+            # then the columnar store, otherwise aggregate from the works in fanfic.db
+            cube = None if filters else lookup_tag_stats(tag_id)
+            if cube is None:
+                cube = columnar_aggregate_tag(tag_id, filters)
+            if cube is None:
+                cube = aggregate_tag(tag_id, filters)
+        else:
+            # Combine the tags' postings in the columnar store if available, otherwise in SQL
+            cube = columnar_aggregate_query(include, exclude, filters)
+            if cube is None:
+                cube = aggregate_query(include, exclude, filters)
+    check_cancelled()
+    with time_stage('summarize'):
+        analysis = summarize_cube(cube)
+    analysis_cache.put(key, analysis)
+    return analysis
+
+def time_series(tagname: str, granularity: str = 'year', filters: dict = None) -> pd.DataFrame:
+    """
+    Count the works of the given tag (or tag query) per year, month, or week, for the 
+    time series chart. Works are bucketed from their integer creation day with bincount over 
+    the columnar store, or from a per-day SQL count when the store has not been built,
+    and results are cached like analyses.
+    
+    Parameters:
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+        granularity (str): "year", "month", or "week" (see TIME_GRANULARITIES).
+        filters (dict): Filters on the works, see normalize_filters.
+    
+    Returns:
+        series (pd.DataFrame): DataFrame of period (first day of the period) and num_works,
+                               for every period from the first work to the last, 
+                               including periods without works.
+    """
+    from src.columnar import columnar_count_periods
+    if granularity not in TIME_GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'.")
+    filters = normalize_filters(filters)
+    key = result_key(tagname, filters, f"time:{granularity}")
+    with time_stage('cache_lookup'):
+        series = analysis_cache.get(key)
+    if series is not None:
+        return series
+    include, exclude = parse_tag_query(tagname)
+    # Find the tag ID of every tag (raises TagNotFoundError if one is not found)
+    include = [[find_tag(name) for name in group] for group in include]
+    exclude = [[find_tag(name) for name in group] for group in exclude]
+    with time_stage('aggregate'):
+        periods = columnar_count_periods(include, exclude, granularity, filters)
+        if periods is None:
+            # Count per day in SQL, then add the days up into periods
+            if len(include) == 1 and len(include[0]) == 1 and not exclude:
+                selection, params = "SELECT work_id FROM work_tag_pairs WHERE tag_id = ?", (int(include[0][0]),)
+            else:
+                selection, params = query_selection(include, exclude)
+            days = count_days(selection, params, filters)
+            day_numbers = day_periods(days['creation_day'], granularity)
+            first = int(day_numbers.min()) if len(days) else 0
+            counts = np.bincount(day_numbers - first, weights=days['num_works'].to_numpy())
+            periods = first, counts.astype(np.int64)
+    check_cancelled()
+    first, counts = periods
+    series = pd.DataFrame({'period': period_starts(np.arange(first, first + len(counts)), granularity),
+                           'num_works': counts})
+    analysis_cache.put(key, series)
+    return series
+
+def word_percentile(counts: np.ndarray, fraction: float) -> float:
+    """
+    Estimate a word count percentile from the number of works per word count bin, without
+    sorting the works: the bin holding the percentile is found from the running total, 
+    and the word count within it by assuming the works are spread evenly on a log scale 
+    (like the bins), so the estimate is always within the bin (about 12% wide).
+    
+    Parameters:
+        counts (np.ndarray): Number of works in each word count bin (see WORD_BIN_EDGES).
+        fraction (float): Fraction of the works at or below the percentile, e.g. 0.5 for the median.
+    
+    Returns:
+        words (float): Estimated word count, or 0.0 if there are no works.
+    """
+    running = np.cumsum(counts)
+    total = running[-1]
+    if total == 0:
+        return 0.0
+    rank = fraction * total
+    word_bin = int(np.searchsorted(running, rank, side='left'))
+    # Works without words, or in the open-ended last bin
+    if word_bin == 0:
+        return 0.0
+    lower = WORD_BIN_EDGES[word_bin - 1]
+    if word_bin == len(WORD_BIN_EDGES):
+        return float(lower)
+    upper = WORD_BIN_EDGES[word_bin]
+    within = (rank - (running[word_bin] - counts[word_bin])) / counts[word_bin]
+    return float(lower * (upper / lower) ** within)
+
+def summarize_word_bins(counts: np.ndarray) -> dict:
+    """
+    Turn the number of works per word count bin into the word count histogram and 
+    percentiles shown on the dashboard.
+    
+    Parameters:
+        counts (np.ndarray): Number of works in each word count bin (see WORD_BIN_EDGES).
+    
+    Returns:
+        distribution (dict): Dictionary containing:
+            - "histogram": DataFrame of word_bin, lower and upper word counts (upper is None 
+              for the last bin), label, and num_works, for every bin from the first bin with 
+              works to the last, including empty bins in between.
+            - "median_words", "p90_words", "p99_words" (float): Estimated percentiles
+              (see WORD_PERCENTILES and word_percentile).
+    """
+    filled = np.flatnonzero(counts)
+    bins = np.arange(filled[0], filled[-1] + 1) if len(filled) else np.empty(0, dtype=np.int64)
+    lower = np.concatenate([[0], WORD_BIN_EDGES])[bins]
+    upper = [int(WORD_BIN_EDGES[b]) if b < len(WORD_BIN_EDGES) else None for b in bins]
+    histogram = pd.DataFrame({
+        'word_bin': bins,
+        'lower': lower,
+        'upper': upper,
+        'label': [format_words(words) for words in lower],
+        'num_works': counts[bins]
+    })
+    distribution = {"histogram": histogram}
+    for name, fraction in WORD_PERCENTILES.items():
+        distribution[name] = word_percentile(counts, fraction)
+    return distribution
+
+def word_distribution(tagname: str, filters: dict = None) -> dict:
+    """
+    Find the word count distribution of the given tag (or tag query): a fine log-scale
+    histogram and percentiles, from the number of works per word count bin.
+    The bins are read from the precomputed tag_word_bins table for a single tag without
+    filters, counted with bincount over the columnar store, or grouped in SQL when the store
+    has not been built, so no works are sorted and the time grows with the number of works
+    at most, and results are cached like analyses.
+    
+    Parameters:
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+        filters (dict): Filters on the works, see normalize_filters.
+    
+    Returns:
+        distribution (dict): Histogram and percentiles, as returned by summarize_word_bins.
+    """
+    from src.columnar import columnar_count_word_bins
+    filters = normalize_filters(filters)
+    key = result_key(tagname, filters, "words")
+    with time_stage('cache_lookup'):
+        distribution = analysis_cache.get(key)
+    if distribution is not None:
+        return distribution
+    include, exclude = parse_tag_query(tagname)
+    # Find the tag ID of every tag (raises TagNotFoundError if one is not found)
+    include = [[find_tag(name) for name in group] for group in include]
+    exclude = [[find_tag(name) for name in group] for group in exclude]
+    with time_stage('aggregate'):
+        single = len(include) == 1 and len(include[0]) == 1 and not exclude
+        counts = lookup_word_bins(include[0][0]) if single and not filters else None
+        if counts is None:
+            counts = columnar_count_word_bins(include, exclude, filters)
+        if counts is None:
+            if single:
+                selection, params = "SELECT work_id FROM work_tag_pairs WHERE tag_id = ?", (int(include[0][0]),)
+            else:
+                selection, params = query_selection(include, exclude)
+            counts = count_word_bins(selection, params, filters)
+    check_cancelled()
+    with time_stage('summarize'):
+        distribution = summarize_word_bins(counts)
+    analysis_cache.put(key, distribution)
+    return distribution
+
+def lookup_related_tags(tag_id: int) -> pd.DataFrame:
+    """
+    Read the given tag's related tags from the related_tags table built during data prep,
+    in a single keyed lookup.
+    
+    Parameters:
+        tag_id (int): Tag ID, as found in the tags table.
+    
+    Returns:
+        related (pd.DataFrame): DataFrame of related_type, name, num_works (works shared
+                                with the tag), and lift, most shared first within each type,
+                                or None if the related_tags table has not been built.
+    """
+    try:
+        with time_query('lookup_related_tags'):
+            return query_frame("""
+            SELECT related_tags.related_type, tags.name, related_tags.num_works, related_tags.lift
+            FROM related_tags
+            JOIN tags ON tags.id = related_tags.related_id
+            WHERE related_tags.tag_id = ?
+            ORDER BY related_tags.related_type, related_tags.rank
+            """, (int(tag_id),))
+    except MissingTableError:
+        # related_tags is optional, so there is just nothing to show
+        return None
+
+def find_related_tags(tagname: str) -> pd.DataFrame:
+    """
+    Find the tags that appear most often alongside the given tag.
+    Tag queries combining several tags have no precomputed related tags.
+    
+    Parameters:
+        tagname (str): Name of the tag as found in the tags table, or a tag query.
+    
+    Returns:
+        related (pd.DataFrame): Related tags, as returned by lookup_related_tags,
+                                or None if there are none to show.
+    """
+    include, exclude = parse_tag_query(tagname)
+    if len(include) != 1 or len(include[0]) != 1 or exclude:
+        return None
+    return lookup_related_tags(find_tag(include[0][0]))
+
+def filter_options() -> dict:
+    """
+    Get the values the dashboard's filters can take: every language with its number of works
+    (most used first), and the first and last creation years.
+    Data preparation records them in the manifest, so they are only counted when the 
+    database has changed since.
+    
+    Parameters:
+        None
+    
+    Returns:
+        options (dict): Dictionary with "languages" (list of (code, number of works)) and 
+                        "years" ((first, last)).
+    """
+    options = saved_filter_options()
+    if options is not None:
+        return options
+    return count_filter_options()
+
+def count_filter_options() -> dict:
+    """
+    Count the values the dashboard's filters can take (see filter_options), 
+    from the columnar store if it has been built, else in SQL.
+    
+    Parameters:
+        None
+    
+    Returns:
+        options (dict): Dictionary with "languages" (list of (code, number of works)) and 
+                        "years" ((first, last)).
+    """
+    from src.columnar import columnar_filter_options
+    options = columnar_filter_options()
+    if options is not None:
+        return options
+    # Without the columnar store, count in SQL
+    compact = is_compact()
+    year, complete_works = works_sql(compact)
+    # Works of the latest dump
+    current, _ = filter_sql({}, compact, is_versioned())
+    language = "(SELECT code FROM languages WHERE id = works.language)" if compact else "works.language"
+    with time_query('filter_options'):
+        languages = query_rows(f"""
+        SELECT {language}, COUNT(*)
+        FROM works
+        WHERE {complete_works}{current}
+        GROUP BY works.language
+        ORDER BY COUNT(*) DESC
+        """)
+        first, last = query_rows(f"""
+        SELECT MIN({year}), MAX({year}) FROM works WHERE {complete_works}{current}
+        """)[0]
+    return {'languages': languages, 'years': (int(first or 0), int(last or 0))}
+
+def list_snapshots() -> list:
+    """
+    List the data dumps loaded into the database, oldest first, for picking which one 
+    to count the works of (see incremental.add_dump).
+    
+    Parameters:
+        None
+    
+    Returns:
+        snapshots (list): List of (version, dump_date, number of works) tuples, 
+                          empty if only the original dump has been loaded.
+    """
+    try:
+        with time_query('list_snapshots'):
+            return query_rows("SELECT version, dump_date, works FROM dumps ORDER BY version")
+    except MissingTableError:
+        # The dumps table is created when the first newer dump is added
+        return []
+
+def compare_tags(tagnames: list, filters: dict = None) -> dict:
+    """
+    Analyze several tags side by side. Tags analyzed before (with the same filters) come
+    from analysis_cache, and all the others are counted together in one batched pass:
+    one tag_stats lookup, one pass over the columnar store, or one grouped SQL query.
+    
+    Parameters:
+        tagnames (list): Names of the tags, as found in the tags table 
+                         (tag queries are analyzed with analyze_tag).
+        filters (dict): Filters on the works, see normalize_filters.
+    
+    Returns:
+        analyses (dict): Dictionary of tag name to analysis (as returned by summarize_cube),
+                         in the order given, without repeated names. Raises TagNotFoundError
+                         if a tag is not found.
+    """
+    from src.columnar import columnar_aggregate_tags
+    filters = normalize_filters(filters)
+    suffix = ' | ' + filters_key(filters) if filters else ''
+    analyses, missing = {}, {}
+    for tagname in tagnames:
+        if tagname in analyses or tagname in missing:
+            continue
+        with time_stage('cache_lookup'):
+            analysis = analysis_cache.get(normalize_query(tagname) + suffix)
+        include, exclude = parse_tag_query(tagname)
+        if analysis is not None:
+            analyses[tagname] = analysis
+        elif len(include) != 1 or len(include[0]) != 1 or exclude:
+            # Tag queries combining several tags are analyzed on their own
+            analyses[tagname] = analyze_tag(tagname, filters)
+        else:
+            # Keep the tag's place in the order given
+            analyses[tagname] = None
+            missing[tagname] = find_tag(include[0][0])
+    if missing:
+        tag_ids = list(set(missing.values()))
+        with time_stage('aggregate'):
+            # Use the precomputed counts if available (they are unfiltered), 
+            # then the columnar store, otherwise aggregate from the works in fanfic.db
+            cube = None if filters else lookup_tags_stats(tag_ids)
+            if cube is None:
+                cube = columnar_aggregate_tags(tag_ids, filters)
+            if cube is None:
+                cube = aggregate_tags(tag_ids, filters)
+        with time_stage('summarize'):
+            summaries = summarize_cubes(cube, tag_ids)
+        for tagname, tag_id in missing.items():
+            analyses[tagname] = summaries[tag_id]
+        analysis_cache.put_many({normalize_query(tagname) + suffix: analyses[tagname]
+                                 for tagname in missing})
+    return analyses
@@ -0,0 +1,220 @@
+import sqlite3
+import unicodedata
+from src.db import DB_PATH, MissingTableError, query_rows
+
+# Most names fetched for each piece of the text in search_tags' typo fallback
+TYPO_CANDIDATES = 500
+
+# search_tags' typo fallback stops adding pieces once it has compared this many names
+TYPO_MAX_CANDIDATES = 2000
+
+# Names containing a piece of text are sorted by use when there are at most this many of them
+# (or twenty per tag asked for, if that is more); the names containing a more common piece
+# are gone through from the most used down instead
+SORT_MAX_MATCHES = 2000
+
+def fold_tag(name: str) -> str:
+    """
+    Fold a tag name for case and diacritic insensitive searching,
+    e.g. "Pokémon" and "POKEMON" both become "pokemon".
+
+    Parameters:
+        name (str): Tag name, or text entered by the user.
+
+    Returns:
+        folded (str): Lowercased name with accents removed.
+    """
+    if name is None:
+        return None
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+def build_tag_search() -> None:
+    """
+    Creates the tag search index: the tag_names table of folded tag names (indexed for prefix
+    searches), and the tag_search FTS5 trigram index over it for substring searches.
+
+    Parameters:
+        None
+
+    Returns:
+        None
+    """
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.create_function('fold_tag', 1, fold_tag, deterministic=True)
+        cur = conn.cursor()
+        # Replace any partially built index from an earlier run
+        cur.execute("DROP TABLE IF EXISTS tag_search")
+        cur.execute("DROP TABLE IF EXISTS tag_names")
+        cur.execute("""
+        CREATE TABLE tag_names (
+        id INTEGER PRIMARY KEY,
+        folded TEXT,
+        cached_count INTEGER
+        );
+        """)
+        cur.execute("""
+        INSERT INTO tag_names (id, folded, cached_count)
+        SELECT id, fold_tag(name), cached_count FROM tags WHERE name IS NOT NULL
+        """)
+        cur.execute("CREATE INDEX idx_tag_names_folded ON tag_names (folded)")
+        # Lets the names containing a common piece of text be found most used first
+        cur.execute("CREATE INDEX idx_tag_names_count ON tag_names (cached_count)")
+        # Trigram index over the folded names, reading its content from tag_names
+        cur.execute("""
+        CREATE VIRTUAL TABLE tag_search
+        USING fts5(folded, content='tag_names', content_rowid='id', tokenize='trigram')
+        """)
+        cur.execute("INSERT INTO tag_search (tag_search) VALUES ('rebuild')")
+        conn.commit()
+    return None
+
+def substring_distance(pattern: str, text: str, max_distance: int = None) -> int:
+    """
+    Find the smallest number of single-character edits needed to turn the pattern into
+    some part of the text, so a misspelled partial tag name still matches the full tag name.
+
+    Parameters:
+        pattern (str): Folded text entered by the user.
+        text (str): Folded tag name.
+        max_distance (int): Stop as soon as the distance is known to be larger than this.
+
+    Returns:
+        distance (int): Edit distance between the pattern and the closest part of the text,
+                        or some distance larger than max_distance.
+    """
+    # Matching may start anywhere in the text, so the first row is all zeros
+    previous = [0] * (len(text) + 1)
+    for i, pattern_char in enumerate(pattern, start=1):
+        current = [i] + [0] * len(text)
+        for j, text_char in enumerate(text, start=1):
+            current[j] = min(previous[j] + 1,
+                             current[j - 1] + 1,
+                             previous[j - 1] + (pattern_char != text_char))
+        previous = current
+        # Rows never get smaller, so the distance can only be larger than this row's best
+        if max_distance is not None and min(previous) > max_distance:
+            return min(previous)
+    # Matching may end anywhere in the text, so take the best of the last row
+    return min(previous)
+
+def most_used_containing(piece: str, limit: int) -> list:
+    """
+    Find the most used tags whose folded names contain the given piece of folded text.
+    Rare pieces are looked up in the trigram index and their names sorted by use. Sorting
+    every name containing a common piece would be slow, so those names are found by going
+    through the names from the most used down, stopping as soon as there are enough.
+
+    Parameters:
+        piece (str): Folded text, at least three characters long.
+        limit (int): Maximum number of tags to return.
+
+    Returns:
+        matches (list): List of (tag name, cached_count, folded name) tuples, most used first.
+    """
+    max_sorted = max(SORT_MAX_MATCHES, 20 * limit)
+    rows = query_rows("""
+    SELECT tags.name, tags.cached_count, hits.folded
+    FROM (SELECT rowid, folded FROM tag_search WHERE tag_search MATCH ? LIMIT ?) AS hits
+    JOIN tags ON tags.id = hits.rowid
+    """, ('"' + piece.replace('"', '""') + '"', max_sorted + 1))
+    if len(rows) <= max_sorted:
+        return sorted(rows, key=lambda row: -row[1])[:limit]
+    # Common pieces are found within the first few most used names
+    return query_rows("""
+    SELECT tags.name, tags.cached_count, tag_names.folded
+    FROM tag_names
+    JOIN tags ON tags.id = tag_names.id
+    WHERE instr(tag_names.folded, ?) > 0
+    ORDER BY tag_names.cached_count DESC
+    LIMIT ?
+    """, (piece, limit))
+
+def search_tags(text: str, limit: int = 10) -> list:
+    """
+    Find the most used tags whose names contain the given text, ignoring case and accents.
+    Texts of three or more characters use the trigram index, shorter texts match
+    the start of tag names. If nothing contains the text, tags within a few typos are returned.
+
+    Parameters:
+        text (str): Text entered by the user.
+        limit (int): Maximum number of tags to return.
+
+    Returns:
+        matches (list): List of (tag name, cached_count) tuples, most used first.
+    """
+    folded = fold_tag(text.strip())
+    if not folded:
+        return []
+    if len(folded) < 3:
+        # Too short for trigrams, so match the start of the name using the folded index
+        return query_rows("""
+        SELECT tags.name, tags.cached_count
+        FROM tag_names
+        JOIN tags ON tags.id = tag_names.id
+        WHERE tag_names.folded >= ? AND tag_names.folded < ?
+        ORDER BY tags.cached_count DESC
+        LIMIT ?
+        """, (folded, folded + '\U0010ffff', limit))
+    # Names containing the whole text
+    matches = most_used_containing(folded, limit)
+    if matches:
+        return [(name, count) for name, count, _ in matches]
+    # Typo fallback: cut the text into pieces and find names containing any piece whole.
+    # n edits leave at least one of n + 1 pieces untouched, so this finds names within
+    # n edits, starting with two (long, selective) pieces and adding pieces until a match is
+    # close enough. Texts too short for two pieces use their trigrams as the pieces.
+    # Only the TYPO_CANDIDATES most used names containing each piece are compared, so
+    # common pieces stay cheap: finding a less used name with a common piece is best effort
+    max_distance = 1 + len(folded) // 5
+    rounds = [[folded[round(i * len(folded) / pieces):round((i + 1) * len(folded) / pieces)]
+               for i in range(pieces)]
+              for pieces in range(2, min(max_distance + 1, len(folded) // 3) + 1)]
+    if not rounds:
+        rounds = [[folded[i:i + 3] for i in range(len(folded) - 2)]]
+    # Each edit changes at most three of the text's trigrams, so names sharing too few of them
+    # are skipped without computing their distance
+    trigrams = {folded[i:i + 3] for i in range(len(folded) - 2)}
+    min_shared = len(trigrams) - 3 * max_distance
+    # Distance of every candidate found so far, so each is only compared once
+    distances, searched, close = {}, set(), []
+    for pieces in rounds:
+        for piece in pieces:
+            if piece in searched:
+                continue
+            searched.add(piece)
+            for name, count, candidate in most_used_containing(piece, TYPO_CANDIDATES):
+                if (name, count) in distances:
+                    continue
+                shared = sum(candidate[i:i + 3] in trigrams for i in range(len(candidate) - 2))
+                distances[(name, count)] = (substring_distance(folded, candidate, max_distance)
+                                            if shared >= min_shared else max_distance + 1)
+        close = sorted((distance, -count, name) for (name, count), distance in distances.items()
+                       if distance <= max_distance)
+        # Anything closer would have left one of these pieces untouched, and been found
+        if close and close[0][0] <= len(pieces) - 1:
+            break
+        # Texts made of common pieces would otherwise compare thousands of names
+        if len(distances) >= TYPO_MAX_CANDIDATES:
+            break
+    return [(name, -count) for _, count, name in close[:limit]]
+
+def find_folded_tag(tagname: str) -> int:
+    """
+    Find the most used tag whose name equals the given name, ignoring case and accents.
+
+    Parameters:
+        tagname (str): Name of the tag that user looked up.
+
+    Returns:
+        tag_id (int): Tag ID of the matching tag, or None if there is no match
+                      (or the search index has not been built).
+    """
+    try:
+        rows = query_rows("""
+        SELECT id FROM tag_names WHERE folded = ? ORDER BY cached_count DESC LIMIT 1
+        """, (fold_tag(tagname.strip()),))
+    except MissingTableError:
+        # tag_names is optional
+        return None
+    return rows[0][0] if rows else None
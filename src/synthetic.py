@@ -0,0 +1,166 @@
+import os
+import csv
+import numpy as np
+from src.data_prep import dump_paths, DUMP_DATE
+
+# Tags every AO3 work has one or more of, with how likely a work is to use each
+# (these become the few huge tags at the top of the real dump)
+RATING_TAGS = [('Rating', 'General Audiences', 0.30), ('Rating', 'Teen And Up Audiences', 0.30),
+               ('Rating', 'Mature', 0.18), ('Rating', 'Explicit', 0.16),
+               ('Rating', 'Not Rated', 0.06)]
+WARNING_TAGS = [('ArchiveWarning', 'No Archive Warnings Apply', 0.55),
+                ('ArchiveWarning', 'Creator Chose Not To Use Archive Warnings', 0.30),
+                ('ArchiveWarning', 'Graphic Depictions Of Violence', 0.08),
+                ('ArchiveWarning', 'Major Character Death', 0.05),
+                ('ArchiveWarning', 'Rape/Non-Con', 0.01), ('ArchiveWarning', 'Underage', 0.01)]
+CATEGORY_TAGS = [('Category', 'M/M', 0.40), ('Category', 'Gen', 0.25), ('Category', 'F/M', 0.20),
+                 ('Category', 'F/F', 0.08), ('Category', 'Multi', 0.05), ('Category', 'Other', 0.02)]
+
+# Other tag types, with their share of the long tail of tags
+TAIL_TYPES = [('Freeform', 0.55), ('Character', 0.2), ('Relationship', 0.15),
+              ('Fandom', 0.05), ('UnsortedTag', 0.05)]
+
+# Words that tag names are made of (including accented ones, to exercise the tag search)
+TAG_WORDS = ['Angst', 'Fluff', 'Hurt', 'Comfort', 'Slow', 'Burn', 'Alternate', 'Universe',
+             'Coffee', 'Shop', 'Canon', 'Divergence', 'Harry', 'Potter', 'Draco', 'Malfoy',
+             'Star', 'Wars', 'Sherlock', 'Holmes', 'Pokémon', 'Café', 'Naruto', 'Avengers',
+             'Tony', 'Stark', 'Steve', 'Rogers', 'Found', 'Family', 'Enemies', 'Lovers',
+             'Friendship', 'Romance', 'Humor', 'Drama', 'Magic', 'Dragons', 'Time', 'Travel',
+             'Smut', 'Domestic', 'Sick', 'Fic', 'Modern', 'Setting', 'Ghosts', 'Zoë', 'Amélie']
+
+# Languages of works, with how likely a work is to be in each
+LANGUAGES = [('en', 0.89), ('zh', 0.03), ('ru', 0.02), ('es', 0.02), ('fr', 0.01),
+             ('de', 0.01), ('pt-BR', 0.01), ('it', 0.005), ('ja', 0.005)]
+
+# Range of creation dates, as days since 1970-01-01 (AO3's open beta to the dump date)
+FIRST_DAY = int(np.datetime64('2008-11-01').astype(int))
+LAST_DAY = int(np.datetime64('2021-02-26').astype(int))
+
+def tag_name(rng: np.random.Generator, tag_id: int) -> str:
+    """
+    Make up a name for a long-tail tag out of TAG_WORDS, ending with the tag ID so it is unique.
+
+    Parameters:
+        rng (np.random.Generator): Random number generator.
+        tag_id (int): ID of the tag.
+
+    Returns:
+        name (str): Tag name, e.g. "Coffee Shop Café 1234".
+    """
+    words = rng.choice(TAG_WORDS, size=rng.integers(1, 4))
+    return ' '.join(words) + f' {tag_id}'
+
+def pick_weighted(rng: np.random.Generator, options: list, size: int) -> np.ndarray:
+    """
+    Pick an index into the given (..., weight) options for each of size draws.
+
+    Parameters:
+        rng (np.random.Generator): Random number generator.
+        options (list): List of tuples whose last item is the option's weight.
+        size (int): Number of draws.
+
+    Returns:
+        picks (np.ndarray): Index of the option picked in each draw.
+    """
+    weights = np.array([option[-1] for option in options], dtype=float)
+    return rng.choice(len(options), size=size, p=weights / weights.sum())
+
+def generate_dump(num_works: int = 100000, num_tags: int = None, zipf_exponent: float = 0.9,
+                  tags_per_work: float = 6.0, seed: int = 0, dump_date: str = DUMP_DATE) -> dict:
+    """
+    Writes a synthetic data dump shaped like AO3's: works and tags CSV files with the same
+    columns as the real ones, in the data folder under the dump's file names.
+    Tag popularity follows a Zipf distribution, so a few tags are used by a large share of
+    the works and most tags by only a handful (and are dropped by preprocess).
+    Every work also gets a rating, warnings, and a category, like on AO3.
+    cached_count is each tag's actual number of works, so the tags' sizes match the works.
+    The same arguments always write the same files.
+
+    Parameters:
+        num_works (int): Number of works to write.
+        num_tags (int): Number of long-tail tags to write (default: twice the number of works,
+                        about the ratio in the real dump).
+        zipf_exponent (float): Exponent of the tags' Zipf distribution
+                               (higher means more works use the most popular tags).
+        tags_per_work (float): Average number of long-tail tags per work.
+        seed (int): Seed of the random number generator.
+        dump_date (str): Date of the data dump to name the files after, as YYYYMMDD.
+
+    Returns:
+        summary (dict): Number of works, tags, and work-tag pairs written.
+    """
+    rng = np.random.default_rng(seed)
+    if num_tags is None:
+        num_tags = 2 * num_works
+    paths = dump_paths(dump_date)
+    os.makedirs(os.path.dirname(paths['works']) or '.', exist_ok=True)
+    # The fixed tags come first, then the long tail
+    fixed_tags = RATING_TAGS + WARNING_TAGS + CATEGORY_TAGS
+    total_tags = len(fixed_tags) + num_tags
+    # Probability of the long-tail tag of each popularity rank, and the IDs in rank order
+    # (shuffled, so the most popular tags aren't simply the lowest IDs)
+    ranks = np.arange(1, num_tags + 1, dtype=float)
+    cumulative = np.cumsum(ranks ** -zipf_exponent)
+    cumulative /= cumulative[-1]
+    tail_ids = rng.permutation(num_tags) + len(fixed_tags) + 1
+    counts = np.zeros(total_tags + 1, dtype=np.int64)
+    num_pairs = 0
+    with open(paths['works'], 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        # The real header has a trailing comma, giving an empty seventh column
+        writer.writerow(['creation date', 'language', 'restricted', 'complete',
+                         'word_count', 'tags', ''])
+        for start in range(0, num_works, 100000):
+            size = min(100000, num_works - start)
+            # Works per day grow over the years, so later dates are more likely
+            days = FIRST_DAY + (rng.power(2.0, size) * (LAST_DAY - FIRST_DAY)).astype(np.int64)
+            dates = np.datetime_as_string(days.astype('datetime64[D]'))
+            languages = pick_weighted(rng, LANGUAGES, size)
+            restricted = rng.random(size) < 0.2
+            complete = rng.random(size) < 0.6
+            # Word counts are roughly log-normal (median near 3k words), a few are missing
+            word_counts = np.minimum(rng.lognormal(8.0, 1.3, size), 3e6).astype(np.int64) + 1
+            missing_words = rng.random(size) < 0.0005
+            # Long-tail tags of each work, drawn by popularity rank
+            tail_sizes = np.maximum(rng.poisson(tags_per_work, size), 1)
+            tail_draws = tail_ids[np.searchsorted(cumulative, rng.random(tail_sizes.sum()))]
+            ends = np.cumsum(tail_sizes)
+            ratings = pick_weighted(rng, RATING_TAGS, size)
+            warnings = pick_weighted(rng, WARNING_TAGS, size)
+            categories = pick_weighted(rng, CATEGORY_TAGS, size)
+            rows = []
+            for i in range(size):
+                tags = {1 + ratings[i],
+                        1 + len(RATING_TAGS) + warnings[i],
+                        1 + len(RATING_TAGS) + len(WARNING_TAGS) + categories[i]}
+                tags.update(tail_draws[ends[i] - tail_sizes[i]:ends[i]].tolist())
+                tags = sorted(tags)
+                counts[tags] += 1
+                num_pairs += len(tags)
+                rows.append((dates[i], LANGUAGES[languages[i]][0],
+                             'true' if restricted[i] else 'false',
+                             'true' if complete[i] else 'false',
+                             '' if missing_words[i] else word_counts[i],
+                             '+'.join(map(str, tags)), ''))
+            writer.writerows(rows)
+    tail_types = pick_weighted(rng, TAIL_TYPES, num_tags)
+    with open(paths['tags'], 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['id', 'type', 'name', 'canonical', 'cached_count', 'merger_id'])
+        for tag_id, (tag_type, name, _) in enumerate(fixed_tags, start=1):
+            writer.writerow([tag_id, tag_type, name, 'true', counts[tag_id], ''])
+        rows = []
+        for tag_id in range(len(fixed_tags) + 1, total_tags + 1):
+            tag_type = TAIL_TYPES[tail_types[tag_id - len(fixed_tags) - 1]][0]
+            if counts[tag_id] < 5 and rng.random() < 0.5:
+                # Like the real dump, many rarely used tags are not canonical and are redacted,
+                # and some of them are merged into another tag
+                merger = rng.integers(1, total_tags + 1) if rng.random() < 0.3 else ''
+                rows.append([tag_id, tag_type, 'Redacted', 'false', counts[tag_id], merger])
+            else:
+                rows.append([tag_id, tag_type, tag_name(rng, tag_id), 'true', counts[tag_id], ''])
+            if len(rows) >= 100000:
+                writer.writerows(rows)
+                rows = []
+        writer.writerows(rows)
+    return {'works': num_works, 'tags': total_tags, 'work_tag_pairs': num_pairs}
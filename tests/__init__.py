@@ -0,0 +1,51 @@
+import os
+import atexit
+import shutil
+import tempfile
+
+# Tests importing the app's modules in this process use a database in a temporary folder
+# (the modules read AO3_DB_PATH when they are imported, and keep their other files next to
+# the database), so they never read or write the real data folder
+TEST_DATA_DIR = tempfile.mkdtemp(prefix='ao3-tests-')
+os.environ['AO3_DB_PATH'] = os.path.join(TEST_DATA_DIR, 'fanfic.db')
+atexit.register(shutil.rmtree, TEST_DATA_DIR, True)
+
+def make_database(tags: list, works: list = ()) -> None:
+    """
+    Write a small database at the tests' AO3_DB_PATH (replacing the last one), in the layout
+    data prep builds before compacting, with its indexes and tag search index.
+
+    Parameters:
+        tags (list): List of (tag ID, name, cached_count) tuples.
+        works (list): List of (creation date, language, restricted, complete, word count,
+                      list of tag IDs) tuples, whose work IDs are their positions from 1.
+
+    Returns:
+        None
+    """
+    import sqlite3
+    from src.db import DB_PATH
+    from src.search import build_tag_search
+    from src.data_prep import create_indexes
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute("""
+        CREATE TABLE tags (id INTEGER, type TEXT, name TEXT, canonical INTEGER, 
+                           cached_count INTEGER, merger_id REAL)
+        """)
+        conn.execute("""
+        CREATE TABLE works (work_id INTEGER PRIMARY KEY AUTOINCREMENT, creation_date TEXT, 
+                            language TEXT, restricted BOOL, complete BOOL, word_count INT, tags TEXT)
+        """)
+        conn.execute("CREATE TABLE work_tag_pairs (work_id INTEGER, tag_id INTEGER)")
+        conn.executemany("INSERT INTO tags VALUES (?, 'Freeform', ?, 1, ?, NULL)", tags)
+        for work_id, (date, language, restricted, complete, words, tag_ids) in enumerate(works, 1):
+            conn.execute("INSERT INTO works VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (work_id, date, language, restricted, complete, words, 
+                          '+'.join(map(str, tag_ids))))
+            conn.executemany("INSERT INTO work_tag_pairs VALUES (?, ?)",
+                             [(work_id, tag_id) for tag_id in tag_ids])
+    create_indexes()
+    build_tag_search()
+    return None
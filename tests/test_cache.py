@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+import threading
+import multiprocessing
+import pandas as pd
+from src.cache import ResultCache
+
+def add_to_counter(disk_path: str, db_path: str, times: int) -> None:
+    """
+    Add one to the shared counter the given number of times, from another process.
+    """
+    cache = ResultCache(disk_path=disk_path, db_path=db_path)
+    for _ in range(times):
+        cache.update('counter', lambda count: (count or 0) + 1)
+    return None
+
+class ResultCacheTest(unittest.TestCase):
+    """
+    The results cache (cache.ResultCache) keeps the most recently used entries within its
+    limits, drops everything when the database changes, and shares entries through its disk file.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, 'fanfic.db')
+        self.disk_path = os.path.join(self.directory.name, 'cache.db')
+        with open(self.db_path, 'wb') as file:
+            file.write(b'first database')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResultCache(max_entries=2, db_path=self.db_path)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        # Reading a makes b the least recently used
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        # peek doesn't count as a use
+        cache.peek('a')
+        cache.get('c')
+        cache.put('d', 4)
+        self.assertIsNone(cache.peek('a'))
+        self.assertEqual(cache.stats()['evictions'], 2)
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_max_bytes(self):
+        cache = ResultCache(max_entries=100, max_bytes=3000, db_path=self.db_path)
+        for key in 'abcdef':
+            cache.put(key, key * 1000)
+        stats = cache.stats()
+        self.assertLessEqual(stats['bytes'], 3000)
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual((cache.get('e'), cache.get('f')), ('e' * 1000, 'f' * 1000))
+        # A result larger than the limit is still kept on its own
+        cache.put('big', 'x' * 10000)
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.get('big'), 'x' * 10000)
+
+    def test_database_change_clears_entries(self):
+        cache = ResultCache(disk_path=self.disk_path, db_path=self.db_path)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        with open(self.db_path, 'wb') as file:
+            file.write(b'a rebuilt database')
+        # Neither the in-memory nor the disk entry is used for the new database
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(ResultCache(disk_path=self.disk_path, db_path=self.db_path).get('a'))
+        cache.put('b', 2)
+        self.assertEqual(ResultCache(disk_path=self.disk_path, db_path=self.db_path).get('b'), 2)
+
+    def test_disk_entries_are_shared(self):
+        writer = ResultCache(max_entries=3, disk_path=self.disk_path, db_path=self.db_path)
+        reader = ResultCache(max_entries=3, disk_path=self.disk_path, db_path=self.db_path)
+        for key, value in [('a', 1), ('b', 2), ('c', 3)]:
+            writer.put(key, value)
+        self.assertEqual(reader.get('a'), 1)
+        # The read of a is saved with the next write, so b is evicted from the disk instead
+        reader.put('d', 4)
+        other = ResultCache(max_entries=3, disk_path=self.disk_path, db_path=self.db_path)
+        self.assertIsNone(other.get('b'))
+        self.assertEqual([other.get(key) for key in 'acd'], [1, 3, 4])
+
+    def test_update_is_atomic(self):
+        # Threads and processes adding to the same disk entry never lose an update
+        threads = [threading.Thread(target=add_to_counter, args=(self.disk_path, self.db_path, 25))
+                   for _ in range(4)]
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=add_to_counter, args=(self.disk_path, self.db_path, 25))
+                     for _ in range(2)]
+        for worker in threads + processes:
+            worker.start()
+        for worker in threads + processes:
+            worker.join()
+        self.assertTrue(all(process.exitcode == 0 for process in processes))
+        cache = ResultCache(disk_path=self.disk_path, db_path=self.db_path)
+        self.assertEqual(cache.get('counter'), 150)
+        # The new value is returned, and kept in memory too
+        self.assertEqual(cache.update('counter', lambda count: count + 1), 151)
+        self.assertEqual(cache.entries['counter'], 151)
+
+    def test_update_in_memory(self):
+        cache = ResultCache(db_path=self.db_path)
+        self.assertEqual(cache.update('a', lambda value: [value]), [None])
+        self.assertEqual(cache.update('a', lambda value: value + [1]), [None, 1])
+
+    def test_copies(self):
+        cache = ResultCache(disk_path=self.disk_path, db_path=self.db_path, copies=True)
+        frame = pd.DataFrame({'num_works': [1, 2]})
+        cache.put('a', {'table': frame})
+        # Changing the cached result, or a result looked up, leaves the cache as it was
+        frame['num_works'] = 0
+        for looked_up in [cache.get('a'), cache.peek('a')]:
+            table = looked_up['table']
+            table['num_works'] = 0
+        self.assertEqual(cache.get('a')['table']['num_works'].tolist(), [1, 2])
+        # So does changing a result read from the disk file
+        other = ResultCache(disk_path=self.disk_path, db_path=self.db_path, copies=True)
+        table = other.get('a')['table']
+        table['num_works'] = 0
+        self.assertEqual(other.get('a')['table']['num_works'].tolist(), [1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sqlite3
+import unittest
+from tests import make_database
+from src.db import DB_PATH
+from src.manifest import mark_ready, saved_filter_options, MANIFEST_PATH
+from src.processing import filter_options, count_filter_options
+
+class FilterOptionsTest(unittest.TestCase):
+    """
+    The filter options recorded by manifest.mark_ready are used while the database
+    is unchanged, and counted again once it changes.
+    """
+
+    def setUp(self):
+        make_database([(1, "Fluff", 3)],
+                      [("2012-05-01", 'en', 0, 1, 1000, [1]), ("2015-01-01", 'en', 0, 1, 500, [1]),
+                       ("2019-03-15", 'fr', 0, 1, 2000, [1])])
+
+    def tearDown(self):
+        if os.path.exists(MANIFEST_PATH):
+            os.remove(MANIFEST_PATH)
+
+    def test_counted(self):
+        options = count_filter_options()
+        self.assertEqual(options['languages'], [('en', 2), ('fr', 1)])
+        self.assertEqual(options['years'], (2012, 2019))
+        # Nothing recorded yet
+        self.assertIsNone(saved_filter_options())
+        self.assertEqual(filter_options(), options)
+
+    def test_saved(self):
+        recorded = {'languages': [('en', 7)], 'years': (2010, 2011)}
+        mark_ready(recorded)
+        self.assertEqual(saved_filter_options(), recorded)
+        # The recorded options are used instead of counting
+        self.assertEqual(filter_options(), recorded)
+        # Once the database changes, they are counted again
+        with sqlite3.connect(DB_PATH) as conn:
+            conn.execute("INSERT INTO works (creation_date, language, restricted, complete, "
+                         "word_count, tags) VALUES ('2020-01-01', 'de', 0, 1, 100, '1')")
+            # (a new table also grows the file, so the fingerprint changes even on coarse clocks)
+            conn.execute("CREATE TABLE padding (x)")
+        self.assertIsNone(saved_filter_options())
+        self.assertEqual(filter_options()['years'], (2012, 2020))
+
+if __name__ == '__main__':
+    unittest.main()
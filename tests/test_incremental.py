@@ -0,0 +1,157 @@
+import os
+import csv
+import sys
+import json
+import random
+import tempfile
+import unittest
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Builds the database in the working directory, then prints the results of the given tags
+# and query as JSON. Each build runs in its own process, as the modules keep their paths
+# and caches from import time
+BUILD_SCRIPT = """
+import sys, json
+import pandas as pd
+from src.data_prep import data_prep_process
+from src.processing import analyze_tag, word_distribution, time_series, find_related_tags
+
+def plain(value):
+    # DataFrames and NumPy values as JSON (and dates as text, see json.dumps below)
+    if isinstance(value, pd.DataFrame):
+        return plain(value.to_dict('list'))
+    if isinstance(value, dict):
+        return {str(key): plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [plain(item) for item in value]
+    return value.item() if hasattr(value, 'item') else value
+
+if __name__ == '__main__':
+    extra_dumps, names = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+    data_prep_process(build_stats=True, build_related=True, streaming=True, compact=True,
+                      extra_dumps=[tuple(dump) for dump in extra_dumps])
+    results = {}
+    for name in names:
+        related = find_related_tags(name)
+        results[name] = plain({
+            'analysis': analyze_tag(name),
+            'words': word_distribution(name),
+            'years': time_series(name, 'year'),
+            # Ties between related tags are ranked by tag ID, which differs between the builds
+            'related': None if related is None else
+                       related.groupby('related_type')['num_works'].apply(sorted).to_dict(),
+            'lifts': None if related is None else
+                     related.groupby('related_type')['lift'].apply(sorted).to_dict()
+        })
+    print(json.dumps(results, default=str))
+"""
+
+BASE_DATE = '20210226'
+NEWER_DATE = '20210601'
+
+def read_dump(directory: str, dump_date: str) -> tuple:
+    """
+    Read a dump's works and tags CSV files, as lists of rows.
+    """
+    dump = []
+    for kind in ['works', 'tags']:
+        path = os.path.join(directory, 'data', f'{kind}-{dump_date}.csv')
+        with open(path, newline='', encoding='utf-8') as file:
+            dump.append(list(csv.reader(file)))
+    return tuple(dump)
+
+def write_dump(directory: str, dump_date: str, works: list, tags: list) -> None:
+    """
+    Write a dump's works and tags CSV files.
+    """
+    os.makedirs(os.path.join(directory, 'data'), exist_ok=True)
+    for kind, rows in [('works', works), ('tags', tags)]:
+        path = os.path.join(directory, 'data', f'{kind}-{dump_date}.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows(rows)
+    return None
+
+def newer_dump(works: list, tags: list, seed: int = 0) -> tuple:
+    """
+    Make a newer dump from a dump's rows: some works are removed, some changed,
+    and new works are added, and the tags' counts are counted again.
+    """
+    rng = random.Random(seed)
+    header, rows = works[0], works[1:]
+    newer = []
+    for row in rows:
+        if rng.random() < 0.05:
+            continue
+        row = list(row)
+        if rng.random() < 0.01:
+            # A changed work counts as removed and added again
+            row[4] = str(int(row[4] or 0) + 100)
+        newer.append(row)
+    for _ in range(len(rows) // 10):
+        row = list(rng.choice(rows))
+        row[0] = f"2021-0{rng.randint(3, 5)}-{rng.randint(10, 28)}"
+        row[4] = str(rng.randint(100, 200000))
+        newer.append(row)
+    rng.shuffle(newer)
+    counts = {}
+    for row in newer:
+        for tag_id in row[5].split('+'):
+            counts[tag_id] = counts.get(tag_id, 0) + 1
+    newer_tags = [tags[0]] + [row[:4] + [str(counts.get(row[0], 0))] + row[5:] for row in tags[1:]]
+    return [header] + newer, newer_tags
+
+def script_env() -> dict:
+    """
+    Environment of the scripts run in a directory: the app's modules are importable, and
+    the database is the default one in the directory's data folder (not the tests' database).
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop('AO3_DB_PATH', None)
+    return env
+
+def build(directory: str, extra_dumps: list, names: list) -> dict:
+    """
+    Build the database in a directory (see BUILD_SCRIPT) and return the tags' results.
+    """
+    output = subprocess.run([sys.executable, '-c', BUILD_SCRIPT, json.dumps(extra_dumps),
+                             json.dumps(names)], cwd=directory, env=script_env(), check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+class AddDumpTest(unittest.TestCase):
+    """
+    Adding a newer dump in place (incremental.add_dump) gives the same results for the
+    latest dump as building the database from that dump alone.
+    """
+
+    def test_in_place_matches_fresh_build(self):
+        with tempfile.TemporaryDirectory() as incremental, tempfile.TemporaryDirectory() as fresh:
+            subprocess.run([sys.executable, '-c',
+                            "from src.synthetic import generate_dump; generate_dump(3000, seed=1)"],
+                           cwd=incremental, env=script_env(), check=True,
+                           capture_output=True)
+            works, tags = read_dump(incremental, BASE_DATE)
+            works, tags = newer_dump(works, tags)
+            write_dump(incremental, NEWER_DATE, works, tags)
+            # The fresh build reads the newer dump as its first one
+            write_dump(fresh, BASE_DATE, works, tags)
+            # The most used tags, a query combining two of them, and a rarely used tag
+            names = [row[2] for row in sorted(tags[1:], key=lambda row: -int(row[4]))
+                     if row[3] == 'true'][:8]
+            names += [f"{names[0]} AND NOT {names[1]}",
+                      min((row for row in tags[1:] if row[3] == 'true' and int(row[4]) >= 5),
+                          key=lambda row: int(row[4]))[2]]
+            in_place = build(incremental, [[NEWER_DATE, False]], names)
+            rebuilt = build(fresh, [], names)
+            for name in names:
+                # The lifts are rounded separately by each build
+                lifts, rebuilt_lifts = in_place[name].pop('lifts'), rebuilt[name].pop('lifts')
+                self.assertEqual(in_place[name], rebuilt[name], name)
+                for related_type, values in (lifts or {}).items():
+                    np.testing.assert_allclose(values, rebuilt_lifts[related_type], atol=0.0011)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+from tests import make_database
+from src import search
+from src.search import fold_tag, search_tags, substring_distance
+
+# Less used tags come first, so the least used names have the lowest row IDs
+TAGS = ([(i, f"Angst Fluffy Fic {i}", 1) for i in range(1, 101)]
+        + [(101, "Pokémon Go", 500), (102, "POKEMON Sun", 40), (103, "Harry Potter", 9000),
+           (104, "Harry Potter/Draco Malfoy", 3000), (105, "Angst Fluff", 800),
+           (106, "Zoë Hart", 12), (107, "Café AU", 70)])
+
+class FoldTagTest(unittest.TestCase):
+    """
+    Tag names are folded (search.fold_tag) ignoring case and accents.
+    """
+
+    def test_fold(self):
+        self.assertEqual(fold_tag("Pokémon"), "pokemon")
+        self.assertEqual(fold_tag("POKEMON"), "pokemon")
+        self.assertEqual(fold_tag("Zoë CAFÉ"), "zoe cafe")
+        # Case folding, not just lowercasing
+        self.assertEqual(fold_tag("Straße"), "strasse")
+        self.assertIsNone(fold_tag(None))
+
+    def test_substring_distance(self):
+        self.assertEqual(substring_distance("potter", "harry potter/draco"), 0)
+        self.assertEqual(substring_distance("pottr", "harry potter"), 1)
+        # Past max_distance, some larger distance is returned early
+        self.assertGreater(substring_distance("zzzzzz", "harry potter", 1), 1)
+
+class SearchTagsTest(unittest.TestCase):
+    """
+    The tag search (search.search_tags) finds the most used tags containing the text,
+    ignoring case and accents, and falls back to names within a few typos.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        make_database(TAGS)
+
+    def test_case_and_accents(self):
+        expected = [("Pokémon Go", 500), ("POKEMON Sun", 40)]
+        for text in ["pokemon", "POKÉMON", "Pokémon", "  okem "]:
+            with self.subTest(text=text):
+                self.assertEqual(search_tags(text), expected)
+        self.assertEqual(search_tags("cafe"), [("Café AU", 70)])
+        self.assertEqual(search_tags("ZOE"), [("Zoë Hart", 12)])
+
+    def test_short_text_matches_name_start(self):
+        self.assertEqual(search_tags("ha"), [("Harry Potter", 9000), 
+                                             ("Harry Potter/Draco Malfoy", 3000)])
+        self.assertEqual(search_tags("po"), [("Pokémon Go", 500), ("POKEMON Sun", 40)])
+
+    def test_most_used_first(self):
+        matches = search_tags("angst", limit=3)
+        self.assertEqual(matches[0], ("Angst Fluff", 800))
+        self.assertEqual(len(matches), 3)
+        # Common texts are found by going through the most used names first, 
+        # giving the same answer as sorting every match
+        with mock.patch.object(search, 'SORT_MAX_MATCHES', 0):
+            self.assertEqual(search_tags("angst", limit=1), [("Angst Fluff", 800)])
+            self.assertEqual(search_tags("potter", limit=1), [("Harry Potter", 9000)])
+
+    def test_typos(self):
+        self.assertEqual(search_tags("Harry Pottr")[0], ("Harry Potter", 9000))
+        self.assertEqual(search_tags("harry poter/draco")[0], ("Harry Potter/Draco Malfoy", 3000))
+        self.assertEqual(search_tags("Pokemno")[0], ("Pokémon Go", 500))
+        self.assertEqual(search_tags("qqqqzzzz"), [])
+
+    def test_typo_candidates_are_the_most_used(self):
+        # Only the most used names containing each piece are compared, so the popular tag
+        # is found even though a hundred less used names contain the same piece
+        with mock.patch.object(search, 'TYPO_CANDIDATES', 5), \
+                mock.patch.object(search, 'SORT_MAX_MATCHES', 0):
+            self.assertEqual(search_tags("angst flufv")[0], ("Angst Fluff", 800))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from src.processing import parse_tag_query, normalize_query
+
+class ParseTagQueryTest(unittest.TestCase):
+    """
+    Tag queries (processing.parse_tag_query) are split into the OR groups of tags to include
+    and exclude, with OR binding tighter than AND and NOT.
+    """
+
+    def test_single_tag(self):
+        self.assertEqual(parse_tag_query("  Slow Burn "), ([["Slow Burn"]], []))
+
+    def test_or_binds_tighter_than_and(self):
+        include, exclude = parse_tag_query("A/B OR B/A AND Slow Burn OR Fluff AND Angst")
+        self.assertEqual(include, [["A/B", "B/A"], ["Slow Burn", "Fluff"], ["Angst"]])
+        self.assertEqual(exclude, [])
+
+    def test_not(self):
+        include, exclude = parse_tag_query("A/B OR B/A AND Slow Burn NOT Character Death OR Angst")
+        self.assertEqual(include, [["A/B", "B/A"], ["Slow Burn"]])
+        self.assertEqual(exclude, [["Character Death", "Angst"]])
+
+    def test_and_not_is_not(self):
+        self.assertEqual(parse_tag_query("Fluff AND NOT Angst"), parse_tag_query("Fluff NOT Angst"))
+        self.assertEqual(parse_tag_query("Fluff AND  NOT Angst NOT Smut"), 
+                         ([["Fluff"]], [["Angst"], ["Smut"]]))
+
+    def test_lowercase_keywords_are_part_of_names(self):
+        self.assertEqual(parse_tag_query("Romance and Drama or Humor"),
+                         ([["Romance and Drama or Humor"]], []))
+        # Keywords only count standing alone between spaces
+        self.assertEqual(parse_tag_query("ANDROID OR NOTHING"), ([["ANDROID", "NOTHING"]], []))
+
+    def test_quoted_tags(self):
+        self.assertEqual(parse_tag_query('"Romeo AND Juliet" OR Fluff NOT "Pride OR Prejudice"'),
+                         ([["Romeo AND Juliet", "Fluff"]], [["Pride OR Prejudice"]]))
+        self.assertEqual(parse_tag_query('"Dungeons AND Dragons"'), ([["Dungeons AND Dragons"]], []))
+        # Quotes that don't wrap a whole tag, or don't pair up, are part of the name
+        self.assertEqual(parse_tag_query('"Vampire" Harry AND Fluff'),
+                         ([['"Vampire" Harry'], ["Fluff"]], []))
+        self.assertEqual(parse_tag_query('5\'11" Tall AND Fluff'), ([["5'11\" Tall"], ["Fluff"]], []))
+
+    def test_apostrophes(self):
+        self.assertEqual(parse_tag_query("Harry's Cat OR Hermione's Cat NOT Crookshanks' Owner"),
+                         ([["Harry's Cat", "Hermione's Cat"]], [["Crookshanks' Owner"]]))
+
+    def test_malformed_queries(self):
+        for query in ["AND Fluff", "Fluff OR", "NOT Angst", "Fluff AND AND Angst", 
+                      "Fluff OR NOT Angst", "Fluff AND", '"" OR Fluff', "OR"]:
+            with self.subTest(query=query):
+                with self.assertRaises(ValueError):
+                    parse_tag_query(query)
+
+    def test_normalized_queries_match(self):
+        self.assertEqual(normalize_query("b/a  OR A/B AND slow burn NOT Angst"),
+                         normalize_query("Slow Burn AND A/B OR B/A AND NOT angst"))
+
+if __name__ == '__main__':
+    unittest.main()
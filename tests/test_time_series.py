@@ -0,0 +1,50 @@
+import shutil
+import unittest
+import numpy as np
+import pandas as pd
+from tests import make_database
+from src.processing import time_series
+
+# Works of one tag, two of them with creation dates that can't be read
+DATES = ["2019-01-07", "2019-01-09", "2019-03-15", "2020-06-01", "2020-13-45", "not a date",
+         "2021-02-26"]
+GOOD_DATES = [date for date in DATES if date not in ("2020-13-45", "not a date")]
+
+class TimeSeriesTest(unittest.TestCase):
+    """
+    Works whose creation date can't be read are left out of the time series
+    (processing.time_series), counted in SQL or from the columnar store.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        make_database([(1, "Fluff", len(DATES))],
+                      [(date, 'en', 0, 1, 1000, [1]) for date in DATES])
+
+    def check_series(self, filters: dict = None):
+        for granularity, start in [('year', '2019-01-01'), ('month', '2019-01-01'),
+                                   ('week', '2019-01-07')]:
+            with self.subTest(granularity=granularity):
+                series = time_series("Fluff", granularity, filters)
+                self.assertEqual(series['num_works'].sum(), len(GOOD_DATES))
+                self.assertEqual(series['period'].iloc[0], pd.Timestamp(start))
+                self.assertLessEqual(series['period'].iloc[-1], pd.Timestamp('2021-02-26'))
+        weeks = time_series("Fluff", 'week', filters)
+        # The two works of the first week are counted together
+        self.assertEqual(weeks['num_works'].iloc[0], 2)
+        return weeks
+
+    def test_unreadable_dates(self):
+        weeks = self.check_series()
+        # The columnar store gives the same series
+        from src.columnar import build_columnar_store, COLUMNS_DIR
+        build_columnar_store()
+        try:
+            # Filtering on the works' language (which every work has) skips the cached series
+            np.testing.assert_array_equal(self.check_series({'languages': ['en']})['num_works'],
+                                          weeks['num_works'])
+        finally:
+            shutil.rmtree(COLUMNS_DIR, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
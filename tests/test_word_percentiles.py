@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+from tests import make_database
+from src.processing import (WORD_BIN_EDGES, WORD_BINS_PER_DECADE, WORD_PERCENTILES, NUM_WORD_BINS,
+                            work_word_bins, word_percentile, word_distribution)
+
+# Ratio between a word count bin's upper and lower edges (about 12%), the most the estimated
+# percentiles may be off by
+BIN_RATIO = 10 ** (1 / WORD_BINS_PER_DECADE) * 1.01
+
+def word_counts(size: int, seed: int = 0) -> np.ndarray:
+    """
+    Draw word counts shaped roughly like AO3's (log-normal, median near 3k words).
+    """
+    rng = np.random.default_rng(seed)
+    return np.minimum(rng.lognormal(8.0, 1.3, size), 3e6).astype(np.int64) + 1
+
+class WordPercentileTest(unittest.TestCase):
+    """
+    Word count percentiles estimated from the log-scale bins (processing.word_percentile)
+    are within a bin of numpy.percentile over the works themselves.
+    """
+
+    def assert_close(self, estimate: float, exact: float):
+        self.assertLessEqual(estimate, exact * BIN_RATIO)
+        self.assertGreaterEqual(estimate, exact / BIN_RATIO)
+
+    def test_against_numpy(self):
+        for size, seed in [(20, 1), (1000, 2), (100000, 3)]:
+            words = word_counts(size, seed)
+            counts = np.bincount(work_word_bins(words), minlength=NUM_WORD_BINS)
+            # inverted_cdf takes the work the running total reaches, as word_percentile does
+            # (instead of interpolating between two works, which may be bins apart)
+            for fraction in [0.1, 0.5, 0.9, 0.99]:
+                with self.subTest(size=size, fraction=fraction):
+                    self.assert_close(word_percentile(counts, fraction),
+                                      np.percentile(words, fraction * 100, method='inverted_cdf'))
+
+    def test_edges(self):
+        counts = np.zeros(NUM_WORD_BINS, dtype=np.int64)
+        self.assertEqual(word_percentile(counts, 0.5), 0.0)
+        # Works without words
+        counts[0] = 3
+        self.assertEqual(word_percentile(counts, 0.5), 0.0)
+        # A single word count is estimated within its bin
+        counts[:] = 0
+        counts[work_word_bins(np.array([5000]))[0]] = 1
+        self.assert_close(word_percentile(counts, 0.5), 5000)
+        # The open-ended last bin gives its lower edge
+        counts[:] = 0
+        counts[-1] = 1
+        self.assertEqual(word_percentile(counts, 0.99), float(WORD_BIN_EDGES[-1]))
+
+    def test_word_distribution(self):
+        # The percentiles served by the dashboard and the API, counted from a small database
+        words = word_counts(500, seed=4)
+        make_database([(1, "Fluff", len(words))],
+                      [("2020-01-01", 'en', 0, 1, int(count), [1]) for count in words])
+        distribution = word_distribution("Fluff")
+        self.assertEqual(distribution['histogram']['num_works'].sum(), len(words))
+        for name, fraction in WORD_PERCENTILES.items():
+            with self.subTest(percentile=name):
+                self.assert_close(distribution[name],
+                                  np.percentile(words, fraction * 100, method='inverted_cdf'))
+
+if __name__ == '__main__':
+    unittest.main()